@@ -0,0 +1,494 @@
+import functools
+import hashlib
+import json
+import os
+import struct
+
+
+NAME_CHARS = ".12345abcdefghijklmnopqrstuvwxyz"
+NAME_VALUES = {c: i for i, c in enumerate(NAME_CHARS)}
+BASE58_CHARS = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+
+
+def string_to_name(s):
+    value = 0
+    for i in range(13):
+        c = NAME_VALUES[s[i]] if i < len(s) else 0
+        if i < 12:
+            value |= (c & 0x1f) << (64 - 5 * (i + 1))
+        else:
+            value |= c & 0x0f
+    return value
+
+
+def name_to_string(value):
+    chars = []
+    for i in range(13):
+        if i == 0:
+            c = value & 0x0f
+            value >>= 4
+        else:
+            c = value & 0x1f
+            value >>= 5
+        chars.append(NAME_CHARS[c])
+    return "".join(reversed(chars)).rstrip(".")
+
+
+def string_to_symbol(precision, code):
+    value = 0
+    for i, c in enumerate(code):
+        value |= ord(c) << (8 * (i + 1))
+    return value | precision
+
+
+def symbol_to_string(value):
+    precision = value & 0xff
+    code = []
+    value >>= 8
+    while value:
+        code.append(chr(value & 0xff))
+        value >>= 8
+    return precision, "".join(code)
+
+
+def parse_asset(s):
+    amount, code = s.split(" ")
+    if "." in amount:
+        whole, fraction = amount.split(".")
+    else:
+        whole, fraction = amount, ""
+    negative = whole.startswith("-")
+    units = int(whole.lstrip("-") + fraction or "0")
+    return -units if negative else units, len(fraction), code
+
+
+def format_asset(amount, precision, code):
+    sign = "-" if amount < 0 else ""
+    digits = str(abs(amount)).rjust(precision + 1, "0")
+    if precision:
+        digits = digits[:-precision] + "." + digits[-precision:]
+    return sign + digits + " " + code
+
+
+def base58_encode(data):
+    value = int.from_bytes(data, "big")
+    chars = []
+    while value:
+        value, rest = divmod(value, 58)
+        chars.append(BASE58_CHARS[rest])
+    pad = len(data) - len(data.lstrip(b"\0"))
+    return "1" * pad + "".join(reversed(chars))
+
+
+def base58_decode(s):
+    value = 0
+    for c in s:
+        value = value * 58 + BASE58_CHARS.index(c)
+    pad = len(s) - len(s.lstrip("1"))
+    data = value.to_bytes((value.bit_length() + 7) // 8, "big")
+    return b"\0" * pad + data
+
+
+def ripemd160(data):
+    return hashlib.new("ripemd160", data).digest()
+
+
+def public_key_to_string(data):
+    key = data[1:]
+    return "EOS" + base58_encode(key + ripemd160(key)[:4])
+
+
+def string_to_public_key(s):
+    if s.startswith("PUB_K1_"):
+        raw = base58_decode(s[7:])[:-4]
+    else:
+        raw = base58_decode(s[3:])[:-4]
+    return b"\0" + raw
+
+
+class Reader:
+
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+
+    def read(self, size):
+        data = self.data[self.pos:self.pos + size]
+        if len(data) != size:
+            raise ValueError("Read past end of buffer")
+        self.pos += size
+        return data
+
+    def unpack(self, fmt):
+        size = struct.calcsize(fmt)
+        return struct.unpack(fmt, self.read(size))[0]
+
+    def varuint32(self):
+        value = shift = 0
+        while True:
+            b = self.read(1)[0]
+            value |= (b & 0x7f) << shift
+            shift += 7
+            if not b & 0x80:
+                return value
+
+
+def varuint32_bytes(value):
+    out = bytearray()
+    while True:
+        b = value & 0x7f
+        value >>= 7
+        if value:
+            out.append(b | 0x80)
+        else:
+            out.append(b)
+            return bytes(out)
+
+
+class Writer:
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, data):
+        self.parts.append(data)
+
+    def pack(self, fmt, value):
+        self.parts.append(struct.pack(fmt, value))
+
+    def varuint32(self, value):
+        self.write(varuint32_bytes(value))
+
+    def getvalue(self):
+        return b"".join(self.parts)
+
+
+def _read_asset(r):
+    amount = r.unpack("<q")
+    precision, code = symbol_to_string(r.unpack("<Q"))
+    return format_asset(amount, precision, code)
+
+
+def _write_asset(w, value):
+    amount, precision, code = parse_asset(value)
+    w.pack("<q", amount)
+    w.pack("<Q", string_to_symbol(precision, code))
+
+
+def _read_symbol(r):
+    precision, code = symbol_to_string(r.unpack("<Q"))
+    return "{},{}".format(precision, code)
+
+
+def _write_symbol(w, value):
+    precision, code = value.split(",")
+    w.pack("<Q", string_to_symbol(int(precision), code))
+
+
+def _read_bytes(r):
+    return r.read(r.varuint32()).hex()
+
+
+def _write_bytes(w, value):
+    data = bytes.fromhex(value) if isinstance(value, str) else bytes(value)
+    w.varuint32(len(data))
+    w.write(data)
+
+
+def _read_string(r):
+    return r.read(r.varuint32()).decode("utf8")
+
+
+def _write_string(w, value):
+    data = value.encode("utf8")
+    w.varuint32(len(data))
+    w.write(data)
+
+
+def _fixed(fmt):
+    return (lambda r: r.unpack(fmt)), (lambda w, value: w.pack(fmt, int(value)))
+
+
+BUILTIN = {
+    "bool": ((lambda r: bool(r.read(1)[0])), (lambda w, value: w.pack("<B", 1 if value else 0))),
+    "int8": _fixed("<b"),
+    "uint8": _fixed("<B"),
+    "int16": _fixed("<h"),
+    "uint16": _fixed("<H"),
+    "int32": _fixed("<i"),
+    "uint32": _fixed("<I"),
+    "int64": _fixed("<q"),
+    "uint64": _fixed("<Q"),
+    "float64": ((lambda r: r.unpack("<d")), (lambda w, value: w.pack("<d", float(value)))),
+    "varuint32": ((lambda r: r.varuint32()), (lambda w, value: w.varuint32(int(value)))),
+    "time_point_sec": _fixed("<I"),
+    "name": (
+        (lambda r: name_to_string(r.unpack("<Q"))),
+        (lambda w, value: w.pack("<Q", string_to_name(value)))
+    ),
+    "string": (_read_string, _write_string),
+    "bytes": (_read_bytes, _write_bytes),
+    "symbol": (_read_symbol, _write_symbol),
+    "asset": (_read_asset, _write_asset),
+    "checksum256": ((lambda r: r.read(32).hex()), (lambda w, value: w.write(bytes.fromhex(value)))),
+    "public_key": (
+        (lambda r: public_key_to_string(r.read(34))),
+        (lambda w, value: w.write(string_to_public_key(value)))
+    ),
+    "signature": ((lambda r: r.read(66).hex()), (lambda w, value: w.write(bytes.fromhex(value)))),
+}
+
+
+# the same accounts and quantities are packed for every action, keep their bytes
+@functools.lru_cache(maxsize=4096)
+def name_bytes(s):
+    return struct.pack("<Q", string_to_name(s))
+
+
+@functools.lru_cache(maxsize=1024)
+def asset_bytes(s):
+    amount, precision, code = parse_asset(s)
+    return struct.pack("<qQ", amount, string_to_symbol(precision, code))
+
+
+def _encode_symbol(value):
+    precision, code = value.split(",")
+    return struct.pack("<Q", string_to_symbol(int(precision), code))
+
+
+def _encode_bytes(value):
+    data = bytes.fromhex(value) if isinstance(value, str) else bytes(value)
+    return varuint32_bytes(len(data)) + data
+
+
+def _encode_string(value):
+    data = value.encode("utf8")
+    return varuint32_bytes(len(data)) + data
+
+
+def _encode_fixed(fmt):
+    pack = struct.Struct(fmt).pack
+    return lambda value: pack(int(value))
+
+
+# BUILTIN writers as functions of the value returning its bytes
+ENCODERS = {
+    "bool": lambda value: b"\1" if value else b"\0",
+    "int8": _encode_fixed("<b"),
+    "uint8": _encode_fixed("<B"),
+    "int16": _encode_fixed("<h"),
+    "uint16": _encode_fixed("<H"),
+    "int32": _encode_fixed("<i"),
+    "uint32": _encode_fixed("<I"),
+    "int64": _encode_fixed("<q"),
+    "uint64": _encode_fixed("<Q"),
+    "float64": lambda value: struct.pack("<d", float(value)),
+    "varuint32": lambda value: varuint32_bytes(int(value)),
+    "time_point_sec": _encode_fixed("<I"),
+    "name": lambda value: name_bytes(str(value)),
+    "string": _encode_string,
+    "bytes": _encode_bytes,
+    "symbol": _encode_symbol,
+    "asset": asset_bytes,
+    "checksum256": bytes.fromhex,
+    "public_key": string_to_public_key,
+    "signature": bytes.fromhex,
+}
+
+
+class Abi:
+    """ Binary serializer driven by an ABI definition """
+
+    def __init__(self, definition):
+        if isinstance(definition, str):
+            definition = json.loads(definition)
+        self.definition = definition
+        self.types = {t["new_type_name"]: t["type"] for t in definition.get("types", [])}
+        self.structs = {s["name"]: s for s in definition.get("structs", [])}
+        self.actions = {a["name"]: a["type"] for a in definition.get("actions", [])}
+        self.tables = {t["name"]: t["type"] for t in definition.get("tables", [])}
+        self.encoders = {}
+
+    def resolve(self, type_):
+        while type_ in self.types:
+            type_ = self.types[type_]
+        return type_
+
+    def fields(self, type_):
+        struct_ = self.structs[type_]
+        fields = self.fields(self.resolve(struct_["base"])) if struct_.get("base") else []
+        return fields + struct_["fields"]
+
+    def read(self, r, type_):
+        if type_.endswith("$"):
+            type_ = type_[:-1]
+        if type_.endswith("[]"):
+            return [self.read(r, type_[:-2]) for _ in range(r.varuint32())]
+        if type_.endswith("?"):
+            return self.read(r, type_[:-1]) if r.read(1)[0] else None
+        type_ = self.resolve(type_)
+        if type_ in BUILTIN:
+            return BUILTIN[type_][0](r)
+        return {f["name"]: self.read(r, f["type"]) for f in self.fields(type_)}
+
+    def write(self, w, type_, value):
+        if type_.endswith("$"):
+            type_ = type_[:-1]
+        if type_.endswith("[]"):
+            w.varuint32(len(value))
+            for item in value:
+                self.write(w, type_[:-2], item)
+            return
+        if type_.endswith("?"):
+            w.pack("<B", 0 if value is None else 1)
+            if value is not None:
+                self.write(w, type_[:-1], value)
+            return
+        type_ = self.resolve(type_)
+        if type_ in BUILTIN:
+            return BUILTIN[type_][1](w, value)
+        for f in self.fields(type_):
+            self.write(w, f["type"], value[f["name"]])
+
+    def encoder(self, type_):
+        """ Function of a value returning its bytes, built once per type
+
+        The type is resolved and the struct fields looked up when it is built,
+        so packing walks no definitions.
+        """
+        encoder = self.encoders.get(type_)
+        if encoder is not None:
+            return encoder
+        if type_.endswith("$"):
+            encoder = self.encoder(type_[:-1])
+        elif type_.endswith("[]"):
+            item = self.encoder(type_[:-2])
+            encoder = lambda value: varuint32_bytes(len(value)) + b"".join([item(x) for x in value])
+        elif type_.endswith("?"):
+            item = self.encoder(type_[:-1])
+            encoder = lambda value: b"\0" if value is None else b"\1" + item(value)
+        elif self.resolve(type_) in ENCODERS:
+            encoder = ENCODERS[self.resolve(type_)]
+        else:
+            fields = []
+
+            def encoder(value):
+                return b"".join([encode(value[name]) for name, encode in fields])
+
+            # registered before its fields, a struct may contain itself
+            self.encoders[type_] = encoder
+            fields.extend((f["name"], self.encoder(f["type"])) for f in self.fields(self.resolve(type_)))
+        self.encoders[type_] = encoder
+        return encoder
+
+    def pack(self, type_, value):
+        return self.encoder(type_)(value)
+
+    def unpack(self, type_, data):
+        if isinstance(data, str):
+            data = bytes.fromhex(data)
+        return self.read(Reader(data), type_)
+
+    def pack_action(self, action, data):
+        return self.encoder(self.actions[action])(data)
+
+    def unpack_action(self, action, data):
+        return self.unpack(self.actions[action], data)
+
+
+# absolute path to ((mtime, size), Abi) of load()
+_loaded = {}
+
+
+def load(path):
+    """ Abi of a .abi file, read again only when its mtime or size changes """
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    loaded = _loaded.get(path)
+    if loaded is None or loaded[0] != stamp:
+        with open(path) as f:
+            loaded = _loaded[path] = (stamp, Abi(json.load(f)))
+    return loaded[1]
+
+
+def _struct(name, *fields, base=""):
+    return {
+        "name": name,
+        "base": base,
+        "fields": [{"name": n, "type": t} for n, t in fields]
+    }
+
+
+# transactions, the system actions used by cleos and abi_def itself
+CHAIN_ABI = Abi({
+    "types": [
+        {"new_type_name": "account_name", "type": "name"},
+        {"new_type_name": "permission_name", "type": "name"},
+        {"new_type_name": "action_name", "type": "name"},
+        {"new_type_name": "type_name", "type": "string"},
+        {"new_type_name": "field_name", "type": "string"},
+        {"new_type_name": "table_name", "type": "name"},
+    ],
+    "structs": [
+        _struct("permission_level", ("actor", "account_name"), ("permission", "permission_name")),
+        _struct("action", ("account", "account_name"), ("name", "action_name"),
+                ("authorization", "permission_level[]"), ("data", "bytes")),
+        _struct("extension", ("type", "uint16"), ("data", "bytes")),
+        _struct("transaction_header", ("expiration", "time_point_sec"), ("ref_block_num", "uint16"),
+                ("ref_block_prefix", "uint32"), ("max_net_usage_words", "varuint32"),
+                ("max_cpu_usage_ms", "uint8"), ("delay_sec", "varuint32")),
+        _struct("transaction", ("context_free_actions", "action[]"), ("actions", "action[]"),
+                ("transaction_extensions", "extension[]"), base="transaction_header"),
+        _struct("key_weight", ("key", "public_key"), ("weight", "uint16")),
+        _struct("permission_level_weight", ("permission", "permission_level"), ("weight", "uint16")),
+        _struct("wait_weight", ("wait_sec", "uint32"), ("weight", "uint16")),
+        _struct("authority", ("threshold", "uint32"), ("keys", "key_weight[]"),
+                ("accounts", "permission_level_weight[]"), ("waits", "wait_weight[]")),
+        _struct("newaccount", ("creator", "account_name"), ("name", "account_name"),
+                ("owner", "authority"), ("active", "authority")),
+        _struct("updateauth", ("account", "account_name"), ("permission", "permission_name"),
+                ("parent", "permission_name"), ("auth", "authority")),
+        _struct("setcode", ("account", "account_name"), ("vmtype", "uint8"), ("vmversion", "uint8"),
+                ("code", "bytes")),
+        _struct("setabi", ("account", "account_name"), ("abi", "bytes")),
+        _struct("type_def", ("new_type_name", "type_name"), ("type", "type_name")),
+        _struct("field_def", ("name", "field_name"), ("type", "type_name")),
+        _struct("struct_def", ("name", "type_name"), ("base", "type_name"), ("fields", "field_def[]")),
+        _struct("action_def", ("name", "action_name"), ("type", "type_name"), ("ricardian_contract", "string")),
+        _struct("table_def", ("name", "table_name"), ("index_type", "type_name"),
+                ("key_names", "field_name[]"), ("key_types", "type_name[]"), ("type", "type_name")),
+        _struct("clause_pair", ("id", "string"), ("body", "string")),
+        _struct("error_message", ("error_code", "uint64"), ("error_msg", "string")),
+        _struct("abi_def", ("version", "string"), ("types", "type_def[]"), ("structs", "struct_def[]"),
+                ("actions", "action_def[]"), ("tables", "table_def[]"),
+                ("ricardian_clauses", "clause_pair[]"), ("error_messages", "error_message[]"),
+                ("abi_extensions", "extension[]")),
+    ],
+    "actions": [
+        {"name": "newaccount", "type": "newaccount"},
+        {"name": "updateauth", "type": "updateauth"},
+        {"name": "setcode", "type": "setcode"},
+        {"name": "setabi", "type": "setabi"},
+    ]
+})
+
+
+def unpack_abi(data):
+    # abi_extensions and later fields are optional in older serializations
+    r = Reader(bytes.fromhex(data) if isinstance(data, str) else data)
+    definition = {}
+    for field in CHAIN_ABI.fields("abi_def"):
+        if r.pos == len(r.data):
+            break
+        definition[field["name"]] = CHAIN_ABI.read(r, field["type"])
+    return definition
+
+
+def pack_abi(definition):
+    definition = dict(definition)
+    for field in CHAIN_ABI.fields("abi_def"):
+        definition.setdefault(field["name"], "" if field["name"] == "version" else [])
+    definition["structs"] = [dict(s, base=s.get("base", "")) for s in definition["structs"]]
+    definition["actions"] = [dict(a, ricardian_contract=a.get("ricardian_contract", "")) for a in definition["actions"]]
+    return CHAIN_ABI.pack("abi_def", definition)
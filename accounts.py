@@ -0,0 +1,89 @@
+import json
+import os
+
+import eosfactory.core.cleos as cleos
+from eosfactory.shell.wallet import get_wallet
+
+import abi
+from batch import Batch
+
+
+KEY_FILE = ".keys.json"
+# accounts beyond the pool share its keys round robin
+KEY_POOL = 100
+NAME_DIGITS = "12345abcdefghijklmnopqrstuvwxyz"
+
+
+def account_names(prefix, count):
+    width = 12 - len(prefix)
+    names = []
+    for x in range(count):
+        digits = []
+        for _ in range(width):
+            x, rest = divmod(x, len(NAME_DIGITS))
+            digits.append(NAME_DIGITS[rest])
+        names.append(prefix + "".join(reversed(digits)))
+    return names
+
+
+def authority(key):
+    return {"threshold": 1, "keys": [{"key": key, "weight": 1}], "accounts": [], "waits": []}
+
+
+def load_keys(count, path=KEY_FILE):
+    """ count [public, private] key pairs cached in path, the missing ones are created with cleos """
+    keys = []
+    if os.path.exists(path):
+        with open(path) as f:
+            keys = json.load(f)
+    if len(keys) < count:
+        for _ in range(count - len(keys)):
+            key = cleos.CreateKey(is_verbose=False)
+            keys.append([key.key_public, key.key_private])
+        with open(path, "w") as f:
+            json.dump(keys, f)
+    return keys[:count]
+
+
+def import_keys(keys):
+    """ Import the [public, private] pairs the unlocked wallets do not hold yet
+
+    One cleos call lists the keys held, so a wallet restored from a snapshot
+    costs no import at all, instead of a failing one per key.
+    """
+    wallet = get_wallet()
+    held = set(wallet.keys().json)
+    for public, private in keys:
+        if public in held:
+            continue
+        cleos.WalletImport(private, wallet.name, is_verbose=False)
+        held.add(public)
+
+
+def create_accounts(creator, names, key_pool=KEY_POOL, **batch_args):
+    """ Create accounts with newaccount actions packed into as few transactions as fit
+
+    Their keys come from the pool cached on disk and are imported to the wallet.
+    """
+    keys = load_keys(min(len(names), key_pool))
+    import_keys(keys)
+    batch_args.setdefault("abis", {"eosio": abi.CHAIN_ABI})
+    batch = Batch(**batch_args)
+    for x, name in enumerate(names):
+        public = keys[x % len(keys)][0]
+        batch.add("eosio", "newaccount", {
+            "creator": str(creator),
+            "name": name,
+            "owner": authority(public),
+            "active": authority(public)
+        }, creator)
+    batch.push()
+    return list(names)
+
+
+def fund(token, issuer, names, quantity, memo="", **batch_args):
+    """ Issue quantity of the token to every account in batched transactions """
+    batch = Batch(**batch_args)
+    for name in names:
+        batch.add(token, "issue", {"to": name, "quantity": quantity, "memo": memo}, issuer)
+    batch.push()
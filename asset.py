@@ -0,0 +1,140 @@
+import functools
+from decimal import Decimal, ROUND_CEILING
+
+import abi
+
+
+class Symbol:
+    """ Precision and code of a token, one shared instance per pair from symbol() """
+
+    __slots__ = ("precision", "code", "scale", "value", "template")
+
+    def __init__(self, precision, code):
+        self.precision = precision
+        self.code = code
+        self.scale = 10 ** precision
+        self.value = abi.string_to_symbol(precision, code)
+        # formats divmod(amount, scale) of a positive amount
+        self.template = "%d.%0{}d {}".format(precision, code) if precision else "%d%.0s " + code
+
+    def __eq__(self, other):
+        return isinstance(other, Symbol) and self.value == other.value
+
+    def __hash__(self):
+        return hash(self.value)
+
+    def __repr__(self):
+        return "Symbol({}, {!r})".format(self.precision, self.code)
+
+    def __str__(self):
+        return "{},{}".format(self.precision, self.code)
+
+    def format(self, amount):
+        """ Asset string of an amount in minimal units """
+        if amount < 0:
+            return "-" + self.format(-amount)
+        return self.template % divmod(amount, self.scale)
+
+
+@functools.lru_cache(maxsize=None)
+def symbol(code, precision):
+    return Symbol(precision, code)
+
+
+EOS = symbol("EOS", 4)
+
+
+@functools.total_ordering
+class Asset:
+    """ Amount in minimal units of a symbol, exact unlike the float amounts of cleos output """
+
+    __slots__ = ("amount", "symbol")
+
+    def __init__(self, amount, symbol):
+        self.amount = amount
+        self.symbol = symbol
+
+    @classmethod
+    def parse(cls, s):
+        number, code = s.split(" ")
+        whole, _, fraction = number.partition(".")
+        # the sign of whole carries over to the joined digits
+        return cls(int(whole + fraction), symbol(code, len(fraction)))
+
+    @classmethod
+    def from_number(cls, value, symbol, rounding=ROUND_CEILING):
+        """ Asset of a decimal amount, floats are taken by their shortest repr
+
+        The default rounds up sub-unit amounts, as toAsset of the tests always did.
+        """
+        if isinstance(value, float):
+            value = repr(value)
+        units = Decimal(value).scaleb(symbol.precision).to_integral_value(rounding)
+        return cls(int(units), symbol)
+
+    def to_decimal(self):
+        return Decimal(self.amount).scaleb(-self.symbol.precision)
+
+    def _check(self, other):
+        if not isinstance(other, Asset):
+            return NotImplemented
+        if self.symbol != other.symbol:
+            raise ValueError("Symbol mismatch {} and {}".format(self.symbol, other.symbol))
+        return other
+
+    def __add__(self, other):
+        if self._check(other) is NotImplemented:
+            return NotImplemented
+        return Asset(self.amount + other.amount, self.symbol)
+
+    def __sub__(self, other):
+        if self._check(other) is NotImplemented:
+            return NotImplemented
+        return Asset(self.amount - other.amount, self.symbol)
+
+    def __neg__(self):
+        return Asset(-self.amount, self.symbol)
+
+    def __eq__(self, other):
+        if not isinstance(other, Asset):
+            return NotImplemented
+        return self.amount == other.amount and self.symbol == other.symbol
+
+    def __lt__(self, other):
+        if self._check(other) is NotImplemented:
+            return NotImplemented
+        return self.amount < other.amount
+
+    def __hash__(self):
+        return hash((self.amount, self.symbol.value))
+
+    def __int__(self):
+        return self.amount
+
+    def __repr__(self):
+        return "Asset({!r})".format(str(self))
+
+    def __str__(self):
+        return self.symbol.format(self.amount)
+
+
+def parse_many(strings, symbol=None):
+    """ Amounts in minimal units of asset strings, all of the symbol when it is given """
+    amounts = []
+    append = amounts.append
+    for s in strings:
+        number, code = s.split(" ")
+        whole, _, fraction = number.partition(".")
+        if symbol is not None and (code != symbol.code or len(fraction) != symbol.precision):
+            raise ValueError("{} is not of symbol {}".format(s, symbol))
+        append(int(whole + fraction))
+    return amounts
+
+
+def format_many(amounts, symbol):
+    """ Asset strings of amounts in minimal units, as used for millions of transfer quantities """
+    if any(amount < 0 for amount in amounts):
+        return [symbol.format(amount) for amount in amounts]
+    template = symbol.template
+    scale = symbol.scale
+    return [template % divmod(amount, scale) for amount in amounts]
@@ -0,0 +1,110 @@
+import json
+import os
+import tempfile
+
+import eosfactory.core.cleos as cleos
+import eosfactory.core.errors as errors
+
+
+# nodeos defaults of max_transaction_cpu_usage and max_transaction_net_usage
+MAX_CPU_US = 150000
+MAX_NET_BYTES = 524288
+
+LIMIT_ERRORS = [
+    "tx_cpu_usage_exceeded",
+    "tx_net_usage_exceeded",
+    "deadline_exception",
+    "leeway_deadline_exception",
+    "Transaction exceeded the current CPU usage limit",
+    "Transaction net usage is too high",
+    "Transaction took too long",
+    "Argument list too long"
+]
+
+
+def action(account, name, data, actor, permission="active"):
+    return {
+        "account": str(account),
+        "name": name,
+        "authorization": [{"actor": str(actor), "permission": permission}],
+        "data": data
+    }
+
+
+class PushTransaction(cleos.Cleos):
+    """ Push a transaction with many actions, see cleos.PushAction """
+
+    def __init__(self, actions, force_unique=0, is_verbose=True):
+        # the transaction goes through a file, it easily exceeds the argument size limit
+        with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+            json.dump({"actions": actions}, f)
+        try:
+            args = [f.name]
+            if force_unique:
+                args.append("--force-unique")
+            cleos.Cleos.__init__(self, args, "push", "transaction", is_verbose)
+        finally:
+            os.remove(f.name)
+
+        self.printself()
+
+
+class Batch:
+    """ Pack actions into as few transactions as the node accepts
+
+    The number of actions per transaction adapts to the CPU and NET usage
+    billed for the previous one, and is halved if the node rejects a
+    transaction for exceeding its limits.
+
+    Data of actions of the accounts in abis, a dict of account to abi.Abi,
+    is packed when added, so cleos neither fetches their ABIs nor packs it.
+    """
+
+    def __init__(self, size=100, max_actions=1000, headroom=0.5,
+                 max_cpu_us=MAX_CPU_US, max_net_bytes=MAX_NET_BYTES, force_unique=1, abis=None):
+        self.size = size
+        self.max_actions = max_actions
+        self.headroom = headroom
+        self.max_cpu_us = max_cpu_us
+        self.max_net_bytes = max_net_bytes
+        self.force_unique = force_unique
+        self.abis = {str(account): definition for account, definition in (abis or {}).items()}
+        self.actions = []
+
+    def __len__(self):
+        return len(self.actions)
+
+    def add(self, account, name, data, actor, permission="active"):
+        definition = self.abis.get(str(account))
+        if definition is not None and not isinstance(data, str):
+            data = definition.pack_action(name, data).hex()
+        self.actions.append(action(account, name, data, actor, permission))
+
+    def push(self):
+        results = []
+        pending, self.actions = self.actions, []
+        while pending:
+            size = min(len(pending), self.size)
+            try:
+                result = PushTransaction(pending[:size], self.force_unique, is_verbose=False)
+            except errors.Error as e:
+                if size > 1 and any(error in str(e) for error in LIMIT_ERRORS):
+                    self.size = size // 2
+                    continue
+                raise
+            pending = pending[size:]
+            self.adjust(result.json["processed"]["receipt"], size)
+            results.append(result)
+        return results
+
+    def adjust(self, receipt, size):
+        cpu = max(receipt["cpu_usage_us"] / size, 1)
+        net = max(receipt["net_usage_words"] * 8 / size, 1)
+        fits = min(self.max_cpu_us * self.headroom / cpu, self.max_net_bytes * self.headroom / net)
+        self.size = max(1, min(self.max_actions, int(fits)))
+
+
+def push_actions(actions, **kwargs):
+    batch = Batch(**kwargs)
+    batch.actions = list(actions)
+    return batch.push()
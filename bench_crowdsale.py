@@ -0,0 +1,229 @@
+import argparse
+import asyncio
+import json
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from eosfactory.eosf import *
+import eosfactory.core.config as eosf_config
+from termcolor import cprint
+
+import abi
+from accounts import account_names, fund
+from batch import Batch, PushTransaction, action
+from instrument import ram_usage, summary
+import pipeline
+import scenario
+from unittest_crowdsale import CrowdsaleTests
+
+
+class Bench(CrowdsaleTests):
+    """ Deployed crowdsale from the CrowdsaleTests fixture, driven by concurrent deposits """
+
+    def runTest(self):
+        pass
+
+    def prepare(self, buyers, eos_per_buyer):
+        self.crowdsale_contract.push_action(
+            "init",
+            json.dumps({
+                "start": self.start_date,
+                "finish": self.finish_date
+            }),
+            self.crowdsale_deployer_acc
+        )
+        self.crowdsale_contract.push_action(
+            "settime",
+            json.dumps({
+                "time": self.start_date
+            }),
+            self.crowdsale_deployer_acc
+        )
+
+        # deposits and batches carry packed data, cleos does not convert it on every push
+        self.abis = {
+            str(self.system_token_deployer_acc): abi.load("eosiotoken/eosio.token/eosio.token.abi"),
+            str(self.crowdsale_deployer_acc): abi.load("crowdsale/crowdsale.debug.abi")
+        }
+
+        names = account_names("bench", buyers)
+        self.create_buyers_accounts(self.eosio_acc, buyers, names)
+        fund(self.system_token_deployer_acc, self.system_token_deployer_acc, names, self.toAsset(eos_per_buyer, 4, "EOS"),
+             abis=self.abis)
+
+        if self.whitelist:
+            whites = Batch(abis=self.abis)
+            for x in range(0, len(names), 100):
+                whites.add(self.crowdsale_deployer_acc, "whitemany", {"accounts": names[x:x + 100]}, self.issuer_acc)
+            whites.push()
+        return names
+
+    def deposit(self, buyer, eos):
+        token = str(self.system_token_deployer_acc)
+        data = self.abis[token].pack_action("transfer", {
+            "from": buyer,
+            "to": str(self.crowdsale_deployer_acc),
+            "quantity": self.toAsset(eos, 4, "EOS"),
+            "memo": ""
+        })
+        began = time.time()
+        try:
+            result = PushTransaction([action(token, "transfer", data.hex(), buyer)], force_unique=1, is_verbose=False)
+        except errors.Error as e:
+            match = re.search("assertion failure with message: (.*)", str(e))
+            return time.time() - began, None, match.group(1).strip() if match else str(e).strip()
+        return time.time() - began, result.json["processed"]["receipt"], None
+
+    def run_load(self, names, deposits, rate, concurrency, eos):
+        results = []
+        lock = threading.Lock()
+
+        def deposit(buyer):
+            result = self.deposit(buyer, eos)
+            with lock:
+                results.append(result)
+
+        ram_before = ram_usage(self.crowdsale_deployer_acc)
+        began = time.time()
+        with ThreadPoolExecutor(concurrency) as pool:
+            for x in range(deposits):
+                if rate:
+                    delay = began + x / rate - time.time()
+                    if delay > 0:
+                        time.sleep(delay)
+                pool.submit(deposit, names[x % len(names)])
+        elapsed = time.time() - began
+        ram_after = ram_usage(self.crowdsale_deployer_acc)
+        return self.load_report(results, deposits, elapsed, ram_after - ram_before)
+
+    def load_report(self, results, deposits, elapsed, ram_delta):
+        """ Summary of (latency, receipt or None, rejection message or None) per deposit """
+        accepted = [r for r in results if r[1] is not None]
+        rejected = {}
+        for r in results:
+            if r[2] is not None:
+                rejected[r[2]] = rejected.get(r[2], 0) + 1
+        return {
+            "deposits": deposits,
+            "accepted": len(accepted),
+            "rejected": rejected,
+            "elapsed_s": elapsed,
+            "accepted_tps": len(accepted) / elapsed if elapsed else 0,
+            "latency_ms": summary([r[0] * 1000 for r in accepted]),
+            "cpu_us": summary([r[1]["cpu_usage_us"] for r in accepted]),
+            "net_bytes": summary([r[1]["net_usage_words"] * 8 for r in accepted]),
+            "ram_delta_bytes": ram_delta,
+            "ram_per_deposit_bytes": ram_delta / len(accepted) if accepted else 0
+        }
+
+    def run_pipeline(self, names, deposits, window, eos):
+        """ run_load with the deposits signed and pushed by one asyncio pipeline """
+        results = []
+
+        async def deposit(pipe, buyer):
+            began = time.time()
+            try:
+                result = await pipe.push([action(self.system_token_deployer_acc, "transfer", {
+                    "from": buyer,
+                    "to": str(self.crowdsale_deployer_acc),
+                    "quantity": self.toAsset(eos, 4, "EOS"),
+                    "memo": ""
+                }, buyer)])
+            except pipeline.Error as e:
+                results.append((time.time() - began, None, str(e)))
+                return
+            results.append((time.time() - began, result["processed"]["receipt"], None))
+
+        async def run():
+            node = pipeline.Client(eosf_config.http_server_address(), min(window, 32))
+            wallet = pipeline.Client(eosf_config.http_wallet_address(), min(window, 32))
+            pipe = pipeline.Pipeline(node, pipeline.WalletSigner(wallet), window)
+            try:
+                await asyncio.gather(*(deposit(pipe, names[x % len(names)]) for x in range(deposits)))
+            finally:
+                node.close()
+                wallet.close()
+
+        ram_before = ram_usage(self.crowdsale_deployer_acc)
+        began = time.time()
+        asyncio.run(run())
+        elapsed = time.time() - began
+        ram_after = ram_usage(self.crowdsale_deployer_acc)
+        return self.load_report(results, deposits, elapsed, ram_after - ram_before)
+
+
+def compare_load(before, after):
+    print("{:<24} {:>12} {:>12} {:>8}".format("", "now", "was", "diff"))
+    for name, key in (("accepted_tps", None), ("latency_ms p50", "p50"), ("latency_ms p99", "p99"),
+                      ("cpu_us mean", "mean"), ("cpu_us p99", "p99"), ("ram_per_deposit_bytes", None)):
+        field = name.split(" ")[0]
+        a = after[field][key] if key else after[field]
+        b = before[field][key] if key else before[field]
+        print("{:<24} {:>12.1f} {:>12.1f} {:>8}".format(name, a, b, "{:+.1f}%".format((a - b) * 100 / b) if b else "-"))
+
+
+def compare(before, after):
+    """ Mean CPU and RAM per action of two Recorder reports """
+    print("{:<12} {:>10} {:>10} {:>8} {:>10} {:>10} {:>8}".format(
+        "action", "cpu_us", "was", "diff", "ram_bytes", "was", "diff"))
+    for action in sorted(set(before) | set(after)):
+        new = after.get(action, {})
+        old = before.get(action, {})
+        row = [action]
+        for key in ("cpu_us", "ram_bytes"):
+            a = new[key]["mean"] if key in new else 0
+            b = old[key]["mean"] if key in old else 0
+            row += [a, b, "{:+.1f}%".format((a - b) * 100 / abs(b)) if b else "-"]
+        print("{:<12} {:>10.1f} {:>10.1f} {:>8} {:>10.1f} {:>10.1f} {:>8}".format(*row))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-k", "--buyers", type=int, default=100, help="number of buyer accounts")
+    parser.add_argument("-n", "--deposits", type=int, default=1000, help="number of deposits")
+    parser.add_argument("-r", "--rate", type=float, default=0, help="target deposits per second, 0 is unlimited")
+    parser.add_argument("-c", "--concurrency", type=int, default=16, help="deposits in flight")
+    parser.add_argument("--eos", type=float, help="EOS per deposit, minimal contribution by default")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="push deposits from one asyncio pipeline with --concurrency in flight, --rate is ignored")
+    parser.add_argument("--actions", action="store_true",
+                        help="measure costs of every contract action instead of deposit load")
+    parser.add_argument("--compare", help="report of a run with the same mode to compare with")
+    parser.add_argument("--output", help="write the report as json")
+    args = parser.parse_args()
+
+    verbosity([])
+    if args.actions:
+        # the scenario make gate measures, with its own deployments
+        cprint("measuring actions with {} buyers and {} deposits".format(args.buyers, args.deposits), "green")
+        report = scenario.measure(args.buyers, args.deposits)
+    else:
+        Bench.setUpClass()
+        bench = Bench()
+        bench.setUp()
+        try:
+            eos = args.eos or max(bench.min_contrib_eos, 0.0001)
+            per_buyer = eos * (args.deposits // args.buyers + 1)
+            cprint("preparing {} buyers".format(args.buyers), "green")
+            names = bench.prepare(args.buyers, per_buyer)
+            cprint("sending {} deposits of {} EOS".format(args.deposits, eos), "green")
+            if args.pipeline:
+                report = bench.run_pipeline(names, args.deposits, args.concurrency, eos)
+            else:
+                report = bench.run_load(names, args.deposits, args.rate, args.concurrency, eos)
+        finally:
+            bench.tearDown()
+
+    print(json.dumps(report, indent=4))
+    if args.compare:
+        with open(args.compare) as f:
+            (compare if args.actions else compare_load)(json.load(f), report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import argparse
+import glob
+import hashlib
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+
+# shared by the configuration directories of matrix.py
+CACHE_DIR = os.environ.get("BUILD_CACHE_DIR", ".build-cache")
+
+# sources each build output depends on, and the directory it is written to
+TARGETS = {
+    "crowdsale": {
+        "sources": ["crowdsale.cpp", "*.hpp", "*.h", "*.abi"],
+        "output": "crowdsale",
+        "artifacts": ["*.wasm", "*.wast", "*.abi"]
+    },
+    "eosiotoken": {
+        "sources": ["eosiotoken/eosio.token/*.cpp", "eosiotoken/eosio.token/*.hpp", "eosiotoken/eosio.token/*.abi"],
+        "output": "eosiotoken/eosio.token",
+        "artifacts": ["*.wasm", "*.wast"]
+    }
+}
+
+
+def files_hash(files, extra=()):
+    h = hashlib.sha256()
+    for path in files:
+        h.update(path.encode())
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                h.update(f.read())
+    for item in extra:
+        h.update(str(item).encode())
+    return h.hexdigest()
+
+
+def compiler_version():
+    try:
+        return subprocess.run(["eosiocpp", "--version"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                              universal_newlines=True).stdout.strip()
+    except OSError:
+        return ""
+
+
+def key(target):
+    """ Hash of the sources of the target and the eosiocpp version """
+    files = sorted(set(path for pattern in TARGETS[target]["sources"] for path in glob.glob(pattern)))
+    return files_hash(files, (target, compiler_version()))[:16]
+
+
+def save(target):
+    """ Copy the build outputs of the target to the cache under the key of its sources
+
+    The outputs are copied to a temporary directory renamed to the key, so
+    restore never sees a partial entry of a save that failed or is running.
+    """
+    output = TARGETS[target]["output"]
+    root = os.path.join(CACHE_DIR, target)
+    path = os.path.join(root, key(target))
+    os.makedirs(root, exist_ok=True)
+    temp = tempfile.mkdtemp(prefix=".", dir=root)
+    try:
+        # mkdtemp makes it private, the cache is shared
+        os.chmod(temp, 0o755)
+        for pattern in TARGETS[target]["artifacts"]:
+            for file in glob.glob(os.path.join(output, pattern)):
+                shutil.copy2(file, temp)
+        os.replace(temp, path)
+    except OSError:
+        shutil.rmtree(temp, ignore_errors=True)
+        # another configuration of matrix.py saved the same key first
+        if not os.path.isdir(path):
+            raise
+    return path
+
+
+def restore(target):
+    """ Replace the outputs of the target with the cached ones, False if they have to be built """
+    path = os.path.join(CACHE_DIR, target, key(target))
+    if not os.path.isdir(path):
+        return False
+    output = TARGETS[target]["output"]
+    os.makedirs(output, exist_ok=True)
+    for pattern in TARGETS[target]["artifacts"]:
+        for file in glob.glob(os.path.join(output, pattern)):
+            os.remove(file)
+    for file in os.listdir(path):
+        shutil.copy2(os.path.join(path, file), output)
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reuse contract build outputs of unchanged sources")
+    parser.add_argument("command", choices=["key", "save", "restore"])
+    parser.add_argument("target", choices=sorted(TARGETS))
+    args = parser.parse_args()
+
+    if args.command == "key":
+        print(key(args.target))
+    elif args.command == "save":
+        print(save(args.target))
+    elif not restore(args.target):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
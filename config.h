@@ -2,6 +2,9 @@
 #define SYMBOL WISH
 #define DECIMALS 2
 #define WHITELIST true
+#define WHITELIST_MERKLE false
+#define INVESTOR_TABLE false
+#define LAZY_ISSUE false
 #define TRANSFERABLE false
 #define RATE 150
 #define RATE_DENOM 100
@@ -9,6 +12,7 @@
 #define MAX_CONTRIB 10000000000
 #define SOFT_CAP_TKN 1000000000
 #define HARD_CAP_TKN 10000000000
+#define PREMINT_TKN 100000
 #define CONTRACT tkn.deployer
 
 #define MINTCNT 5
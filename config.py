@@ -0,0 +1,226 @@
+import argparse
+import collections
+import os
+import re
+
+from rate import rate_fraction, eos2tkn, min_tokens
+
+
+# largest amount of an eosio asset
+ASSET_MAX = (1 << 62) - 1
+
+# absolute path to ((mtime, size), Config) of load()
+_cache = {}
+
+
+def read(path="config.h"):
+    cfg = {}
+    with open(path, 'r') as cfg_file:
+        for line in cfg_file.readlines():
+            match = re.search(r'#define (\w+) ([\w.]+)', line)
+            if match:
+                cfg[match.group(1)] = match.group(2)
+    return cfg
+
+
+def write(cfg, path="config.h"):
+    with open(path, 'w') as cfg_file:
+        cfg_file.write(emit(cfg))
+
+
+def emit(cfg):
+    """ Text of config.h with the defines of cfg in order """
+    lines = []
+    for name, value in cfg.items():
+        if name in ("MINTCNT", "DEBUG"):
+            lines.append("")
+        lines.append("#define {} {}".format(name, value))
+    return "\n".join(lines) + "\n"
+
+
+class Config(collections.namedtuple("Config", [
+    "issuer", "symbol", "decimals", "contract",
+    "whitelist", "whitelist_merkle", "investor_table", "lazy_issue", "transferable",
+    "rate", "rate_denom", "min_contrib", "max_contrib", "soft_cap", "hard_cap",
+    "premint", "mint", "debug",
+    # derived as in rate.h
+    "rate_num_reduced", "rate_denom_reduced", "min_tokens", "soft_cap_eos", "hard_cap_eos", "max_supply"
+])):
+    """ Typed config.h, amounts in minimal units of EOS and of the token
+
+    soft_cap_eos is what the soft cap is worth rounded down, hard_cap_eos
+    the fewest eoses buying the whole hard cap. premint is the most the premint
+    action may issue, max_supply the token supply the sale, premint and mint
+    take together.
+    """
+
+    @classmethod
+    def from_defines(cls, cfg):
+        decimals = int(cfg["DECIMALS"])
+        rate = int(cfg["RATE"])
+        rate_denom = int(cfg["RATE_DENOM"])
+        soft_cap = int(cfg["SOFT_CAP_TKN"])
+        hard_cap = int(cfg["HARD_CAP_TKN"])
+        premint = int(cfg.get("PREMINT_TKN", 0))
+        mint = tuple((cfg["MINTDEST" + str(i)], int(cfg["MINTVAL" + str(i)])) for i in range(int(cfg["MINTCNT"])))
+        if rate <= 0 or rate_denom <= 0:
+            raise ValueError("Rate must be positive")
+        num, denom = rate_fraction(decimals, rate, rate_denom)
+        return cls(
+            issuer=cfg["ISSUER"],
+            symbol=cfg["SYMBOL"],
+            decimals=decimals,
+            contract=cfg["CONTRACT"],
+            whitelist=cfg["WHITELIST"] == "true",
+            whitelist_merkle=cfg.get("WHITELIST_MERKLE") == "true",
+            investor_table=cfg.get("INVESTOR_TABLE") == "true",
+            lazy_issue=cfg.get("LAZY_ISSUE") == "true",
+            transferable=cfg["TRANSFERABLE"] == "true",
+            rate=rate,
+            rate_denom=rate_denom,
+            min_contrib=int(cfg["MIN_CONTRIB"]),
+            max_contrib=int(cfg["MAX_CONTRIB"]),
+            soft_cap=soft_cap,
+            hard_cap=hard_cap,
+            premint=premint,
+            mint=mint,
+            debug="DEBUG" in cfg,
+            rate_num_reduced=num,
+            rate_denom_reduced=denom,
+            min_tokens=min_tokens(num, denom),
+            soft_cap_eos=soft_cap * denom // num,
+            hard_cap_eos=-(-hard_cap * denom // num),
+            max_supply=hard_cap + premint + sum(value for _, value in mint)
+        ).validate()
+
+    def validate(self):
+        """ Raise ValueError where the contract would overflow or not compile """
+        # static_assert of rate.h
+        if self.rate_num_reduced >= 1 << 64:
+            raise ValueError("Rate numerator too big")
+        if self.rate_denom_reduced >= 1 << 64:
+            raise ValueError("Rate denominator too big")
+        # int64 amounts of the state, assets and EOS2TKN results
+        if self.premint < 0:
+            raise ValueError("Premint reserve must not be negative")
+        if self.max_supply > ASSET_MAX:
+            raise ValueError("Hard cap, premint and mint exceed the maximum token supply")
+        if self.hard_cap_eos > ASSET_MAX:
+            raise ValueError("Hard cap costs more EOS than an asset holds")
+        if eos2tkn(self.hard_cap_eos, self.rate_num_reduced, self.rate_denom_reduced) > ASSET_MAX:
+            raise ValueError("EOS2TKN of the hard cap EOS overflows the token supply")
+        if self.soft_cap > self.hard_cap:
+            raise ValueError("Soft cap exceeds hard cap")
+        if self.max_contrib and self.min_contrib > self.max_contrib:
+            raise ValueError("Minimal contribution exceeds maximal")
+        return self
+
+    def defines(self):
+        """ config.h defines as read() returns them """
+        cfg = collections.OrderedDict([
+            ("ISSUER", self.issuer),
+            ("SYMBOL", self.symbol),
+            ("DECIMALS", str(self.decimals)),
+            ("WHITELIST", "true" if self.whitelist else "false"),
+            ("WHITELIST_MERKLE", "true" if self.whitelist_merkle else "false"),
+            ("INVESTOR_TABLE", "true" if self.investor_table else "false"),
+            ("LAZY_ISSUE", "true" if self.lazy_issue else "false"),
+            ("TRANSFERABLE", "true" if self.transferable else "false"),
+            ("RATE", str(self.rate)),
+            ("RATE_DENOM", str(self.rate_denom)),
+            ("MIN_CONTRIB", str(self.min_contrib)),
+            ("MAX_CONTRIB", str(self.max_contrib)),
+            ("SOFT_CAP_TKN", str(self.soft_cap)),
+            ("HARD_CAP_TKN", str(self.hard_cap)),
+            ("PREMINT_TKN", str(self.premint)),
+            ("CONTRACT", self.contract),
+            ("MINTCNT", str(len(self.mint)))
+        ])
+        for i, (dest, value) in enumerate(self.mint):
+            cfg["MINTDEST" + str(i)] = dest
+            cfg["MINTVAL" + str(i)] = str(value)
+        if self.debug:
+            cfg["DEBUG"] = "1"
+        return dict(cfg)
+
+
+def load(path="config.h"):
+    """ Config of the file, parsed again only when its mtime or size changes """
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    cached = _cache.get(path)
+    if cached is None or cached[0] != stamp:
+        cached = _cache[path] = (stamp, Config.from_defines(read(path)))
+    return cached[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print config.h of the crowdsale, same options as configure.sh")
+    parser.add_argument("--issuer", required=True, help="account name")
+    parser.add_argument("--symbol", required=True, help="uppercase token name")
+    parser.add_argument("--decimals", required=True, type=int, help="decimals count")
+    parser.add_argument("--whitelist", required=True, choices=["true", "false", "merkle"],
+                        help="enable/disable whitelist, merkle to check proofs against a root set by issuer")
+    parser.add_argument("--transferable", required=True, choices=["true", "false"],
+                        help="allow transfer while ICO is going on")
+    parser.add_argument("--rate", required=True, type=int, help="token rate nominator")
+    parser.add_argument("--ratedenom", required=True, type=int, help="token rate denominator")
+    parser.add_argument("--mincontrib", required=True, type=int,
+                        help="minimal contribution in EOS (10000 = 1.0000 EOS)")
+    parser.add_argument("--maxcontrib", required=True, type=int,
+                        help="maximal contribution in EOS (10000 = 1.0000 EOS)")
+    parser.add_argument("--softcap", required=True, type=int,
+                        help="soft cap in tokens (100000000 = 1.00000000 TKN if decimals is 8)")
+    parser.add_argument("--hardcap", required=True, type=int,
+                        help="hard cap in tokens (100000000 = 1.00000000 TKN if decimals is 8)")
+    parser.add_argument("--premint", default=0, type=int,
+                        help="tokens premint may issue from allocations loaded after deployment, in token units")
+    parser.add_argument("--mint", action="append", default=[], help="add mint destination, \"destination value\"")
+    parser.add_argument("--contract", required=True, help="token contract account")
+    parser.add_argument("--investortable", default="false", choices=["true", "false"],
+                        help="keep whitelist and deposit of an investor in one row")
+    parser.add_argument("--lazyissue", default="false", choices=["true", "false"],
+                        help="issue tokens by claim or distribute after the sale instead of on deposit")
+    parser.add_argument("--debug", action="store_true", help="define DEBUG for the settime action")
+    args = parser.parse_args()
+
+    mint = []
+    for item in args.mint:
+        parts = item.split()
+        if len(parts) != 2:
+            parser.error("--mint arguments should be like this: \"destination value\"")
+        mint.append((parts[0], int(parts[1])))
+    defines = {
+        "ISSUER": args.issuer,
+        "SYMBOL": args.symbol,
+        "DECIMALS": args.decimals,
+        "WHITELIST": "false" if args.whitelist == "false" else "true",
+        "WHITELIST_MERKLE": "true" if args.whitelist == "merkle" else "false",
+        "INVESTOR_TABLE": args.investortable,
+        "LAZY_ISSUE": args.lazyissue,
+        "TRANSFERABLE": args.transferable,
+        "RATE": args.rate,
+        "RATE_DENOM": args.ratedenom,
+        "MIN_CONTRIB": args.mincontrib,
+        "MAX_CONTRIB": args.maxcontrib,
+        "SOFT_CAP_TKN": args.softcap,
+        "HARD_CAP_TKN": args.hardcap,
+        "PREMINT_TKN": args.premint,
+        "CONTRACT": args.contract,
+        "MINTCNT": len(mint)
+    }
+    for i, (dest, value) in enumerate(mint):
+        defines["MINTDEST" + str(i)] = dest
+        defines["MINTVAL" + str(i)] = value
+    if args.debug:
+        defines["DEBUG"] = 1
+    try:
+        cfg = Config.from_defines(defines)
+    except ValueError as e:
+        parser.error(str(e))
+    print(emit(cfg.defines()), end="")
+
+
+if __name__ == "__main__":
+    main()
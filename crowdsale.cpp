@@ -1,7 +1,6 @@
 #include "crowdsale.hpp"
 #include "override.hpp"
-
-#define EOS2TKN(EOS) (int64_t)((EOS) * POW10(DECIMALS) * RATE / (1.0 * POW10(4) * RATE_DENOM))
+#include "rate.h"
 
 #ifdef DEBUG
 #define NOW this->state.time
@@ -12,8 +11,14 @@
 crowdsale::crowdsale(account_name self) :
 	eosio::contract(self),
 	state_singleton(this->_self, this->_self),
+	root_singleton(this->_self, this->_self),
+	cursor_singleton(this->_self, this->_self),
+	migrated_singleton(this->_self, this->_self),
+	preminted_singleton(this->_self, this->_self),
 	deposits(this->_self, this->_self),
 	whitelist(this->_self, this->_self),
+	investors(this->_self, this->_self),
+	premints(this->_self, this->_self),
 	asset_eos(
 		eosio::asset(0, eosio::string_to_symbol(4, "EOS")),
 		eosio::string_to_name("eosio.token")
@@ -23,58 +28,185 @@ crowdsale::crowdsale(account_name self) :
 		eosio::string_to_name(STR(CONTRACT))
 	),
 	issuer(eosio::string_to_name(STR(ISSUER))),
-	state(state_singleton.exists() ? state_singleton.get() : default_parameters())
+	state(state_singleton.exists() ? state_singleton.get() : default_parameters()),
+	state_changed(false),
+	migrated(-1)
 {
 }
 
 crowdsale::~crowdsale() {
-	this->state_singleton.set(this->state, this->_self);
+	if (this->state_changed) {
+		this->state_singleton.set(this->state, this->_self);
+	}
+}
+
+static uint8_t from_hex(char c) {
+	if (c >= '0' && c <= '9') return c - '0';
+	if (c >= 'a' && c <= 'f') return c - 'a' + 10;
+	if (c >= 'A' && c <= 'F') return c - 'A' + 10;
+	eosio_assert(false, "Invalid whitelist proof");
+	return 0;
+}
+
+void crowdsale::check_proof(account_name investor, const std::string& memo) {
+	eosio_assert(this->root_singleton.exists(), "Account not whitelisted");
+	eosio_assert(memo.size() % 64 == 0, "Invalid whitelist proof");
+
+	// leaf is sha256 of the account name, siblings are hashed in ascending order
+	checksum256 node;
+	sha256((char*)&investor, sizeof(investor), &node);
+	for (size_t i = 0; i < memo.size(); i += 64) {
+		checksum256 sibling;
+		for (size_t j = 0; j < 32; j++) {
+			sibling.hash[j] = from_hex(memo[i + 2 * j]) << 4 | from_hex(memo[i + 2 * j + 1]);
+		}
+		checksum256 pair[2];
+		bool node_first = memcmp(node.hash, sibling.hash, 32) <= 0;
+		pair[0] = node_first ? node : sibling;
+		pair[1] = node_first ? sibling : node;
+		sha256((char*)pair, sizeof(pair), &node);
+	}
+
+	checksum256 root = this->root_singleton.get().root;
+	eosio_assert(memcmp(node.hash, root.hash, 32) == 0, "Account not whitelisted");
+}
+
+bool crowdsale::migration_done() {
+	if (this->migrated < 0) {
+		this->migrated = this->migrated_singleton.exists();
+	}
+	return this->migrated;
+}
+
+crowdsale::investor_index::const_iterator crowdsale::find_investor(account_name account) {
+	auto it = this->investors.find(account);
+	// once migrate() has emptied the old tables a miss is just a miss
+	if (it == this->investors.end() && !this->migration_done()) {
+		it = this->migrate_investor(account, it);
+	}
+	return it;
+}
+
+crowdsale::investor_index::const_iterator crowdsale::migrate_investor(account_name account, investor_index::const_iterator it) {
+	// rows written before the investor table are moved into it on first touch
+	auto deposit = this->deposits.find(account);
+	auto white = this->whitelist.find(account);
+	if (deposit == this->deposits.end() && white == this->whitelist.end()) {
+		return it;
+	}
+
+	int64_t eoses = 0;
+	int64_t tokens = 0;
+	bool whitelisted = WHITELIST && white != this->whitelist.end();
+	if (deposit != this->deposits.end()) {
+		eoses = deposit->eoses;
+		tokens = deposit->tokens;
+		this->deposits.erase(deposit);
+	}
+	// without WHITELIST the old whitelist rows are dropped, so migrate() gets past them
+	if (white != this->whitelist.end()) {
+		this->whitelist.erase(white);
+	}
+	if (eoses == 0 && tokens == 0 && !whitelisted) {
+		return it;
+	}
+
+	if (it == this->investors.end()) {
+		return this->investors.emplace(this->_self, [account, eoses, tokens, whitelisted](auto& e) {
+			e.account = account;
+			e.eoses = eoses;
+			e.tokens = tokens;
+			e.whitelisted = whitelisted;
+		});
+	}
+	this->investors.modify(it, this->_self, [eoses, tokens, whitelisted](auto& e) {
+		e.eoses += eoses;
+		e.tokens += tokens;
+		e.whitelisted = e.whitelisted || whitelisted;
+	});
+	return it;
 }
 
-void crowdsale::on_deposit(account_name investor, eosio::asset quantity) {
+void crowdsale::on_deposit(account_name investor, eosio::asset quantity, const std::string& memo) {
 	eosio_assert(NOW >= this->state.start, "Crowdsale hasn't started");
 	eosio_assert(NOW <= this->state.finish, "Crowdsale finished");
 
 	eosio_assert(quantity.amount >= MIN_CONTRIB, "Contribution too low");
 	eosio_assert((quantity.amount <= MAX_CONTRIB) || !MAX_CONTRIB, "Contribution too high");
 
-	if (WHITELIST) {
-		auto it = this->whitelist.find(investor);
-		eosio_assert(it != this->whitelist.end(), "Account not whitelisted");
-	}
+#if INVESTOR_TABLE
+	auto it = this->find_investor(investor);
 
+	if (WHITELIST && (it == this->investors.end() || !it->whitelisted)) {
+		eosio_assert(WHITELIST_MERKLE, "Account not whitelisted");
+		this->check_proof(investor, memo);
+	}
+#else
 	auto it = this->deposits.find(investor);
 
-	int64_t tokens_to_give = EOS2TKN(quantity.amount);
+	if (WHITELIST && this->whitelist.find(investor) == this->whitelist.end()) {
+		eosio_assert(WHITELIST_MERKLE, "Account not whitelisted");
+		// there is no row to mark a proven account in, every deposit carries the proof
+		this->check_proof(investor, memo);
+	}
+#endif
+
+	int128_t tokens = EOS2TKN(quantity.amount);
+	eosio_assert(tokens > 0, "Contribution too low");
+	int64_t tokens_left = HARD_CAP_TKN - this->state.total_tokens;
+	if (tokens > tokens_left) {
+		// accept the part fitting under the hard cap and send the rest back
+		eosio_assert(tokens_left >= MIN_TKN, "Hard cap reached");
+		int64_t accepted = (int64_t)TKN2EOS(tokens_left);
+		this->asset_eos.set_amount(quantity.amount - accepted);
+		this->inline_transfer(this->_self, investor, this->asset_eos, "Hard cap reached");
+		quantity.amount = accepted;
+		tokens = EOS2TKN(accepted);
+	}
+	int64_t tokens_to_give = (int64_t)tokens;
 
 	this->state.total_eoses += quantity.amount;
 	this->state.total_tokens += tokens_to_give;
+	this->state_changed = true;
 
-	eosio_assert(this->state.total_tokens <= HARD_CAP_TKN, "Hard cap reached");
+	auto& rows = this->investor_rows();
 
 	int64_t entire_eoses = quantity.amount;
 	int64_t entire_tokens = tokens_to_give;
-	if (it != this->deposits.end()) {
+	if (it != rows.end()) {
 		entire_eoses += it->eoses;
 		entire_tokens += it->tokens;
 	}
 
-	if (it == this->deposits.end()) {
-		this->deposits.emplace(this->_self, [investor, entire_eoses, entire_tokens](auto& deposit) {
+	if (it == rows.end()) {
+		rows.emplace(this->_self, [investor, entire_eoses, entire_tokens](auto& deposit) {
 			deposit.account = investor;
 			deposit.eoses = entire_eoses;
 			deposit.tokens = entire_tokens;
+#if INVESTOR_TABLE
+			deposit.whitelisted = WHITELIST;
+#endif
 		});
 	} else {
-		this->deposits.modify(it, this->_self, [investor, entire_eoses, entire_tokens](auto& deposit) {
+		rows.modify(it, this->_self, [investor, entire_eoses, entire_tokens](auto& deposit) {
 			deposit.account = investor;
 			deposit.eoses = entire_eoses;
 			deposit.tokens = entire_tokens;
+#if INVESTOR_TABLE
+			deposit.whitelisted = deposit.whitelisted || WHITELIST;
+#endif
 		});
 	}
 
-	this->asset_tkn.set_amount(tokens_to_give);
-	this->inline_issue(investor, this->asset_tkn, "Crowdsale");
+	// with LAZY_ISSUE tokens are only recorded and issued by claim or distribute
+	if (!LAZY_ISSUE) {
+		this->asset_tkn.set_amount(tokens_to_give);
+		this->inline_issue(investor, this->asset_tkn, "Crowdsale");
+	}
+}
+
+bool crowdsale::finished() const {
+	return NOW > this->state.finish || this->state.total_tokens + MIN_TKN > HARD_CAP_TKN;
 }
 
 void crowdsale::init(time_t start, time_t finish) {
@@ -84,6 +216,13 @@ void crowdsale::init(time_t start, time_t finish) {
 
 	this->state.start = start;
 	this->state.finish = finish;
+	this->state_changed = true;
+
+	// a new deployment has no rows of the old tables to migrate
+	if (INVESTOR_TABLE && this->deposits.begin() == this->deposits.end()
+			&& this->whitelist.begin() == this->whitelist.end()) {
+		this->migrated_singleton.set(migrated_t{true}, this->_self);
+	}
 
 	struct dest {
 		account_name to;
@@ -102,16 +241,60 @@ void crowdsale::init(time_t start, time_t finish) {
 	}
 }
 
+void crowdsale::addpremint(eosio::vector<premint_t> mints) {
+	require_auth(this->_self);
+	// issued rows are erased, loading the list again after premint would issue them twice
+	eosio_assert(!this->preminted_singleton.exists(), "Premint already started");
+
+	// loading the same account again replaces its amount, so a failed load can be repeated
+	for (const premint_t& mint : mints) {
+		eosio_assert(mint.tokens > 0, "Amount must be positive");
+		auto it = this->premints.find(mint.account);
+		if (it == this->premints.end()) {
+			this->premints.emplace(this->_self, [mint](auto& e) {
+				e.account = mint.account;
+				e.tokens = mint.tokens;
+			});
+		} else {
+			this->premints.modify(it, this->_self, [mint](auto& e) {
+				e.tokens = mint.tokens;
+			});
+		}
+	}
+}
+
+void crowdsale::premint(uint32_t count) {
+	require_auth(this->_self);
+	eosio_assert(count > 0, "Count must be positive");
+	eosio_assert(this->premints.begin() != this->premints.end(), "Nothing to premint");
+
+	// issued rows are erased, the next call continues with the rest
+	preminted_t preminted = this->preminted_singleton.exists() ? this->preminted_singleton.get() : preminted_t{0, 0};
+	auto it = this->premints.begin();
+	for (uint32_t i = 0; i < count && it != this->premints.end(); i++) {
+		// the token supply holds PREMINT_TKN besides the hard cap, more would take from the sale
+		eosio_assert(it->tokens <= PREMINT_TKN - preminted.tokens, "Premint exceeds its reserve");
+		preminted.tokens += it->tokens;
+		this->asset_tkn.set_amount(it->tokens);
+		this->inline_issue(it->account, this->asset_tkn, "Initial token distribution");
+		it = this->premints.erase(it);
+		preminted.issued++;
+	}
+	this->preminted_singleton.set(preminted, this->_self);
+}
+
 void crowdsale::setstart(time_t start) {
 	eosio_assert(NOW <= this->state.start, "Crowdsale already started");
 	require_auth(this->issuer);
 	this->state.start = start;
+	this->state_changed = true;
 }
 
 void crowdsale::setfinish(time_t finish) {
 	eosio_assert(NOW <= this->state.finish, "Crowdsale finished");
 	require_auth(this->issuer);
 	this->state.finish = finish;
+	this->state_changed = true;
 }
 
 void crowdsale::white(account_name account) {
@@ -142,8 +325,14 @@ void crowdsale::unwhitemany(eosio::vector<account_name> accounts) {
 	}
 }
 
+void crowdsale::setroot(checksum256 root) {
+	require_auth(this->issuer);
+	eosio_assert(WHITELIST_MERKLE, "Merkle whitelist not enabled");
+	this->root_singleton.set(root_t{root}, this->_self);
+}
+
 void crowdsale::finalize() {
-	eosio_assert(NOW > this->state.finish || this->state.total_tokens + EOS2TKN(MIN_CONTRIB + !MIN_CONTRIB) >= HARD_CAP_TKN, "Crowdsale hasn't finished");
+	eosio_assert(this->finished(), "Crowdsale hasn't finished");
 	eosio_assert(this->state.total_tokens >= SOFT_CAP_TKN, "Softcap not reached");
 	eosio_assert(!TRANSFERABLE, "There is no reason to call finalize");
 
@@ -167,6 +356,7 @@ void crowdsale::withdraw() {
 	this->inline_transfer(this->_self, this->issuer, this->asset_eos, "Withdraw");
 
 	this->state.total_eoses = 0;
+	this->state_changed = true;
 }
 
 void crowdsale::refund(account_name investor) {
@@ -175,22 +365,139 @@ void crowdsale::refund(account_name investor) {
 
 	require_auth(investor);
 
+#if INVESTOR_TABLE
+	auto it = this->find_investor(investor);
+	eosio_assert(it != this->investors.end() && (it->eoses != 0 || it->tokens != 0), "Nothing to refund");
+#else
 	auto it = this->deposits.find(investor);
 	eosio_assert(it != this->deposits.end(), "Nothing to refund");
+#endif
 
 	this->asset_eos.set_amount(it->eoses);
 	this->inline_transfer(this->_self, investor, this->asset_eos, "Refund");
 
-	this->deposits.modify(it, investor, [](auto& d) {
+	this->investor_rows().modify(it, investor, [](auto& d) {
 		d.eoses = 0;
 	});
 }
 
+void crowdsale::refundmany(uint32_t count) {
+	eosio_assert(NOW > this->state.finish, "Crowdsale hasn't finished");
+	eosio_assert(this->state.total_tokens < SOFT_CAP_TKN, "Softcap reached");
+	eosio_assert(count > 0, "Count must be positive");
+
+	require_auth(this->issuer);
+
+	cursor_t cursor = this->cursor_singleton.exists() ? this->cursor_singleton.get() : cursor_t{0, 0, false};
+	eosio_assert(!cursor.done, "Nothing to refund");
+
+#if INVESTOR_TABLE
+	eosio_assert(this->deposits.begin() == this->deposits.end(), "Migration not finished");
+#endif
+
+	auto& rows = this->investor_rows();
+	auto it = rows.lower_bound(cursor.next);
+	for (uint32_t i = 0; i < count && it != rows.end(); i++, it++) {
+		if (it->eoses > 0) {
+			this->asset_eos.set_amount(it->eoses);
+			this->inline_transfer(this->_self, it->account, this->asset_eos, "Refund");
+			rows.modify(it, this->_self, [](auto& d) {
+				d.eoses = 0;
+			});
+		}
+		cursor.processed++;
+	}
+
+	cursor.done = it == rows.end();
+	cursor.next = cursor.done ? 0 : it->account;
+	this->cursor_singleton.set(cursor, this->_self);
+}
+
+void crowdsale::migrate(uint32_t count) {
+	require_auth(this->_self);
+	eosio_assert(INVESTOR_TABLE, "Investor table not enabled");
+	eosio_assert(
+		this->deposits.begin() != this->deposits.end() || this->whitelist.begin() != this->whitelist.end(),
+		"Nothing to migrate"
+	);
+
+	for (uint32_t i = 0; i < count; i++) {
+		auto deposit = this->deposits.begin();
+		auto white = deposit == this->deposits.end() ? this->whitelist.begin() : this->whitelist.end();
+		if (deposit == this->deposits.end() && white == this->whitelist.end()) {
+			break;
+		}
+		account_name account = deposit != this->deposits.end() ? deposit->account : white->account;
+		this->migrate_investor(account, this->investors.find(account));
+	}
+
+	if (this->deposits.begin() == this->deposits.end() && this->whitelist.begin() == this->whitelist.end()) {
+		this->migrated_singleton.set(migrated_t{true}, this->_self);
+	}
+}
+
+void crowdsale::claim(account_name investor) {
+	eosio_assert(LAZY_ISSUE, "Lazy issue not enabled");
+	eosio_assert(this->finished(), "Crowdsale hasn't finished");
+	eosio_assert(this->state.total_tokens >= SOFT_CAP_TKN, "Softcap not reached");
+
+	require_auth(investor);
+
+#if INVESTOR_TABLE
+	auto it = this->find_investor(investor);
+	eosio_assert(it != this->investors.end() && it->tokens > 0, "Nothing to claim");
+#else
+	auto it = this->deposits.find(investor);
+	eosio_assert(it != this->deposits.end() && it->tokens > 0, "Nothing to claim");
+#endif
+
+	this->asset_tkn.set_amount(it->tokens);
+	this->inline_issue(investor, this->asset_tkn, "Crowdsale");
+
+	this->investor_rows().modify(it, this->_self, [](auto& d) {
+		d.tokens = 0;
+	});
+}
+
+void crowdsale::distribute(uint32_t count) {
+	eosio_assert(LAZY_ISSUE, "Lazy issue not enabled");
+	eosio_assert(this->finished(), "Crowdsale hasn't finished");
+	eosio_assert(this->state.total_tokens >= SOFT_CAP_TKN, "Softcap not reached");
+	eosio_assert(count > 0, "Count must be positive");
+
+	require_auth(this->issuer);
+
+	cursor_t cursor = this->cursor_singleton.exists() ? this->cursor_singleton.get() : cursor_t{0, 0, false};
+	eosio_assert(!cursor.done, "Nothing to claim");
+
+#if INVESTOR_TABLE
+	eosio_assert(this->deposits.begin() == this->deposits.end(), "Migration not finished");
+#endif
+
+	auto& rows = this->investor_rows();
+	auto it = rows.lower_bound(cursor.next);
+	for (uint32_t i = 0; i < count && it != rows.end(); i++, it++) {
+		if (it->tokens > 0) {
+			this->asset_tkn.set_amount(it->tokens);
+			this->inline_issue(it->account, this->asset_tkn, "Crowdsale");
+			rows.modify(it, this->_self, [](auto& d) {
+				d.tokens = 0;
+			});
+		}
+		cursor.processed++;
+	}
+
+	cursor.done = it == rows.end();
+	cursor.next = cursor.done ? 0 : it->account;
+	this->cursor_singleton.set(cursor, this->_self);
+}
+
 #ifdef DEBUG
 void crowdsale::settime(time_t time) {
 	this->state.time = time;
+	this->state_changed = true;
 }
-EOSIO_ABI(crowdsale, (init)(setstart)(setfinish)(white)(unwhite)(whitemany)(unwhitemany)(finalize)(withdraw)(refund)(transfer)(settime));
+EOSIO_ABI(crowdsale, (init)(addpremint)(premint)(setstart)(setfinish)(white)(unwhite)(whitemany)(unwhitemany)(setroot)(finalize)(withdraw)(refund)(refundmany)(migrate)(claim)(distribute)(transfer)(settime));
 #else
-EOSIO_ABI(crowdsale, (init)(setstart)(setfinish)(white)(unwhite)(whitemany)(unwhitemany)(finalize)(withdraw)(refund)(transfer));
+EOSIO_ABI(crowdsale, (init)(addpremint)(premint)(setstart)(setfinish)(white)(unwhite)(whitemany)(unwhitemany)(setroot)(finalize)(withdraw)(refund)(refundmany)(migrate)(claim)(distribute)(transfer));
 #endif
@@ -3,11 +3,30 @@
 #include <eosiolib/eosio.hpp>
 #include <eosiolib/singleton.hpp>
 #include <eosiolib/asset.hpp>
+#include <eosiolib/crypto.h>
+
+#include <cstring>
 
 #include "config.h"
 #include "pow10.h"
 #include "str_expand.h"
 
+#ifndef WHITELIST_MERKLE
+#define WHITELIST_MERKLE false
+#endif
+
+#ifndef INVESTOR_TABLE
+#define INVESTOR_TABLE false
+#endif
+
+#ifndef LAZY_ISSUE
+#define LAZY_ISSUE false
+#endif
+
+#ifndef PREMINT_TKN
+#define PREMINT_TKN 0
+#endif
+
 class crowdsale : public eosio::contract {
 private:
 	struct multiplier_t {
@@ -39,9 +58,59 @@ private:
 		uint64_t primary_key() const { return account; }
 	};
 
+	// @abi table investor
+	struct investor_t {
+		account_name account;
+		int64_t eoses;
+		int64_t tokens;
+		bool whitelisted;
+		uint64_t primary_key() const { return account; }
+	};
+
+	// @abi table premint
+	struct premint_t {
+		account_name account;
+		int64_t tokens;
+		uint64_t primary_key() const { return account; }
+	};
+
+	typedef eosio::multi_index<N(deposit), deposit_t> deposit_index;
+	typedef eosio::multi_index<N(whitelist), whitelist_t> whitelist_index;
+	typedef eosio::multi_index<N(investor), investor_t> investor_index;
+	typedef eosio::multi_index<N(premint), premint_t> premint_index;
+
+	// @abi table root
+	struct root_t {
+		checksum256 root;
+	};
+
+	// @abi table cursor
+	struct cursor_t {
+		account_name next;
+		uint64_t processed;
+		bool done;
+	};
+
+	// @abi table migrated
+	struct migrated_t {
+		bool done;
+	};
+
+	// @abi table preminted
+	struct preminted_t {
+		uint32_t issued;
+		int64_t tokens;
+	};
+
 	eosio::singleton<N(state), state_t> state_singleton;
-	eosio::multi_index<N(deposit), deposit_t> deposits;
-	eosio::multi_index<N(whitelist), whitelist_t> whitelist;
+	eosio::singleton<N(root), root_t> root_singleton;
+	eosio::singleton<N(cursor), cursor_t> cursor_singleton;
+	eosio::singleton<N(migrated), migrated_t> migrated_singleton;
+	eosio::singleton<N(preminted), preminted_t> preminted_singleton;
+	deposit_index deposits;
+	whitelist_index whitelist;
+	investor_index investors;
+	premint_index premints;
 
 	eosio::extended_asset asset_eos;
 	eosio::extended_asset asset_tkn;
@@ -49,8 +118,23 @@ private:
 	account_name issuer;
 
 	state_t state;
-
-	void on_deposit(account_name investor, eosio::asset quantity);
+	bool state_changed;
+	// -1 until migrated_singleton is read, at most once per action
+	int8_t migrated;
+
+	void on_deposit(account_name investor, eosio::asset quantity, const std::string& memo);
+	bool finished() const;
+	void check_proof(account_name investor, const std::string& memo);
+	investor_index::const_iterator find_investor(account_name account);
+	investor_index::const_iterator migrate_investor(account_name account, investor_index::const_iterator it);
+	bool migration_done();
+
+	// with INVESTOR_TABLE deposits and whitelist flags share one row per investor
+#if INVESTOR_TABLE
+	investor_index& investor_rows() { return this->investors; }
+#else
+	deposit_index& investor_rows() { return this->deposits; }
+#endif
 
 	state_t default_parameters() const {
 		return state_t{
@@ -94,17 +178,46 @@ private:
 	}
 
 	void setwhite(account_name account) {
+#if INVESTOR_TABLE
+		auto it = this->find_investor(account);
+		eosio_assert(it == this->investors.end() || !it->whitelisted, "Account already whitelisted");
+		if (it == this->investors.end()) {
+			this->investors.emplace(this->_self, [account](auto& e) {
+				e.account = account;
+				e.eoses = 0;
+				e.tokens = 0;
+				e.whitelisted = true;
+			});
+		} else {
+			this->investors.modify(it, this->_self, [](auto& e) {
+				e.whitelisted = true;
+			});
+		}
+#else
 		auto it = this->whitelist.find(account);
 		eosio_assert(it == this->whitelist.end(), "Account already whitelisted");
 		this->whitelist.emplace(this->_self, [account](auto& e) {
 			e.account = account;
 		});
+#endif
 	}
 
 	void unsetwhite(account_name account) {
+#if INVESTOR_TABLE
+		auto it = this->find_investor(account);
+		eosio_assert(it != this->investors.end() && it->whitelisted, "Account not whitelisted");
+		if (it->eoses == 0 && it->tokens == 0) {
+			this->investors.erase(it);
+		} else {
+			this->investors.modify(it, this->_self, [](auto& e) {
+				e.whitelisted = false;
+			});
+		}
+#else
 		auto it = this->whitelist.find(account);
 		eosio_assert(it != this->whitelist.end(), "Account not whitelisted");
 		whitelist.erase(it);
+#endif
 	}
 
 public:
@@ -112,15 +225,22 @@ public:
 	~crowdsale();
 	void transfer(uint64_t sender, uint64_t receiver);
 	void init(time_t start, time_t finish);
+	void addpremint(eosio::vector<premint_t> mints);
+	void premint(uint32_t count);
 	void setstart(time_t start);
 	void setfinish(time_t finish);
 	void white(account_name account);
 	void unwhite(account_name account);
 	void whitemany(eosio::vector<account_name> accounts);
 	void unwhitemany(eosio::vector<account_name> accounts);
+	void setroot(checksum256 root);
 	void finalize();
 	void withdraw();
 	void refund(account_name investor);
+	void refundmany(uint32_t count);
+	void migrate(uint32_t count);
+	void claim(account_name investor);
+	void distribute(uint32_t count);
 #ifdef DEBUG
 	void settime(time_t time);
 #endif
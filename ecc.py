@@ -0,0 +1,167 @@
+import hashlib
+import hmac
+
+import abi
+
+
+# secp256k1
+P = 2 ** 256 - 2 ** 32 - 977
+N = 0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFEBAAEDCE6AF48A03BBFD25E8CD0364141
+G = (0x79BE667EF9DCBBAC55A06295CE870B07029BFCDB2DCE28D959F2815B16F81798,
+     0x483ADA7726A3C4655DA4FBFC0E1108A8FD17B448A68554199C47D08FFB10D4B8)
+
+
+def _double(point):
+    # jacobian coordinates, a = 0
+    x, y, z = point
+    if not y:
+        return None
+    ysq = y * y % P
+    s = 4 * x * ysq % P
+    m = 3 * x * x % P
+    nx = (m * m - 2 * s) % P
+    return nx, (m * (s - nx) - 8 * ysq * ysq) % P, 2 * y * z % P
+
+
+def _add(point, affine):
+    """ Jacobian point plus affine point """
+    if point is None:
+        return affine[0], affine[1], 1
+    x, y, z = point
+    zz = z * z % P
+    u = affine[0] * zz % P
+    s = affine[1] * zz * z % P
+    if u == x:
+        return _double(point) if s == y else None
+    h = u - x
+    r = s - y
+    hh = h * h % P
+    hhh = h * hh % P
+    nx = (r * r - hhh - 2 * x * hh) % P
+    return nx, (r * (x * hh - nx) - y * hhh) % P, z * h % P
+
+
+def _affine(point):
+    x, y, z = point
+    zinv = pow(z, P - 2, P)
+    zz = zinv * zinv % P
+    return x * zz % P, y * zz * zinv % P
+
+
+def _multiply(k, affine):
+    result = None
+    for bit in bin(k)[2:]:
+        result = _double(result) if result else None
+        if bit == "1":
+            result = _add(result, affine)
+    return _affine(result)
+
+
+def _table(affine):
+    """ 2^i * point for every bit, k * point is then additions only """
+    table = [affine]
+    point = (affine[0], affine[1], 1)
+    for _ in range(255):
+        point = _double(point)
+        table.append(_affine(point))
+    return table
+
+
+G_TABLE = _table(G)
+
+
+def _multiply_g(k):
+    result = None
+    for i in range(k.bit_length()):
+        if k >> i & 1:
+            result = _add(result, G_TABLE[i])
+    return _affine(result)
+
+
+def private_key_to_int(wif):
+    """ Secret of a WIF (5...) or PVT_K1_ private key """
+    if wif.startswith("PVT_K1_"):
+        data = abi.base58_decode(wif[7:])
+        key, checksum = data[:-4], data[-4:]
+        if abi.ripemd160(key + b"K1")[:4] != checksum:
+            raise ValueError("Invalid private key checksum")
+        return int.from_bytes(key, "big")
+    data = abi.base58_decode(wif)
+    key, checksum = data[:-4], data[-4:]
+    if hashlib.sha256(hashlib.sha256(key).digest()).digest()[:4] != checksum or key[0] != 0x80:
+        raise ValueError("Invalid private key checksum")
+    return int.from_bytes(key[1:33], "big")
+
+
+def public_key(secret):
+    """ EOS... public key of a secret """
+    x, y = _multiply_g(secret)
+    return abi.public_key_to_string(b"\0" + bytes([2 + (y & 1)]) + x.to_bytes(32, "big"))
+
+
+def _nonces(secret, digest):
+    """ RFC 6979 HMAC-DRBG outputs, as secp256k1_nonce_function_rfc6979 generates them """
+    x = secret.to_bytes(32, "big")
+    k = b"\0" * 32
+    v = b"\1" * 32
+    k = hmac.new(k, v + b"\0" + x + digest, hashlib.sha256).digest()
+    v = hmac.new(k, v, hashlib.sha256).digest()
+    k = hmac.new(k, v + b"\1" + x + digest, hashlib.sha256).digest()
+    v = hmac.new(k, v, hashlib.sha256).digest()
+    while True:
+        v = hmac.new(k, v, hashlib.sha256).digest()
+        yield int.from_bytes(v, "big")
+        k = hmac.new(k, v + b"\0", hashlib.sha256).digest()
+        v = hmac.new(k, v, hashlib.sha256).digest()
+
+
+def _canonical(compact):
+    # is_canonical of fc, nodeos rejects other signatures
+    return not (compact[1] & 0x80 or compact[1] == 0 and not compact[2] & 0x80
+                or compact[33] & 0x80 or compact[33] == 0 and not compact[34] & 0x80)
+
+
+def sign_digest(digest, secret):
+    """ SIG_K1_ signature of a sha256 digest, low s and canonical, the one keosd makes """
+    e = int.from_bytes(digest, "big")
+    nonces = _nonces(secret, digest)
+    # the nonce function of fc::ecc::private_key::sign_compact counts from 1, so the first output is never used
+    next(nonces)
+    for k in nonces:
+        if not 1 <= k < N:
+            continue
+        x, y = _multiply_g(k)
+        r = x % N
+        s = pow(k, N - 2, N) * (e + r * secret) % N
+        if not r or not s:
+            continue
+        recovery = (y & 1) | (2 if x >= N else 0)
+        if s > N // 2:
+            s = N - s
+            recovery ^= 1
+        compact = bytes([27 + 4 + recovery]) + r.to_bytes(32, "big") + s.to_bytes(32, "big")
+        if _canonical(compact):
+            return "SIG_K1_" + abi.base58_encode(compact + abi.ripemd160(compact + b"K1")[:4])
+
+
+def recover_digest(digest, signature):
+    """ EOS... public key that made the SIG_K1_ signature of the digest, as nodeos recovers it """
+    compact = abi.base58_decode(signature[7:])[:-4]
+    recovery = compact[0] - 27 - 4
+    r = int.from_bytes(compact[1:33], "big")
+    s = int.from_bytes(compact[33:65], "big")
+    x = r + (N if recovery & 2 else 0)
+    y = pow((pow(x, 3, P) + 7) % P, (P + 1) // 4, P)
+    if y & 1 != recovery & 1:
+        y = P - y
+    # Q = r^-1 (s R - e G)
+    sr = _multiply(s, (x, y))
+    point = _add((sr[0], sr[1], 1), _multiply_g(-int.from_bytes(digest, "big") % N))
+    qx, qy = _multiply(pow(r, N - 2, N), _affine(point))
+    return abi.public_key_to_string(b"\0" + bytes([2 + (qy & 1)]) + qx.to_bytes(32, "big"))
+
+
+def transaction_digest(chain_id, packed_trx, packed_context_free_data=b""):
+    """ What the signatures of a packed transaction sign """
+    cfd = hashlib.sha256(packed_context_free_data).digest() if packed_context_free_data else b"\0" * 32
+    return hashlib.sha256(bytes.fromhex(chain_id) + packed_trx + cfd).digest()
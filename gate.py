@@ -0,0 +1,114 @@
+import argparse
+import json
+import os
+import sys
+
+from eosfactory.eosf import verbosity
+from termcolor import cprint
+
+from buildcache import files_hash
+from scenario import measure
+
+
+BASELINE = "resources.baseline.json"
+# billed CPU varies between runs, its median is compared, NET and RAM are exact
+GATED = {"cpu_us": "p50", "net_bytes": "mean", "ram_bytes": "mean"}
+# change allowed whatever the percentage, a RAM delta may be 0 or negative
+TOLERANCE = {"cpu_us": 10, "net_bytes": 8, "ram_bytes": 8}
+
+
+def figures(report):
+    return {
+        action: {metric: metrics[metric][stat] for metric, stat in GATED.items()}
+        for action, metrics in report.items()
+    }
+
+
+def config_key():
+    """ Baseline figures hold for one config.h """
+    return files_hash(["config.h"])[:16]
+
+
+def regressions(baseline, current, threshold):
+    """ (action, metric, was, now) over the baseline by more than threshold percent of it and the tolerance
+
+    Actions of the baseline not measured and measured actions not in the
+    baseline are reported with metric "missing" and "new".
+    """
+    found = []
+    for action, metrics in sorted(baseline.items()):
+        if action not in current:
+            found.append((action, "missing", None, None))
+            continue
+        for metric, was in sorted(metrics.items()):
+            now = current[action][metric]
+            if now - was > max(abs(was) * threshold / 100, TOLERANCE[metric]):
+                found.append((action, metric, was, now))
+    found += [(action, "new", None, None) for action in sorted(set(current) - set(baseline))]
+    return found
+
+
+def print_table(baseline, current):
+    print("{:<12} {:<10} {:>12} {:>12} {:>8}".format("action", "metric", "now", "was", "diff"))
+    for action in sorted(set(baseline) | set(current)):
+        for metric in GATED:
+            now = current.get(action, {}).get(metric, 0)
+            was = baseline.get(action, {}).get(metric, 0)
+            print("{:<12} {:<10} {:>12.1f} {:>12.1f} {:>8}".format(
+                action, metric, now, was, "{:+.1f}%".format((now - was) * 100 / abs(was)) if was else "-"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fail when the contract costs more CPU, NET or RAM than the baseline")
+    parser.add_argument("--baseline", default=BASELINE, help="committed per action figures")
+    parser.add_argument("--threshold", type=float, default=float(os.environ.get("GATE_THRESHOLD", 10)),
+                        help="allowed increase in percent, GATE_THRESHOLD by default or 10")
+    parser.add_argument("--update", action="store_true", help="write the figures of this build as the baseline")
+    parser.add_argument("--output", help="write the full report as json")
+    args = parser.parse_args()
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    if not args.update and not (baseline and baseline["actions"]):
+        # a fresh checkout has no figures of nodeos to compare with, that is not a regression
+        cprint("no baseline recorded in {}, gate skipped, record one with make gate-update".format(args.baseline),
+               "yellow")
+        return 0
+
+    verbosity([])
+    report = measure()
+    current = figures(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
+
+    if args.update:
+        with open(args.baseline, "w") as f:
+            json.dump({"config": config_key(), "actions": current}, f, indent=4, sort_keys=True)
+            f.write("\n")
+        cprint("baseline written to " + args.baseline, "green")
+        return 0
+
+    if baseline["config"] != config_key():
+        cprint("baseline was recorded with another config.h", "yellow")
+
+    print_table(baseline["actions"], current)
+    found = regressions(baseline["actions"], current, args.threshold)
+    for action, metric, was, now in found:
+        if metric == "missing":
+            cprint("{} not measured, the scenario changed".format(action), "red")
+        elif metric == "new":
+            cprint("{} not in the baseline, record it with make gate-update".format(action), "red")
+        else:
+            cprint("{} {} {:.1f} over {:.1f} + max({}%, {})".format(
+                action, metric, now, was, args.threshold, TOLERANCE[metric]), "red")
+    if found:
+        return 1
+    cprint("no action over the baseline + {}% or the tolerance".format(args.threshold), "green")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+import csv
+import functools
+import json
+import time
+
+import eosfactory.core.cleos as cleos
+import eosfactory.core.cleos_get as cleos_get
+import eosfactory.core.errors as errors
+
+
+METRICS = ("latency_ms", "cpu_us", "net_bytes", "ram_bytes")
+
+
+def percentile(values, p):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def summary(values):
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values) if values else 0,
+        "p50": percentile(values, 50),
+        "p90": percentile(values, 90),
+        "p99": percentile(values, 99),
+        "max": max(values) if values else 0
+    }
+
+
+def ram_usage(account):
+    return cleos_get.GetAccount(str(account), is_info=False, is_verbose=False).json["ram_usage"]
+
+
+class Recorder:
+    """ Latency, billed CPU and NET, and RAM of one account per pushed action
+
+    The RAM delta costs two get_account calls per action, it is only
+    measured with ram_account set.
+    """
+
+    def __init__(self, ram_account=None):
+        self.ram_account = ram_account
+        self.samples = {}
+        self.errors = {}
+
+    def measure(self, action, push, *args, **kwargs):
+        """ Call push, a push_action returning the transaction, and record its costs """
+        ram_before = ram_usage(self.ram_account) if self.ram_account else 0
+        began = time.time()
+        try:
+            result = push(*args, **kwargs)
+        except errors.Error:
+            self.errors[action] = self.errors.get(action, 0) + 1
+            raise
+        latency = time.time() - began
+        ram_after = ram_usage(self.ram_account) if self.ram_account else 0
+        self.record(action, latency, result.json["processed"]["receipt"], ram_after - ram_before)
+        return result
+
+    def wrap(self, contract):
+        """ Record every push_action of an eosfactory Contract """
+        push_action = contract.push_action
+
+        @functools.wraps(push_action)
+        def instrumented(action, data, *args, **kwargs):
+            return self.measure(action, push_action, action, data, *args, **kwargs)
+
+        contract.push_action = instrumented
+        return contract
+
+    def push(self, account, action, data, actor):
+        """ Push a single action of any account with cleos and record it """
+        return self.measure(action, cleos.PushAction, str(account), action, json.dumps(data),
+                            permission=str(actor), force_unique=1, is_verbose=False)
+
+    def record(self, action, latency, receipt, ram_delta=0):
+        self.samples.setdefault(action, []).append({
+            "latency_ms": latency * 1000,
+            "cpu_us": receipt["cpu_usage_us"],
+            "net_bytes": receipt["net_usage_words"] * 8,
+            "ram_bytes": ram_delta
+        })
+
+    def report(self):
+        return {
+            action: dict(
+                {metric: summary([s[metric] for s in samples]) for metric in METRICS},
+                errors=self.errors.get(action, 0)
+            )
+            for action, samples in sorted(self.samples.items())
+        }
+
+    def write(self, path):
+        """ json report, or one csv row per action and metric for a .csv path """
+        report = self.report()
+        with open(path, "w", newline="") as f:
+            if not path.endswith(".csv"):
+                json.dump(report, f, indent=4)
+                return
+            fields = ["count", "mean", "p50", "p90", "p99", "max"]
+            writer = csv.writer(f)
+            writer.writerow(["action", "metric"] + fields + ["errors"])
+            for action, metrics in report.items():
+                for metric in METRICS:
+                    writer.writerow([action, metric] + [metrics[metric][field] for field in fields] + [metrics["errors"]])
@@ -0,0 +1,693 @@
+import argparse
+import copy
+import datetime
+import functools
+import hashlib
+import json
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import abi
+import config
+from model import Crowdsale, Token, Error, AuthError, check
+
+
+CHAIN_ID = "cf057bbfb72640471fd910bcb67639c22df9f92470936cddc1ade0e2f2e7dc4f"
+EOSIO_KEY = "EOS6MRyAjQq8ud7hVNYcfnVPJqcVpscN5So8BhtHuGYqET5GDW5CV"
+DEFAULT_ADDRESS = "127.0.0.1:8888"
+
+
+class ChainError(Exception):
+
+    def __init__(self, code, name, what, message):
+        super().__init__(message)
+        self.json = {
+            "code": 500,
+            "message": "Internal Service Error",
+            "error": {
+                "code": code,
+                "name": name,
+                "what": what,
+                "details": [{"message": message, "file": "", "line_number": 0, "method": ""}]
+            }
+        }
+
+
+def assert_error(message):
+    return ChainError(3050003, "eosio_assert_message_exception", "eosio_assert_message assertion failure",
+                      "assertion failure with message: " + message)
+
+
+def auth_error(account):
+    return ChainError(3090004, "missing_auth_exception", "Missing required authority",
+                      "missing authority of " + account)
+
+
+def authority(key):
+    return {"threshold": 1, "keys": [{"key": key, "weight": 1}], "accounts": [], "waits": []}
+
+
+def key_to_int(value):
+    if isinstance(value, int) or value.isdigit():
+        return int(value)
+    return abi.string_to_name(value)
+
+
+class Journal:
+    """ Undo log of the transaction being applied
+
+    Tables are UndoDict and UndoSet, which copy a row the first time the
+    transaction touches it, so undoing a failed transaction costs the rows
+    it touched rather than the whole chain.
+    """
+
+    def __init__(self):
+        self.undo = None
+        self.touched = set()
+
+    def begin(self, models):
+        self.undo = []
+        self.touched = set()
+        for model in models:
+            for table in model.tables:
+                value = self.wrap(getattr(model, table))
+                setattr(model, table, value)
+                # tables a model replaces instead of changing are put back by attribute
+                self.undo.append(functools.partial(setattr, model, table, value))
+
+    def wrap(self, value):
+        if type(value) is dict:
+            return UndoDict(value, self)
+        if type(value) is set:
+            return UndoSet(value, self)
+        return value
+
+    def push(self, undo):
+        if self.undo is not None:
+            self.undo.append(undo)
+
+    def first(self, table, key):
+        """ Whether a running transaction touches the row for the first time """
+        if self.undo is None or (id(table), key) in self.touched:
+            return False
+        self.touched.add((id(table), key))
+        return True
+
+    def commit(self):
+        self.undo = None
+
+    def rollback(self):
+        undo, self.undo = self.undo, None
+        for action in reversed(undo):
+            action()
+
+
+class UndoDict(dict):
+    """ Table of rows by key recording them in the journal before they change """
+
+    def __init__(self, rows, journal):
+        super().__init__(rows)
+        self.journal = journal
+
+    def touch(self, key):
+        if not self.journal.first(self, key):
+            return
+        if dict.__contains__(self, key):
+            row = copy.deepcopy(dict.__getitem__(self, key))
+            self.journal.push(functools.partial(dict.__setitem__, self, key, row))
+        else:
+            self.journal.push(functools.partial(dict.pop, self, key, None))
+
+    def __getitem__(self, key):
+        self.touch(key)
+        return super().__getitem__(key)
+
+    def __setitem__(self, key, value):
+        self.touch(key)
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self.touch(key)
+        super().__delitem__(key)
+
+    def get(self, key, default=None):
+        self.touch(key)
+        return super().get(key, default)
+
+    def setdefault(self, key, default=None):
+        self.touch(key)
+        return super().setdefault(key, default)
+
+    def pop(self, key, *default):
+        self.touch(key)
+        return super().pop(key, *default)
+
+    def __deepcopy__(self, memo):
+        return UndoDict(copy.deepcopy(dict(self), memo), self.journal)
+
+
+class UndoSet(set):
+    """ Set recording the membership of items in the journal before it changes """
+
+    def __init__(self, items, journal):
+        super().__init__(items)
+        self.journal = journal
+
+    def touch(self, item):
+        if not self.journal.first(self, item):
+            return
+        undo = set.add if set.__contains__(self, item) else set.discard
+        self.journal.push(functools.partial(undo, self, item))
+
+    def add(self, item):
+        self.touch(item)
+        super().add(item)
+
+    def discard(self, item):
+        self.touch(item)
+        super().discard(item)
+
+    def remove(self, item):
+        self.touch(item)
+        super().remove(item)
+
+    def __ior__(self, items):
+        for item in items:
+            self.touch(item)
+        return super().__ior__(items)
+
+    def __isub__(self, items):
+        for item in items:
+            self.touch(item)
+        return super().__isub__(items)
+
+    def __deepcopy__(self, memo):
+        return UndoSet(copy.deepcopy(set(self), memo), self.journal)
+
+
+class Chain:
+    """ In-memory chain state with the crowdsale and token contracts run by model.py """
+
+    def __init__(self, cfg=None):
+        self.cfg = cfg if cfg is not None else config.load().defines()
+        self.lock = threading.RLock()
+        self.journal = Journal()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.block_num = 1
+            self.accounts = UndoDict({}, self.journal)
+            self.models = {}
+            self.inline = []
+            self.create_account("eosio", authority(EOSIO_KEY), authority(EOSIO_KEY))
+
+    def save(self):
+        with self.lock:
+            return (
+                self.block_num,
+                copy.deepcopy(self.accounts),
+                {
+                    name: (model, copy.deepcopy({t: getattr(model, t) for t in model.tables}))
+                    for name, model in self.models.items()
+                }
+            )
+
+    def restore(self, saved):
+        with self.lock:
+            self.block_num, accounts, models = saved
+            self.accounts = copy.deepcopy(accounts)
+            self.models = {}
+            for name, (model, tables) in models.items():
+                for table, value in copy.deepcopy(tables).items():
+                    setattr(model, table, value)
+                self.models[name] = model
+
+    def block_id(self, num):
+        return (num.to_bytes(4, "big") + hashlib.sha256(str(num).encode()).digest()[4:]).hex()
+
+    def create_account(self, name, owner, active):
+        if name in self.accounts:
+            raise ChainError(3050001, "account_name_exists_exception", "Account name already exists",
+                             "Cannot create account named {}, as that name is already taken".format(name))
+        self.accounts[name] = {
+            "created": datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S.000"),
+            "permissions": {
+                "owner": {"parent": "", "required_auth": owner},
+                "active": {"parent": "owner", "required_auth": active}
+            },
+            "abi": None,
+            "code_hash": "0" * 64,
+            "ram_usage": 2996
+        }
+
+    def account_abi(self, account):
+        if account == "eosio":
+            return abi.CHAIN_ABI
+        info = self.accounts.get(account)
+        if info is None or info["abi"] is None:
+            raise ChainError(3060002, "account_query_exception", "Account Query Exception",
+                             "unknown key (eosio::chain::name): " + account)
+        return info["abi"]
+
+    # transactions
+
+    def push_transaction(self, transaction):
+        with self.lock:
+            self.journal.begin(self.models.values())
+            began = time.time()
+            try:
+                traces = [self.apply(action) for action in transaction["actions"]]
+            except AuthError as e:
+                self.rollback()
+                raise ChainError(3090004, "missing_auth_exception", "Missing required authority", str(e))
+            except Error as e:
+                self.rollback()
+                raise assert_error(str(e))
+            except ChainError:
+                self.rollback()
+                raise
+            self.journal.commit()
+            self.block_num += 1
+            elapsed = int((time.time() - began) * 1000000)
+            transaction_id = hashlib.sha256(json.dumps(transaction, sort_keys=True, default=str).encode()
+                                            + str(self.block_num).encode()).hexdigest()
+            return {
+                "transaction_id": transaction_id,
+                "processed": {
+                    "id": transaction_id,
+                    "block_num": self.block_num,
+                    "receipt": {
+                        "status": "executed",
+                        "cpu_usage_us": elapsed,
+                        "net_usage_words": transaction.get("net_usage_words", 0)
+                    },
+                    "elapsed": elapsed,
+                    "net_usage": transaction.get("net_usage_words", 0) * 8,
+                    "scheduled": False,
+                    "action_traces": traces,
+                    "except": None
+                }
+            }
+
+    def rollback(self):
+        self.journal.rollback()
+        self.inline = []
+
+    def decode(self, action):
+        data = action["data"]
+        if isinstance(data, str):
+            data = self.account_abi(action["account"]).unpack_action(action["name"], data)
+        return data
+
+    def apply(self, action):
+        data = self.decode(action)
+        actors = [auth["actor"] for auth in action.get("authorization", [])]
+        trace = {
+            "receipt": {"receiver": action["account"]},
+            "act": dict(action, data=data),
+            "console": "",
+            "inline_traces": []
+        }
+        self.dispatch(action["account"], action["name"], data, actors, trace)
+        return trace
+
+    def require_auth(self, actors, account):
+        if account not in actors:
+            raise auth_error(account)
+
+    def dispatch(self, account, name, data, actors, trace):
+        if account == "eosio":
+            return self.apply_system(name, data, actors)
+        model = self.models.get(account)
+        if model is None:
+            raise ChainError(3040000, "transaction_exception", "Transaction exception",
+                             "No contract deployed to " + account)
+        if isinstance(model, Token):
+            self.apply_token(model, name, self.token_data(name, data), actors, trace)
+        else:
+            self.apply_crowdsale(model, name, data, actors, trace)
+
+    def apply_system(self, name, data, actors):
+        if name == "newaccount":
+            self.require_auth(actors, data["creator"])
+            self.create_account(data["name"], data["owner"], data["active"])
+        elif name == "updateauth":
+            self.require_auth(actors, data["account"])
+            self.accounts[data["account"]]["permissions"][data["permission"]] = {
+                "parent": data["parent"],
+                "required_auth": data["auth"]
+            }
+        elif name == "setcode":
+            self.require_auth(actors, data["account"])
+            code = bytes.fromhex(data["code"])
+            self.accounts[data["account"]]["code_hash"] = hashlib.sha256(code).hexdigest()
+            self.accounts[data["account"]]["ram_usage"] += len(code) * 10
+        elif name == "setabi":
+            self.require_auth(actors, data["account"])
+            definition = abi.unpack_abi(data["abi"])
+            self.accounts[data["account"]]["abi"] = abi.Abi(definition)
+            self.attach(data["account"], definition)
+        else:
+            raise ChainError(3040000, "transaction_exception", "Transaction exception",
+                             "Unsupported system action " + name)
+
+    def attach(self, account, definition):
+        previous = self.models.get(account)
+        self.journal.push(functools.partial(self.models.__setitem__, account, previous) if previous
+                          else functools.partial(self.models.pop, account, None))
+        actions = {a["name"] for a in definition["actions"]}
+        if "whitemany" in actions:
+            self.models[account] = Crowdsale(
+                self.cfg, account,
+                send=lambda contract, action, data: self.inline.append((contract, action, data, account))
+            )
+        elif "issue" in actions:
+            self.models[account] = Token(account)
+        else:
+            self.models.pop(account, None)
+
+    def token_data(self, name, data):
+        # json action data to Token method arguments
+        if name == "create":
+            amount, precision, symbol = abi.parse_asset(data["maximum_supply"])
+            return {"issuer": data["issuer"], "symbol": symbol, "decimals": precision,
+                    "maximum_supply": amount, "lock": data.get("lock", False)}
+        if name == "unlock":
+            return {"symbol": data["symbol"].split(",")[1]}
+        amount, precision, symbol = abi.parse_asset(data["quantity"])
+        result = {"to": data["to"], "symbol": symbol, "amount": amount, "memo": data.get("memo", "")}
+        if name == "transfer":
+            result["sender"] = data["from"]
+        return result
+
+    def apply_token(self, token, name, data, actors, trace):
+        if name == "create":
+            self.require_auth(actors, token.name)
+            token.create(**data)
+        elif name == "issue":
+            stat = token.stats.get(data["symbol"])
+            check(stat is not None, "token with symbol does not exist, create token before issue")
+            self.require_auth(actors, stat["issuer"])
+            token.issue(stat["issuer"], data["symbol"], data["amount"], data["memo"])
+            if data["to"] != stat["issuer"]:
+                self.apply_token(token, "transfer", dict(data, sender=stat["issuer"]), [stat["issuer"]], trace)
+        elif name == "transfer":
+            self.require_auth(actors, data["sender"])
+            check(data["to"] in self.accounts, "to account does not exist")
+            token.transfer(**data)
+            for recipient in (data["sender"], data["to"]):
+                model = self.models.get(recipient)
+                if isinstance(model, Crowdsale) and token.name in ("eosio.token", model.contract):
+                    model.transfer(data["sender"], data["to"], data["amount"], data["symbol"], data["memo"])
+                    self.run_inline(model.name, trace)
+        elif name == "unlock":
+            stat = token.stats.get(data["symbol"])
+            check(stat is not None, "token with symbol does not exist")
+            self.require_auth(actors, stat["issuer"])
+            token.unlock(data["symbol"])
+        else:
+            raise ChainError(3040000, "transaction_exception", "Transaction exception",
+                             "Unsupported token action " + name)
+
+    def apply_crowdsale(self, crowdsale, name, data, actors, trace):
+        actor = actors[0] if actors else None
+        if name in ("init", "addpremint", "premint", "setstart", "setfinish", "white", "unwhite", "whitemany",
+                    "unwhitemany", "setroot", "finalize", "withdraw", "refund", "refundmany", "migrate", "claim", "distribute"):
+            getattr(crowdsale, name)(actor=actor, **data)
+        elif name == "settime":
+            crowdsale.settime(data["time"])
+        else:
+            raise ChainError(3040000, "transaction_exception", "Transaction exception",
+                             "Unsupported crowdsale action " + name)
+        self.run_inline(crowdsale.name, trace)
+
+    def run_inline(self, sender, trace):
+        inline, self.inline = self.inline, []
+        for contract, action, data, account in inline:
+            token = self.models.get(contract)
+            check(isinstance(token, Token), "No token contract deployed to " + contract)
+            inline_trace = {
+                "receipt": {"receiver": contract},
+                "act": {"account": contract, "name": action, "authorization": [
+                    {"actor": account, "permission": "active"}
+                ], "data": data},
+                "console": "",
+                "inline_traces": []
+            }
+            self.apply_token(token, action, data, [account], inline_trace)
+            trace["inline_traces"].append(inline_trace)
+
+    # queries
+
+    def get_info(self):
+        with self.lock:
+            return {
+                "server_version": "localnode",
+                "chain_id": CHAIN_ID,
+                "head_block_num": self.block_num,
+                "last_irreversible_block_num": self.block_num,
+                "last_irreversible_block_id": self.block_id(self.block_num),
+                "head_block_id": self.block_id(self.block_num),
+                "head_block_time": datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S.000"),
+                "head_block_producer": "eosio",
+                "virtual_block_cpu_limit": 200000000,
+                "virtual_block_net_limit": 1048576000,
+                "block_cpu_limit": 199900,
+                "block_net_limit": 1048576
+            }
+
+    def get_account(self, name):
+        with self.lock:
+            account = self.accounts.get(name)
+            if account is None:
+                raise ChainError(3060002, "account_query_exception", "Account Query Exception",
+                                 "unknown key (eosio::chain::name): " + name)
+            limit = {"used": 0, "available": 10 ** 12, "max": 10 ** 12}
+            return {
+                "account_name": name,
+                "head_block_num": self.block_num,
+                "privileged": name == "eosio",
+                "created": account["created"],
+                "ram_quota": -1,
+                "ram_usage": account["ram_usage"],
+                "net_weight": -1,
+                "cpu_weight": -1,
+                "net_limit": limit,
+                "cpu_limit": limit,
+                "permissions": [
+                    {"perm_name": perm, "parent": value["parent"], "required_auth": value["required_auth"]}
+                    for perm, value in sorted(account["permissions"].items())
+                ],
+                "total_resources": None,
+                "self_delegated_bandwidth": None,
+                "refund_request": None,
+                "voter_info": None
+            }
+
+    def get_abi(self, name):
+        with self.lock:
+            account = self.accounts.get(name)
+            if account is None:
+                raise ChainError(3060002, "account_query_exception", "Account Query Exception",
+                                 "unknown key (eosio::chain::name): " + name)
+            result = {"account_name": name}
+            if account["abi"] is not None:
+                result["abi"] = account["abi"].definition
+            return result
+
+    def get_required_keys(self, transaction, available_keys):
+        with self.lock:
+            required = []
+            for action in transaction["actions"]:
+                for auth in action["authorization"]:
+                    account = self.accounts.get(auth["actor"])
+                    if account is None:
+                        continue
+                    permission = account["permissions"].get(auth["permission"])
+                    for key in permission["required_auth"]["keys"] if permission else []:
+                        if key["key"] in available_keys and key["key"] not in required:
+                            required.append(key["key"])
+            return {"required_keys": required}
+
+    def table_rows(self, code, scope, table):
+        model = self.models.get(code)
+        if isinstance(model, Crowdsale):
+            return [(key_to_int(row.get("account", 0)), row) for row in model.table(table)]
+        if isinstance(model, Token):
+            if table == "accounts":
+                return [
+                    (abi.string_to_symbol(0, symbol) >> 8, {
+                        "balance": abi.format_asset(amount, model.stats[symbol]["decimals"], symbol)
+                    })
+                    for symbol, amount in sorted(model.accounts.get(scope, {}).items())
+                ]
+            if table == "stat" and scope in model.stats:
+                stat = model.stats[scope]
+                return [(abi.string_to_symbol(0, scope) >> 8, {
+                    "supply": abi.format_asset(stat["supply"], stat["decimals"], scope),
+                    "max_supply": abi.format_asset(stat["max_supply"], stat["decimals"], scope),
+                    "issuer": stat["issuer"],
+                    "lock": stat["lock"]
+                })]
+        return []
+
+    def get_table_rows(self, code, scope, table, lower_bound="", upper_bound="", limit=10, **kwargs):
+        with self.lock:
+            rows = self.table_rows(code, scope, table)
+            if lower_bound not in ("", None):
+                lower = key_to_int(lower_bound)
+                rows = [(key, row) for key, row in rows if key >= lower]
+            if upper_bound not in ("", None):
+                upper = key_to_int(upper_bound)
+                rows = [(key, row) for key, row in rows if key < upper]
+            limit = int(limit) if limit else 10
+            return {"rows": [row for key, row in rows[:limit]], "more": len(rows) > limit}
+
+
+class Handler(BaseHTTPRequestHandler):
+    # keep-alive for pooled clients such as pipeline.Client
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def reply(self, code, body):
+        data = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self.do_POST()
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        try:
+            params = json.loads(body) if body.strip() else {}
+            self.reply(200, self.server.call(self.path, params))
+        except ChainError as e:
+            self.reply(500, e.json)
+        except KeyError as e:
+            self.reply(404, {"code": 404, "message": "Not Found", "error": {"what": str(e)}})
+
+
+class Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # concurrent readers such as tables.Reader open many connections at once
+    request_queue_size = 128
+
+    def __init__(self, address, chain):
+        host, port = address.rsplit(":", 1)
+        super().__init__((host, int(port)), Handler)
+        self.chain = chain
+
+    def call(self, path, params):
+        chain = self.chain
+        endpoint = path.split("?")[0]
+        if endpoint == "/v1/chain/get_info":
+            return chain.get_info()
+        if endpoint == "/v1/chain/get_account":
+            return chain.get_account(params["account_name"])
+        if endpoint == "/v1/chain/get_abi":
+            return chain.get_abi(params["account_name"])
+        if endpoint == "/v1/chain/get_code":
+            result = chain.get_abi(params["account_name"])
+            result["code_hash"] = chain.accounts[params["account_name"]]["code_hash"]
+            return result
+        if endpoint == "/v1/chain/get_table_rows":
+            return chain.get_table_rows(**params)
+        if endpoint == "/v1/chain/get_required_keys":
+            return chain.get_required_keys(params["transaction"], params["available_keys"])
+        if endpoint == "/v1/chain/abi_json_to_bin":
+            data = chain.account_abi(params["code"]).pack_action(params["action"], params["args"])
+            return {"binargs": data.hex()}
+        if endpoint == "/v1/chain/abi_bin_to_json":
+            return {"args": chain.account_abi(params["code"]).unpack_action(params["action"], params["binargs"])}
+        if endpoint == "/v1/chain/push_transaction":
+            return chain.push_transaction(unpack_transaction(params))
+        raise KeyError(endpoint)
+
+
+def unpack_transaction(params):
+    if "transaction" in params:
+        return params["transaction"]
+    packed = bytes.fromhex(params["packed_trx"])
+    if params.get("compression") in ("zlib", 1):
+        packed = zlib.decompress(packed)
+    transaction = abi.CHAIN_ABI.unpack("transaction", packed)
+    transaction["net_usage_words"] = (len(packed) + 7) // 8
+    return transaction
+
+
+class Node:
+    """ Local HTTP stand-in for nodeos, served from a background thread """
+
+    def __init__(self, address=DEFAULT_ADDRESS, cfg=None):
+        self.chain = Chain(cfg)
+        self.server = Server(address, self.chain)
+        # with port 0 the system picks a free one, concurrent suites of matrix.py each get their own
+        self.address = "{}:{}".format(*self.server.server_address[:2])
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def reset(self):
+        """ Replacement of eosfactory reset() that clears the in-memory chain instead of nodeos """
+        reboot_eosfactory()
+        import eosfactory.core.manager as manager
+        manager.clear_testnet_cache()
+        self.chain.reset()
+
+
+class Snapshot:
+    """ snapshot.Snapshot interface over the in-memory chain """
+
+    def __init__(self, node):
+        self.node = node
+        self.saved = None
+
+    def exists(self):
+        return self.saved is not None
+
+    def save(self):
+        self.saved = self.node.chain.save()
+
+    def restore(self):
+        if self.saved is None:
+            return False
+        reboot_eosfactory()
+        self.node.chain.restore(self.saved)
+        return True
+
+
+def reboot_eosfactory():
+    # drop eosfactory account objects and wallet the way reset() does
+    import eosfactory.core.cleos as cleos
+    import eosfactory.core.teos as teos
+    import eosfactory.shell.account as account
+    teos.keosd_start()
+    account.reboot()
+    cleos.set_local_nodeos_address_if_none()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--address", help="http address to listen on", default=DEFAULT_ADDRESS)
+    parser.add_argument("--config", help="crowdsale config.h", default="config.h")
+    args = parser.parse_args()
+
+    node = Node(args.address, config.load(args.config).defines())
+    print("listening on http://" + args.address)
+    try:
+        node.thread.join()
+    except KeyboardInterrupt:
+        node.stop()
@@ -0,0 +1,196 @@
+import argparse
+import fnmatch
+import glob
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import time
+import traceback
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+
+import config
+
+
+MATRIX_DIR = ".matrix"
+SOURCES = ["Makefile", "*.cpp", "*.hpp", "*.h", "*.abi", "*.py"]
+OFFLINE_SUITES = ["unittest_model", "unittest_localnode", "unittest_pricing", "unittest_config"]
+TOKEN_AMOUNTS = ["SOFT_CAP_TKN", "HARD_CAP_TKN", "PREMINT_TKN"]
+
+# amounts and limits on the edges, each is run with every feature set below
+EDGES = [
+    ("base", {}),
+    ("decimals0", {"DECIMALS": 0}),
+    ("decimals8", {"DECIMALS": 8}),
+    ("nomin", {"MIN_CONTRIB": 0}),
+    ("nomax", {"MAX_CONTRIB": 0}),
+    ("nolimits", {"MIN_CONTRIB": 0, "MAX_CONTRIB": 0}),
+    ("nosoftcap", {"SOFT_CAP_TKN": 0}),
+    ("tightcaps", {"SOFT_CAP_TKN": "HARD_CAP_TKN"}),
+    ("rate1of3", {"RATE": 1, "RATE_DENOM": 3}),
+    ("rate7of1", {"RATE": 7, "RATE_DENOM": 1})
+]
+
+FEATURES = [
+    ("white", {"WHITELIST": "true", "TRANSFERABLE": "false"}),
+    ("open", {"WHITELIST": "false", "TRANSFERABLE": "true"}),
+    ("merkle", {"WHITELIST": "true", "WHITELIST_MERKLE": "true"}),
+    ("investor", {"WHITELIST": "true", "INVESTOR_TABLE": "true"}),
+    ("lazy", {"WHITELIST": "false", "LAZY_ISSUE": "true"})
+]
+
+
+def variant(base, overrides):
+    """ base config with overrides, token amounts follow a change of DECIMALS """
+    cfg = dict(base)
+    decimals = int(overrides.get("DECIMALS", cfg["DECIMALS"]))
+    shift = decimals - int(cfg["DECIMALS"])
+    for name in TOKEN_AMOUNTS + ["MINTVAL" + str(i) for i in range(int(cfg["MINTCNT"]))]:
+        amount = int(cfg[name])
+        cfg[name] = str(amount * 10 ** shift if shift >= 0 else max(amount // 10 ** -shift, 1))
+    for name, value in overrides.items():
+        cfg[name] = cfg[value] if value in cfg else str(value)
+    return cfg
+
+
+def configurations(base):
+    return [
+        ("{}-{}".format(edge, feature),
+         config.Config.from_defines(variant(base, dict(edge_overrides, **feature_overrides))).defines())
+        for edge, edge_overrides in EDGES
+        for feature, feature_overrides in FEATURES
+    ]
+
+
+def prepare(name, cfg, root):
+    """ Copy of the sources with its own config.h, outputs of eosiotoken are shared through the build cache """
+    path = os.path.join(root, name)
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+    for pattern in SOURCES:
+        for file in glob.glob(pattern):
+            shutil.copy2(file, path)
+    if os.path.isdir("eosiotoken"):
+        shutil.copytree("eosiotoken", os.path.join(path, "eosiotoken"), ignore=shutil.ignore_patterns(".git"))
+    config.write(cfg, os.path.join(path, "config.h"))
+    return path
+
+
+def build(args):
+    name, path, cache = args
+    began = time.time()
+    p = subprocess.run(
+        "python3 buildcache.py restore crowdsale || (make compile && python3 buildcache.py save crowdsale)",
+        shell=True,
+        cwd=path,
+        env=dict(os.environ, BUILD_CACHE_DIR=cache),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        universal_newlines=True
+    )
+    return name, p.returncode == 0, p.stdout, time.time() - began
+
+
+def run_suites(args):
+    index, name, path, suites, root, cache = args
+    # buildcache reads it on import, relative to the configuration directory otherwise
+    os.environ["BUILD_CACHE_DIR"] = cache
+    os.chdir(path)
+    sys.path.insert(0, os.path.abspath("."))
+    results = {}
+    for suite in suites:
+        began = time.time()
+        try:
+            if suite == "unittest_crowdsale":
+                import shard
+                shard.configure_node(index, os.path.join(os.path.abspath(root), ".nodes"))
+                from eosfactory.eosf import verbosity
+                verbosity([])
+            module = __import__(suite)
+            result = unittest.TestResult()
+            unittest.defaultTestLoader.loadTestsFromModule(module).run(result)
+            results[suite] = {
+                "run": result.testsRun,
+                "failures": [(str(test), err) for test, err in result.failures + result.errors],
+                "elapsed_s": time.time() - began
+            }
+        except Exception:
+            results[suite] = {"run": 0, "failures": [(suite, traceback.format_exc())], "elapsed_s": time.time() - began}
+    return name, results
+
+
+def cell(result):
+    if result is None:
+        return "-"
+    if result["failures"]:
+        return "FAIL {}/{}".format(len(result["failures"]), result["run"])
+    return "ok {}".format(result["run"])
+
+
+def print_grid(names, columns, rows):
+    width = max(len(name) for name in names)
+    print(("{:<" + str(width) + "}").format("") + "".join(" {:>18}".format(column) for column in columns))
+    for name in names:
+        print(("{:<" + str(width) + "}").format(name) +
+              "".join(" {:>18}".format(cell(rows[name].get(column))) for column in columns))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and test the crowdsale for a matrix of configurations")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="configurations built and tested at once")
+    parser.add_argument("-k", "--filter", default="*", help="shell pattern of configuration names")
+    parser.add_argument("--offline", action="store_true", help="only the suites running without nodeos")
+    parser.add_argument("--dir", default=MATRIX_DIR, help="root of the configuration directories")
+    parser.add_argument("-v", "--verbose", action="store_true", help="print failures and build logs")
+    args = parser.parse_args()
+
+    base = config.load("config.h").defines()
+    matrix = [(name, cfg) for name, cfg in configurations(base) if fnmatch.fnmatch(name, args.filter)]
+    if not matrix:
+        parser.error("no configuration matches " + args.filter)
+    names = [name for name, _ in matrix]
+    paths = {name: prepare(name, cfg, args.dir) for name, cfg in matrix}
+    rows = {name: {} for name in names}
+    suites = OFFLINE_SUITES if args.offline else OFFLINE_SUITES + ["unittest_crowdsale"]
+    columns = suites if args.offline else ["build"] + suites
+
+    began = time.time()
+    built = names
+    cache = os.path.abspath(os.environ.get("BUILD_CACHE_DIR", ".build-cache"))
+    if not args.offline:
+        # eosiotoken is the same for every configuration
+        subprocess.run("python3 buildcache.py restore eosiotoken || (make -C eosiotoken && python3 buildcache.py "
+                       "save eosiotoken)", shell=True, check=True)
+        with multiprocessing.Pool(args.jobs) as pool:
+            for name, ok, log, elapsed in pool.imap_unordered(build, [(name, paths[name], cache) for name in names]):
+                rows[name]["build"] = {"run": 1, "failures": [] if ok else [("build", log)], "elapsed_s": elapsed}
+        built = [name for name in names if not rows[name]["build"]["failures"]]
+
+    # a fresh process per configuration, not daemonic so that suites may start their own workers
+    with ProcessPoolExecutor(args.jobs, multiprocessing.get_context("spawn"), max_tasks_per_child=1) as pool:
+        tasks = [(i, name, paths[name], suites, args.dir, cache) for i, name in enumerate(names) if name in built]
+        for name, results in pool.map(run_suites, tasks):
+            rows[name].update(results)
+
+    print_grid(names, columns, rows)
+    failed = [(name, column, test, err) for name in names for column, result in rows[name].items()
+              for test, err in result["failures"]]
+    if args.verbose:
+        for name, column, test, err in failed:
+            print("=" * 70)
+            print("FAIL: {} {} {}".format(name, column, test))
+            print("-" * 70)
+            print(err)
+    print("-" * 70)
+    print("Ran {} configurations in {:.3f}s".format(len(names), time.time() - began))
+    if failed:
+        print("\nFAILED (configurations={})".format(len({name for name, _, _, _ in failed})))
+        return 1
+    print("\nOK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
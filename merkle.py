@@ -0,0 +1,102 @@
+import argparse
+import csv
+import hashlib
+import struct
+import sys
+
+import abi
+
+
+# leaves are sha256 of the 8 byte account name, parents are sha256 of the
+# two children in ascending order, so a proof needs no left/right flags
+
+
+def leaf(account):
+    return hashlib.sha256(struct.pack("<Q", abi.string_to_name(account))).digest()
+
+
+def parent(a, b):
+    return hashlib.sha256(min(a, b) + max(a, b)).digest()
+
+
+class Tree:
+    """ Merkle tree of whitelisted accounts, an odd node is carried up unchanged """
+
+    def __init__(self, accounts):
+        self.accounts = sorted(set(accounts), key=abi.string_to_name)
+        self.index = {account: i for i, account in enumerate(self.accounts)}
+        self.levels = [[leaf(account) for account in self.accounts]]
+        while len(self.levels[-1]) > 1:
+            level = self.levels[-1]
+            self.levels.append([
+                parent(level[i], level[i + 1]) if i + 1 < len(level) else level[i]
+                for i in range(0, len(level), 2)
+            ])
+
+    @property
+    def root(self):
+        return self.levels[-1][0].hex() if self.accounts else "00" * 32
+
+    def proof(self, account):
+        i = self.index[account]
+        siblings = []
+        for level in self.levels[:-1]:
+            if i ^ 1 < len(level):
+                siblings.append(level[i ^ 1])
+            i //= 2
+        return siblings
+
+    def memo(self, account):
+        """ Transfer memo carrying the proof, as parsed by on_deposit """
+        return "".join(sibling.hex() for sibling in self.proof(account))
+
+
+def verify(account, memo, root):
+    """ Same check as crowdsale::check_proof, False for a malformed memo """
+    if len(memo) % 64:
+        return False
+    try:
+        node = leaf(account)
+        for i in range(0, len(memo), 64):
+            node = parent(node, bytes.fromhex(memo[i:i + 64]))
+    except ValueError:
+        return False
+    return node.hex() == root
+
+
+def read_accounts(path, column=0):
+    with open(path, newline="") as f:
+        rows = [row for row in csv.reader(f) if row and row[0].strip()]
+    if rows and not isinstance(column, int):
+        column = rows.pop(0).index(column)
+    return [row[column].strip() for row in rows]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the whitelist merkle root and proofs from a CSV")
+    parser.add_argument("csv", help="CSV with account names")
+    parser.add_argument("--column", help="header of the account column, the first column without header by default")
+    parser.add_argument("-o", "--output", help="write account,memo rows to this CSV")
+    args = parser.parse_args()
+
+    accounts = read_accounts(args.csv, args.column if args.column else 0)
+    for account in accounts:
+        try:
+            valid = abi.name_to_string(abi.string_to_name(account)) == account
+        except KeyError:
+            valid = False
+        if not valid:
+            sys.exit("invalid account name: " + account)
+    tree = Tree(accounts)
+
+    if args.output:
+        with open(args.output, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["account", "memo"])
+            for account in tree.accounts:
+                writer.writerow([account, tree.memo(account)])
+    print(tree.root)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,505 @@
+import bisect
+import string
+import time
+
+import config
+import merkle
+from rate import EOS_DECIMALS, rate_fraction, eos2tkn, tkn2eos, min_tokens
+
+
+EOS_SYMBOL = "EOS"
+EOS_CONTRACT = "eosio.token"
+
+
+class Error(Exception):
+    """ Failed eosio_assert, the message is the same as in the contract """
+
+
+class AuthError(Error):
+    """ Failed require_auth """
+
+
+def check(condition, message):
+    if not condition:
+        raise Error(message)
+
+
+class Token:
+    """ eosio.token with the lock extension of eosiotoken """
+
+    tables = ("stats", "accounts")
+
+    def __init__(self, name):
+        self.name = name
+        self.stats = {}
+        self.accounts = {}
+
+    def create(self, issuer, symbol, decimals, maximum_supply, lock=False):
+        check(maximum_supply > 0, "max-supply must be positive")
+        check(symbol not in self.stats, "token with symbol already exists")
+        self.stats[symbol] = {
+            "supply": 0,
+            "max_supply": maximum_supply,
+            "decimals": decimals,
+            "issuer": issuer,
+            "lock": lock
+        }
+
+    def issue(self, to, symbol, amount, memo=""):
+        check(symbol in self.stats, "token with symbol does not exist, create token before issue")
+        stat = self.stats[symbol]
+        check(amount > 0, "must issue positive quantity")
+        check(amount <= stat["max_supply"] - stat["supply"], "quantity exceeds available supply")
+        stat["supply"] += amount
+        self.add_balance(to, symbol, amount)
+
+    def transfer(self, sender, to, symbol, amount, memo=""):
+        check(sender != to, "cannot transfer to self")
+        check(symbol in self.stats, "token with symbol does not exist")
+        stat = self.stats[symbol]
+        check(not stat["lock"] or sender == stat["issuer"], "token transfers are locked")
+        check(amount > 0, "must transfer positive quantity")
+        self.sub_balance(sender, symbol, amount)
+        self.add_balance(to, symbol, amount)
+
+    def unlock(self, symbol):
+        check(symbol in self.stats, "token with symbol does not exist")
+        self.stats[symbol]["lock"] = False
+
+    def balance(self, owner, symbol):
+        return self.accounts.get(owner, {}).get(symbol, 0)
+
+    def add_balance(self, owner, symbol, amount):
+        balances = self.accounts.setdefault(owner, {})
+        balances[symbol] = balances.get(symbol, 0) + amount
+
+    def sub_balance(self, owner, symbol, amount):
+        balance = self.balance(owner, symbol)
+        check(balance >= amount, "overdrawn balance")
+        self.accounts[owner][symbol] = balance - amount
+
+
+class Crowdsale:
+    """ In-process model of crowdsale.cpp built from the same config.h
+
+    Inline actions are passed to the send(contract, action, data) callback
+    with data matching the Token methods, by default they are dropped.
+    """
+
+    tables = ("state_exists", "state", "deposits", "whitelist", "root", "cursor", "premints",
+              "old_deposits", "old_whitelist", "migrated", "preminted")
+
+    def __init__(self, cfg=None, name="ico.deployer", send=None, clock=time.time):
+        if cfg is None:
+            cfg = config.load().defines()
+        self.cfg = cfg
+        self.name = name
+        self.send = send or (lambda contract, action, data: None)
+        self.clock = clock
+
+        self.issuer = cfg["ISSUER"]
+        self.symbol = cfg["SYMBOL"]
+        self.decimals = int(cfg["DECIMALS"])
+        self.contract = cfg["CONTRACT"]
+        self.whitelist_enabled = cfg["WHITELIST"] == "true"
+        self.whitelist_merkle = cfg.get("WHITELIST_MERKLE") == "true"
+        self.investor_table = cfg.get("INVESTOR_TABLE") == "true"
+        self.lazy_issue = cfg.get("LAZY_ISSUE") == "true"
+        self.transferable = cfg["TRANSFERABLE"] == "true"
+        self.min_contrib = int(cfg["MIN_CONTRIB"])
+        self.max_contrib = int(cfg["MAX_CONTRIB"])
+        self.soft_cap = int(cfg["SOFT_CAP_TKN"])
+        self.hard_cap = int(cfg["HARD_CAP_TKN"])
+        self.premint_reserve = int(cfg.get("PREMINT_TKN", 0))
+        self.debug = "DEBUG" in cfg
+        self.mint = [
+            (cfg["MINTDEST" + str(i)], int(cfg["MINTVAL" + str(i)]))
+            for i in range(int(cfg["MINTCNT"]))
+        ]
+
+        self.rate_num, self.rate_denom = rate_fraction(self.decimals, int(cfg["RATE"]), int(cfg["RATE_DENOM"]))
+
+        self.state_exists = False
+        self.state = {
+            "total_eoses": 0,
+            "total_tokens": 0,
+            "start": 0,
+            "finish": 0,
+            "time": 0
+        }
+        self.deposits = {}
+        self.whitelist = set()
+        self.root = None
+        self.cursor = None
+        self.premints = {}
+        # rows and tokens premint issued, None until it is first called
+        self.preminted = None
+        # with INVESTOR_TABLE, deposit and whitelist rows written by a build without it
+        self.old_deposits = {}
+        self.old_whitelist = set()
+        self.migrated = False
+
+    def eos2tkn(self, eos):
+        return eos2tkn(eos, self.rate_num, self.rate_denom)
+
+    def now(self):
+        return self.state["time"] if self.debug else int(self.clock())
+
+    def require_auth(self, actor, account):
+        if actor is not None and actor != account:
+            raise AuthError("missing authority of " + account)
+
+    def changed(self):
+        # the destructor writes the singleton only after actions changing it
+        self.state_exists = True
+
+    def transfer(self, sender, receiver, amount, symbol=EOS_SYMBOL, memo=""):
+        check(amount > 0, "Transfer must be positive")
+        if sender != self.name:
+            check(symbol == EOS_SYMBOL, "Only EOS Deposits")
+            self.on_deposit(sender, amount, memo)
+
+    def check_proof(self, investor, memo):
+        check(self.root is not None, "Account not whitelisted")
+        check(len(memo) % 64 == 0 and all(c in string.hexdigits for c in memo), "Invalid whitelist proof")
+        check(merkle.verify(investor, memo, self.root), "Account not whitelisted")
+
+    def on_deposit(self, investor, amount, memo=""):
+        state = self.state
+        now = self.now()
+        check(now >= state["start"], "Crowdsale hasn't started")
+        check(now <= state["finish"], "Crowdsale finished")
+
+        check(amount >= self.min_contrib, "Contribution too low")
+        check(amount <= self.max_contrib or not self.max_contrib, "Contribution too high")
+        self.find_investor(investor)
+
+        if self.whitelist_enabled and investor not in self.whitelist:
+            check(self.whitelist_merkle, "Account not whitelisted")
+            # the investor row marks a proven account until unwhite, without it every deposit proves
+            self.check_proof(investor, memo)
+
+        tokens = self.eos2tkn(amount)
+        check(tokens > 0, "Contribution too low")
+        tokens_left = self.hard_cap - state["total_tokens"]
+        if tokens > tokens_left:
+            # accept the part fitting under the hard cap and send the rest back
+            check(tokens_left >= min_tokens(self.rate_num, self.rate_denom), "Hard cap reached")
+            accepted = tkn2eos(tokens_left, self.rate_num, self.rate_denom)
+            self.send(EOS_CONTRACT, "transfer", {
+                "sender": self.name,
+                "to": investor,
+                "symbol": EOS_SYMBOL,
+                "amount": amount - accepted,
+                "memo": "Hard cap reached"
+            })
+            amount = accepted
+            tokens = self.eos2tkn(accepted)
+
+        state["total_eoses"] += amount
+        state["total_tokens"] += tokens
+        if self.whitelist_enabled and self.investor_table:
+            self.whitelist.add(investor)
+
+        deposit = self.deposits.get(investor)
+        if deposit is None:
+            self.deposits[investor] = {"account": investor, "eoses": amount, "tokens": tokens}
+        else:
+            deposit["eoses"] += amount
+            deposit["tokens"] += tokens
+
+        # with LAZY_ISSUE tokens are only recorded and issued by claim or distribute
+        if not self.lazy_issue:
+            self.issue(investor, tokens)
+        self.changed()
+        return tokens
+
+    def init(self, start, finish, actor=None):
+        check(not self.state_exists, "Already initialized")
+        check(start < finish, "Start must be less than finish")
+        self.require_auth(actor, self.name)
+
+        self.state["start"] = start
+        self.state["finish"] = finish
+        # a new deployment has no rows of the old tables to migrate
+        if self.investor_table and not self.old_deposits and not self.old_whitelist:
+            self.migrated = True
+
+        for to, amount in self.mint:
+            self.send(self.contract, "issue", {
+                "to": to,
+                "symbol": self.symbol,
+                "amount": amount,
+                "memo": "Initial token distribution"
+            })
+        self.changed()
+
+    def addpremint(self, mints, actor=None):
+        self.require_auth(actor, self.name)
+        check(self.preminted is None, "Premint already started")
+        premints = dict(self.premints)
+        for mint in mints:
+            check(mint["tokens"] > 0, "Amount must be positive")
+            premints[mint["account"]] = mint["tokens"]
+        self.premints = premints
+
+    def premint(self, count, actor=None):
+        self.require_auth(actor, self.name)
+        check(count > 0, "Count must be positive")
+        check(self.premints, "Nothing to premint")
+        preminted = dict(self.preminted or {"issued": 0, "tokens": 0})
+        accounts = sorted(self.premints)[:count]
+        # the token supply holds the reserve besides the hard cap, more would take from the sale
+        tokens = sum(self.premints[account] for account in accounts)
+        check(tokens <= self.premint_reserve - preminted["tokens"], "Premint exceeds its reserve")
+        preminted["tokens"] += tokens
+        for account in accounts:
+            self.send(self.contract, "issue", {
+                "to": account,
+                "symbol": self.symbol,
+                "amount": self.premints.pop(account),
+                "memo": "Initial token distribution"
+            })
+            preminted["issued"] += 1
+        self.preminted = preminted
+
+    def setstart(self, start, actor=None):
+        check(self.now() <= self.state["start"], "Crowdsale already started")
+        self.require_auth(actor, self.issuer)
+        self.state["start"] = start
+        self.changed()
+
+    def setfinish(self, finish, actor=None):
+        check(self.now() <= self.state["finish"], "Crowdsale finished")
+        self.require_auth(actor, self.issuer)
+        self.state["finish"] = finish
+        self.changed()
+
+    def white(self, account, actor=None):
+        self.whitemany([account], actor)
+
+    def unwhite(self, account, actor=None):
+        self.unwhitemany([account], actor)
+
+    def whitemany(self, accounts, actor=None):
+        self.require_auth(actor, self.issuer)
+        check(self.whitelist_enabled, "Whitelist not enabled")
+        added = set()
+        for account in accounts:
+            self.find_investor(account)
+            check(account not in self.whitelist and account not in added, "Account already whitelisted")
+            added.add(account)
+        self.whitelist |= added
+
+    def unwhitemany(self, accounts, actor=None):
+        self.require_auth(actor, self.issuer)
+        check(self.whitelist_enabled, "Whitelist not enabled")
+        removed = set()
+        for account in accounts:
+            self.find_investor(account)
+            check(account in self.whitelist and account not in removed, "Account not whitelisted")
+            removed.add(account)
+        self.whitelist -= removed
+        if self.investor_table:
+            # an investor row left without deposit is erased
+            for account in removed:
+                deposit = self.deposits.get(account)
+                if deposit is not None and not deposit["eoses"] and not deposit["tokens"]:
+                    del self.deposits[account]
+
+    def setroot(self, root, actor=None):
+        self.require_auth(actor, self.issuer)
+        check(self.whitelist_merkle, "Merkle whitelist not enabled")
+        self.root = root.lower()
+
+    def issue(self, investor, tokens):
+        self.send(self.contract, "issue", {
+            "to": investor,
+            "symbol": self.symbol,
+            "amount": tokens,
+            "memo": "Crowdsale"
+        })
+
+    def finished(self):
+        state = self.state
+        return self.now() > state["finish"] \
+            or state["total_tokens"] + min_tokens(self.rate_num, self.rate_denom) > self.hard_cap
+
+    def finalize(self, actor=None):
+        state = self.state
+        check(self.finished(), "Crowdsale hasn't finished")
+        check(state["total_tokens"] >= self.soft_cap, "Softcap not reached")
+        check(not self.transferable, "There is no reason to call finalize")
+
+        self.send(self.contract, "unlock", {"symbol": self.symbol})
+
+    def withdraw(self, actor=None):
+        check(self.state["total_tokens"] >= self.soft_cap, "Softcap not reached")
+        self.require_auth(actor, self.issuer)
+
+        self.send(EOS_CONTRACT, "transfer", {
+            "sender": self.name,
+            "to": self.issuer,
+            "symbol": EOS_SYMBOL,
+            "amount": self.state["total_eoses"],
+            "memo": "Withdraw"
+        })
+        self.state["total_eoses"] = 0
+        self.changed()
+
+    def refund(self, investor, actor=None):
+        check(self.now() > self.state["finish"], "Crowdsale hasn't finished")
+        check(self.state["total_tokens"] < self.soft_cap, "Softcap reached")
+        self.require_auth(actor, investor)
+
+        self.find_investor(investor)
+        deposit = self.deposits.get(investor)
+        check(deposit is not None and (not self.investor_table or deposit["eoses"] or deposit["tokens"]),
+              "Nothing to refund")
+
+        self.send(EOS_CONTRACT, "transfer", {
+            "sender": self.name,
+            "to": investor,
+            "symbol": EOS_SYMBOL,
+            "amount": deposit["eoses"],
+            "memo": "Refund"
+        })
+        deposit["eoses"] = 0
+
+    def refundmany(self, count, actor=None):
+        check(self.now() > self.state["finish"], "Crowdsale hasn't finished")
+        check(self.state["total_tokens"] < self.soft_cap, "Softcap reached")
+        check(count > 0, "Count must be positive")
+        self.require_auth(actor, self.issuer)
+        check(not self.investor_table or not self.old_deposits, "Migration not finished")
+
+        def refund(account, deposit):
+            if deposit["eoses"] > 0:
+                self.send(EOS_CONTRACT, "transfer", {
+                    "sender": self.name,
+                    "to": account,
+                    "symbol": EOS_SYMBOL,
+                    "amount": deposit["eoses"],
+                    "memo": "Refund"
+                })
+                deposit["eoses"] = 0
+
+        self.walk(count, refund, "Nothing to refund")
+
+    def walk(self, count, visit, message):
+        """ Visit up to count deposits from the cursor and move it past them """
+        cursor = dict(self.cursor or {"next": "", "processed": 0, "done": False})
+        check(not cursor["done"], message)
+
+        # the investor table also holds rows of whitelisted accounts without deposits
+        accounts = sorted(self.deposits.keys() | self.whitelist if self.investor_table else self.deposits)
+        first = bisect.bisect_left(accounts, cursor["next"])
+        for account in accounts[first:first + count]:
+            if account in self.deposits:
+                visit(account, self.deposits[account])
+            cursor["processed"] += 1
+
+        rest = accounts[first + count:]
+        cursor["done"] = not rest
+        cursor["next"] = rest[0] if rest else ""
+        self.cursor = cursor
+
+    def claim(self, investor, actor=None):
+        check(self.lazy_issue, "Lazy issue not enabled")
+        check(self.finished(), "Crowdsale hasn't finished")
+        check(self.state["total_tokens"] >= self.soft_cap, "Softcap not reached")
+        self.require_auth(actor, investor)
+
+        self.find_investor(investor)
+        deposit = self.deposits.get(investor)
+        check(deposit is not None and deposit["tokens"] > 0, "Nothing to claim")
+        self.issue(investor, deposit["tokens"])
+        deposit["tokens"] = 0
+
+    def distribute(self, count, actor=None):
+        check(self.lazy_issue, "Lazy issue not enabled")
+        check(self.finished(), "Crowdsale hasn't finished")
+        check(self.state["total_tokens"] >= self.soft_cap, "Softcap not reached")
+        check(count > 0, "Count must be positive")
+        self.require_auth(actor, self.issuer)
+        check(not self.investor_table or not self.old_deposits, "Migration not finished")
+
+        def issue(account, deposit):
+            if deposit["tokens"] > 0:
+                self.issue(account, deposit["tokens"])
+                deposit["tokens"] = 0
+
+        self.walk(count, issue, "Nothing to claim")
+
+    def find_investor(self, account):
+        """ Move the old rows of the account into the investor table, as its first touch does """
+        if self.investor_table and not self.migrated and account not in self.deposits \
+                and account not in self.whitelist:
+            self.migrate_investor(account)
+
+    def migrate_investor(self, account):
+        deposit = self.old_deposits.pop(account, None)
+        whitelisted = self.whitelist_enabled and account in self.old_whitelist
+        # without WHITELIST the old whitelist rows are dropped
+        self.old_whitelist.discard(account)
+        if deposit is not None and (deposit["eoses"] or deposit["tokens"]):
+            row = self.deposits.setdefault(account, {"account": account, "eoses": 0, "tokens": 0})
+            row["eoses"] += deposit["eoses"]
+            row["tokens"] += deposit["tokens"]
+        if whitelisted:
+            self.whitelist.add(account)
+
+    def migrate(self, count, actor=None):
+        self.require_auth(actor, self.name)
+        check(self.investor_table, "Investor table not enabled")
+        check(self.old_deposits or self.old_whitelist, "Nothing to migrate")
+        for _ in range(count):
+            # deposits first, then the whitelist, each in primary key order
+            pending = self.old_deposits or self.old_whitelist
+            if not pending:
+                break
+            self.migrate_investor(min(pending))
+        if not self.old_deposits and not self.old_whitelist:
+            self.migrated = True
+
+    def settime(self, time):
+        check(self.debug, "Unknown action")
+        self.state["time"] = time
+        self.changed()
+
+    def table(self, name):
+        """ Rows as returned by get_table_rows, ordered by primary key """
+        if name == "state":
+            if not self.state_exists:
+                return []
+            row = dict(self.state)
+            if not self.debug:
+                del row["time"]
+            return [row]
+        if name == "investor" and not self.investor_table:
+            return []
+        if name == "deposit" and self.investor_table:
+            return [dict(self.old_deposits[account]) for account in sorted(self.old_deposits)]
+        if name == "whitelist" and self.investor_table:
+            return [{"account": account} for account in sorted(self.old_whitelist)]
+        if name == "migrated":
+            return [{"done": True}] if self.migrated else []
+        if name == "preminted":
+            return [dict(self.preminted)] if self.preminted is not None else []
+        if name == "deposit":
+            return [dict(self.deposits[account]) for account in sorted(self.deposits)]
+        if name == "whitelist":
+            return [{"account": account} for account in sorted(self.whitelist)]
+        if name == "investor":
+            empty = {"eoses": 0, "tokens": 0}
+            return [
+                dict(self.deposits.get(account, empty), account=account, whitelisted=account in self.whitelist)
+                for account in sorted(self.deposits.keys() | self.whitelist)
+            ]
+        if name == "root":
+            return [] if self.root is None else [{"root": self.root}]
+        if name == "cursor":
+            return [] if self.cursor is None else [dict(self.cursor)]
+        if name == "premint":
+            return [{"account": account, "tokens": self.premints[account]} for account in sorted(self.premints)]
+        raise KeyError(name)
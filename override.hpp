@@ -26,6 +26,6 @@ void crowdsale::transfer(uint64_t sender, uint64_t receiver) {
 	eosio_assert(data.quantity.is_valid(), "Invalid token transfer");
 	if (data.from != this->_self) {
 		eosio_assert(data.quantity.symbol == this->asset_eos.symbol, "Only EOS Deposits");
-		this->on_deposit(data.from, data.quantity);
+		this->on_deposit(data.from, data.quantity, data.memo);
 	}
 }
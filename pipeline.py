@@ -0,0 +1,253 @@
+import asyncio
+import json
+import struct
+import time
+import urllib.parse
+
+import abi
+
+
+# context free action cleos adds for --force-unique
+NONCE_ACCOUNT = "eosio.null"
+
+
+class Error(Exception):
+    """ Error reply of nodeos or keosd, message is the assertion message where there is one """
+
+    def __init__(self, status, reply):
+        self.status = status
+        self.json = reply
+        error = reply.get("error", {}) if isinstance(reply, dict) else {}
+        details = error.get("details") or [{}]
+        message = details[0].get("message") or error.get("what") or str(reply)
+        super().__init__(message.replace("assertion failure with message: ", ""))
+
+
+class Client:
+    """ JSON over keep-alive HTTP/1.1 connections, at most `connections` open at once """
+
+    def __init__(self, url, connections=16):
+        parts = urllib.parse.urlsplit(url if "://" in url else "http://" + url)
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == "https" else 80)
+        self.ssl = parts.scheme == "https"
+        self.slots = asyncio.Semaphore(connections)
+        self.idle = []
+
+    async def call(self, path, body=None):
+        payload = json.dumps(body if body is not None else {}).encode()
+        async with self.slots:
+            reused = bool(self.idle)
+            try:
+                status, data = await self.request(path, payload)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                # the server may close an idle connection, retry once on a fresh one
+                if not reused:
+                    raise
+                status, data = await self.request(path, payload)
+        reply = json.loads(data) if data.strip() else {}
+        if status != 200:
+            raise Error(status, reply)
+        return reply
+
+    async def request(self, path, payload):
+        if self.idle:
+            reader, writer = self.idle.pop()
+        else:
+            reader, writer = await asyncio.open_connection(self.host, self.port, ssl=self.ssl or None)
+        try:
+            writer.write("POST {} HTTP/1.1\r\nHost: {}\r\nContent-Type: application/json\r\n"
+                         "Content-Length: {}\r\n\r\n".format(path, self.host, len(payload)).encode() + payload)
+            await writer.drain()
+            line = await reader.readline()
+            if not line:
+                raise ConnectionResetError("connection closed by server")
+            version, status = line.decode().split(" ", 2)[:2]
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode().partition(":")
+                headers[name.strip().lower()] = value.strip()
+            if headers.get("transfer-encoding") == "chunked":
+                data = b""
+                while True:
+                    size = int((await reader.readline()).split(b";")[0], 16)
+                    chunk = await reader.readexactly(size + 2)
+                    if not size:
+                        break
+                    data += chunk[:-2]
+            else:
+                data = await reader.readexactly(int(headers.get("content-length", 0)))
+        except BaseException:
+            writer.close()
+            raise
+        if version == "HTTP/1.1" and headers.get("connection", "").lower() != "close":
+            self.idle.append((reader, writer))
+        else:
+            writer.close()
+        return int(status), data
+
+    def close(self):
+        for _, writer in self.idle:
+            writer.close()
+        self.idle = []
+
+
+class Signer:
+    """ Signatures of transactions by the keys the node requires of their authorizations """
+
+    def __init__(self):
+        self.required = {}
+
+    async def available_keys(self):
+        raise NotImplementedError
+
+    async def required_keys(self, node, transaction):
+        # the same authorizations need the same keys
+        auths = tuple(sorted({(a["actor"], a["permission"]) for action in transaction["actions"]
+                              for a in action["authorization"]}))
+        if auths not in self.required:
+            reply = await node.call("/v1/chain/get_required_keys",
+                                    {"transaction": transaction, "available_keys": await self.available_keys()})
+            self.required[auths] = reply["required_keys"]
+        return self.required[auths]
+
+    async def sign(self, node, transaction, packed, chain_id):
+        """ Signatures of the transaction, given as json and packed """
+        raise NotImplementedError
+
+
+class WalletSigner(Signer):
+    """ Signatures from keosd """
+
+    def __init__(self, wallet):
+        super().__init__()
+        self.wallet = wallet
+        self.keys = None
+
+    async def available_keys(self):
+        if self.keys is None:
+            self.keys = await self.wallet.call("/v1/wallet/get_public_keys")
+        return self.keys
+
+    async def sign(self, node, transaction, packed, chain_id):
+        keys = await self.required_keys(node, transaction)
+        signed = await self.wallet.call("/v1/wallet/sign_transaction", [transaction, keys, chain_id])
+        return signed["signatures"]
+
+
+class Pipeline:
+    """ Pack, sign and push transactions with at most `window` in flight
+
+    Instead of the random nonce of --force-unique every transaction carries
+    a per-account counter, so transactions of one account never collide and
+    the ones of different accounts differ by their authorization anyway.
+    """
+
+    def __init__(self, client, signer=None, window=256, expiration=60, refresh=10):
+        self.client = client
+        self.signer = signer
+        self.window = asyncio.Semaphore(window)
+        self.expiration = expiration
+        self.refresh = refresh
+        self.abis = {}
+        self.info = None
+        self.info_time = 0
+        self.info_lock = asyncio.Lock()
+        self.nonces = {}
+        # counters start from the time, so a rerun does not repeat transactions of the last one
+        self.epoch = int(time.time() * 1000000)
+
+    async def abi(self, account):
+        # the first caller fetches it, concurrent ones wait for the same task
+        if account not in self.abis:
+            self.abis[account] = asyncio.ensure_future(self.fetch_abi(account))
+        return await self.abis[account]
+
+    async def fetch_abi(self, account):
+        reply = await self.client.call("/v1/chain/get_abi", {"account_name": account})
+        return abi.Abi(reply["abi"])
+
+    async def header(self):
+        """ Reference block and expiration, get_info is asked again after `refresh` seconds """
+        async with self.info_lock:
+            now = time.time()
+            if self.info is None or now - self.info_time > self.refresh:
+                self.info = await self.client.call("/v1/chain/get_info")
+                self.info_time = now
+        block_id = bytes.fromhex(self.info["last_irreversible_block_id"])
+        return {
+            "expiration": int(now) + self.expiration,
+            "ref_block_num": self.info["last_irreversible_block_num"] & 0xffff,
+            "ref_block_prefix": struct.unpack("<I", block_id[8:12])[0],
+            "max_net_usage_words": 0,
+            "max_cpu_usage_ms": 0,
+            "delay_sec": 0
+        }
+
+    def nonce(self, actor):
+        self.nonces[actor] = self.nonces.get(actor, 0) + 1
+        return {
+            "account": NONCE_ACCOUNT,
+            "name": "nonce",
+            "authorization": [],
+            "data": struct.pack("<Q", self.epoch + self.nonces[actor]).hex()
+        }
+
+    async def transaction(self, actions):
+        packed = []
+        for action in actions:
+            data = action["data"]
+            if not isinstance(data, str):
+                data = (await self.abi(action["account"])).pack_action(action["name"], data).hex()
+            packed.append(dict(action, data=data))
+        return dict(await self.header(), context_free_actions=[self.nonce(actions[0]["authorization"][0]["actor"])],
+                    actions=packed, transaction_extensions=[])
+
+    async def prepare(self, actions):
+        """ push_transaction body of the signed transaction, it can be pushed until it expires """
+        transaction = await self.transaction(actions)
+        packed = abi.CHAIN_ABI.pack("transaction", transaction)
+        signatures = []
+        if self.signer:
+            readable = dict(transaction, expiration=time.strftime("%Y-%m-%dT%H:%M:%S",
+                                                                  time.gmtime(transaction["expiration"])))
+            signatures = await self.signer.sign(self.client, readable, packed, self.info["chain_id"])
+        return {
+            "signatures": signatures,
+            "compression": "none",
+            "packed_context_free_data": "",
+            "packed_trx": packed.hex()
+        }
+
+    async def send(self, body):
+        """ Push a body made by prepare """
+        async with self.window:
+            return await self.client.call("/v1/chain/push_transaction", body)
+
+    async def push(self, actions):
+        """ Result of push_transaction for actions as made by batch.action, raises Error """
+        async with self.window:
+            return await self.client.call("/v1/chain/push_transaction", await self.prepare(actions))
+
+    async def push_all(self, transactions):
+        """ Result or Error of every transaction, all of them pushed concurrently within the window """
+        return await asyncio.gather(*(self.push(actions) for actions in transactions), return_exceptions=True)
+
+
+def push_all(url, transactions, wallet=None, window=256, connections=16):
+    """ Blocking push_all for callers without an event loop """
+
+    async def run():
+        client = Client(url, connections)
+        signer = WalletSigner(Client(wallet, connections)) if wallet else None
+        try:
+            return await Pipeline(client, signer, window).push_all(transactions)
+        finally:
+            client.close()
+            if signer:
+                signer.wallet.close()
+
+    return asyncio.run(run())
@@ -0,0 +1,160 @@
+import argparse
+import csv
+import json
+import sys
+import time
+from decimal import Decimal, InvalidOperation
+
+import eosfactory.core.cleos as cleos
+import eosfactory.core.cleos_get as cleos_get
+import eosfactory.core.errors as errors
+
+import abi
+import config
+from batch import Batch, LIMIT_ERRORS
+
+
+def read_allocations(path, decimals):
+    """ Yield account,amount rows of the CSV as addpremint entries without reading the whole file
+
+    Amounts are in tokens, a first row with a non-numeric amount is skipped as header.
+    """
+    with open(path, newline="") as f:
+        for line, row in enumerate(csv.reader(f), 1):
+            if not row or not row[0].strip():
+                continue
+            account = row[0].strip()
+            try:
+                amount = Decimal(row[1].strip())
+            except (IndexError, InvalidOperation):
+                if line == 1:
+                    continue
+                raise ValueError("line {}: invalid amount".format(line))
+            tokens = amount.scaleb(decimals)
+            if tokens != tokens.to_integral_value() or tokens <= 0:
+                raise ValueError("line {}: amount must be positive with at most {} decimals".format(line, decimals))
+            try:
+                valid = abi.name_to_string(abi.string_to_name(account)) == account
+            except KeyError:
+                valid = False
+            if not valid:
+                raise ValueError("line {}: invalid account name {}".format(line, account))
+            yield {"account": account, "tokens": int(tokens)}
+
+
+def load(crowdsale, allocations, per_action=100, per_push=1000, progress=None):
+    """ Store allocations in the premint table with addpremint, per_action rows per action
+
+    Actions are pushed every per_push actions, so at most per_push * per_action
+    rows of the file are held in memory. The contract refuses a load once
+    premint was called, as rows it erased would be issued again; this is
+    checked before anything is sent.
+    """
+    issued = preminted(crowdsale)
+    if issued is not None:
+        raise ValueError("premint already issued {} rows, finish it with --issue instead of loading again".format(issued))
+    batch = Batch()
+    rows = 0
+    tokens = 0
+    mints = []
+    began = time.time()
+
+    def flush():
+        batch.add(crowdsale, "addpremint", {"mints": list(mints)}, crowdsale)
+        del mints[:]
+        if len(batch) >= per_push:
+            batch.push()
+            if progress:
+                progress(rows, time.time() - began)
+
+    for mint in allocations:
+        mints.append(mint)
+        rows += 1
+        tokens += mint["tokens"]
+        if len(mints) == per_action:
+            flush()
+    if mints:
+        flush()
+    if len(batch):
+        batch.push()
+
+    return {
+        "rows": rows,
+        "tokens": tokens,
+        "elapsed_s": time.time() - began
+    }
+
+
+def preminted(crowdsale):
+    """ Rows issued by premint so far, None before its first call """
+    rows = cleos_get.GetTable(str(crowdsale), "preminted", str(crowdsale), is_verbose=False).json["rows"]
+    return rows[0]["issued"] if rows else None
+
+
+def pending(crowdsale):
+    return len(cleos_get.GetTable(str(crowdsale), "premint", str(crowdsale), limit=1, is_verbose=False).json["rows"]) > 0
+
+
+def issue_all(crowdsale, count=100, progress=None):
+    """ Call premint until the premint table is empty
+
+    count is halved whenever a call does not fit into the transaction limits.
+    """
+    calls = 0
+    began = time.time()
+    while pending(crowdsale):
+        try:
+            cleos.PushAction(
+                str(crowdsale),
+                "premint",
+                json.dumps({"count": count}),
+                permission=str(crowdsale),
+                force_unique=1,
+                is_verbose=False
+            )
+        except errors.Error as e:
+            if count > 1 and any(error in str(e) for error in LIMIT_ERRORS):
+                count //= 2
+                continue
+            raise
+        calls += 1
+        if progress:
+            progress(calls, time.time() - began)
+
+    return {
+        "calls": calls,
+        "count": count,
+        "elapsed_s": time.time() - began
+    }
+
+
+def main():
+    cfg = config.load("config.h").defines()
+    parser = argparse.ArgumentParser(description="Load premint allocations from a CSV and issue them in chunks")
+    parser.add_argument("crowdsale", help="crowdsale contract account")
+    parser.add_argument("csv", nargs="?", help="CSV with account,amount rows, amounts in tokens")
+    parser.add_argument("-n", "--count", type=int, default=100, help="allocations per action")
+    parser.add_argument("--issue", action="store_true", help="issue the loaded allocations")
+    args = parser.parse_args()
+    if not args.csv and not args.issue:
+        parser.error("nothing to do, pass a CSV or --issue")
+
+    if args.csv:
+        try:
+            # premint stops at PREMINT_TKN, a list over it is refused before anything is stored
+            total = sum(mint["tokens"] for mint in read_allocations(args.csv, int(cfg["DECIMALS"])))
+            if total > int(cfg.get("PREMINT_TKN", 0)):
+                raise ValueError("allocations of {} exceed PREMINT_TKN {} of config.h".format(
+                    total, cfg.get("PREMINT_TKN", 0)))
+            report = load(args.crowdsale, read_allocations(args.csv, int(cfg["DECIMALS"])), args.count,
+                          progress=lambda rows, elapsed: print("{:>10} rows loaded".format(rows)))
+        except ValueError as e:
+            sys.exit(str(e))
+        print(json.dumps(report, indent=4))
+    if args.issue:
+        print(json.dumps(issue_all(args.crowdsale, args.count,
+                                   lambda calls, elapsed: print("{:>6} calls".format(calls))), indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import ecc
+import pipeline
+
+
+# nodeos rejects transactions expiring later than max_transaction_lifetime
+MAX_EXPIRATION = 3600
+
+
+def sign_packed(chain_id, packed, secrets):
+    """ Signatures of a packed transaction by every secret, run in the worker processes """
+    digest = ecc.transaction_digest(chain_id, packed)
+    return [ecc.sign_digest(digest, secret) for secret in secrets]
+
+
+class KeySigner(pipeline.Signer):
+    """ Signatures by private keys held in memory, made in a process pool when workers > 1
+
+    keys are [public, private] pairs as accounts.load_keys returns them.
+    """
+
+    def __init__(self, keys, workers=os.cpu_count()):
+        super().__init__()
+        self.secrets = {public: ecc.private_key_to_int(private) for public, private in keys}
+        # spawned, as forking a process that runs threads such as the http client may deadlock
+        self.pool = ProcessPoolExecutor(workers, multiprocessing.get_context("spawn")) if workers > 1 else None
+
+    async def available_keys(self):
+        return list(self.secrets)
+
+    async def sign(self, node, transaction, packed, chain_id):
+        secrets = [self.secrets[key] for key in await self.required_keys(node, transaction)]
+        if not self.pool:
+            return sign_packed(chain_id, packed, secrets)
+        return await asyncio.get_running_loop().run_in_executor(self.pool, sign_packed, chain_id, packed, secrets)
+
+    def close(self):
+        if self.pool:
+            self.pool.shutdown()
+
+
+def transfers(token, to, senders, quantity, count, memo=""):
+    """ count single transfer transactions, the senders in turn """
+    return [[{
+        "account": str(token),
+        "name": "transfer",
+        "authorization": [{"actor": senders[x % len(senders)], "permission": "active"}],
+        "data": {"from": senders[x % len(senders)], "to": str(to), "quantity": quantity, "memo": memo}
+    }] for x in range(count)]
+
+
+async def presign(pipe, transactions):
+    """ push_transaction bodies of the transactions, signed concurrently """
+    return await asyncio.gather(*(pipe.prepare(actions) for actions in transactions))
+
+
+def write(path, bodies):
+    with open(path, "w") as f:
+        for body in bodies:
+            f.write(json.dumps(body) + "\n")
+
+
+def read(path):
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+async def replay(pipe, bodies, rate=0):
+    """ Push the bodies at rate per second, 0 is as fast as the window allows
+
+    Returns (latency, result or Error) per body in order.
+    """
+    began = time.time()
+
+    async def send(x, body):
+        if rate:
+            await asyncio.sleep(max(0, began + x / rate - time.time()))
+        sent = time.time()
+        try:
+            result = await pipe.send(body)
+        except pipeline.Error as e:
+            result = e
+        return time.time() - sent, result
+
+    return await asyncio.gather(*(send(x, body) for x, body in enumerate(bodies)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sign deposit transfers ahead and push them later at a fixed rate")
+    parser.add_argument("--url", default="127.0.0.1:8888", help="nodeos http address")
+    parser.add_argument("--window", type=int, default=256, help="transactions in flight")
+    parser.add_argument("--connections", type=int, default=32, help="http connections to nodeos")
+    commands = parser.add_subparsers(dest="command")
+    sign = commands.add_parser("sign", help="write signed transfers to a file")
+    sign.add_argument("output", help="file of one push_transaction body per line")
+    sign.add_argument("-n", "--count", type=int, default=1000, help="number of transfers")
+    sign.add_argument("-k", "--buyers", type=int, default=100, help="senders named as bench_crowdsale.py names them")
+    sign.add_argument("--prefix", default="bench", help="prefix of the sender names")
+    sign.add_argument("--quantity", default="0.1000 EOS", help="quantity of every transfer")
+    sign.add_argument("--to", default="ico.deployer", help="crowdsale account")
+    sign.add_argument("--token", default="eosio.token", help="EOS token contract")
+    sign.add_argument("--keys", default=".keys.json", help="key pairs the senders were created with")
+    sign.add_argument("--expiration", type=int, default=MAX_EXPIRATION, help="seconds the transfers stay valid")
+    sign.add_argument("-j", "--workers", type=int, default=os.cpu_count(), help="signing processes")
+    push = commands.add_parser("replay", help="push signed transfers from a file")
+    push.add_argument("input", help="file written by sign")
+    push.add_argument("-r", "--rate", type=float, default=0, help="transactions per second, 0 is unlimited")
+    args = parser.parse_args()
+    if not args.command:
+        parser.error("sign or replay")
+
+    async def run():
+        client = pipeline.Client(args.url, args.connections)
+        try:
+            if args.command == "sign":
+                # accounts needs eosfactory, only for the names
+                from accounts import account_names
+                with open(args.keys) as f:
+                    signer = KeySigner(json.load(f), args.workers)
+                try:
+                    pipe = pipeline.Pipeline(client, signer, args.window, min(args.expiration, MAX_EXPIRATION))
+                    began = time.time()
+                    bodies = await presign(pipe, transfers(args.token, args.to, account_names(args.prefix, args.buyers),
+                                                           args.quantity, args.count))
+                finally:
+                    signer.close()
+                write(args.output, bodies)
+                print("signed {} transactions in {:.3f}s".format(len(bodies), time.time() - began))
+                return 0
+            bodies = list(read(args.input))
+            began = time.time()
+            results = await replay(pipeline.Pipeline(client, window=args.window), bodies, args.rate)
+            elapsed = time.time() - began
+        finally:
+            client.close()
+        rejected = {}
+        for _, result in results:
+            if isinstance(result, pipeline.Error):
+                rejected[str(result)] = rejected.get(str(result), 0) + 1
+        accepted = len(results) - sum(rejected.values())
+        print(json.dumps({
+            "transactions": len(results),
+            "accepted": accepted,
+            "rejected": rejected,
+            "elapsed_s": elapsed,
+            "accepted_tps": accepted / elapsed if elapsed else 0
+        }, indent=4))
+        return 0 if not rejected else 1
+
+    return asyncio.run(run())
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,31 @@
+#pragma once
+
+#include <eosiolib/types.h>
+
+#include "config.h"
+#include "pow10.h"
+
+// tokens = eoses * 10^DECIMALS * RATE / (10^4 * RATE_DENOM), rounded down
+// the fraction is reduced at compile time, the product is taken in 128 bits
+
+constexpr int128_t rate_gcd(int128_t a, int128_t b) {
+	return b == 0 ? a : rate_gcd(b, a % b);
+}
+
+constexpr int128_t RATE_NUM_FULL = (int128_t)POW10(DECIMALS) * RATE;
+constexpr int128_t RATE_DENOM_FULL = (int128_t)POW10(4) * RATE_DENOM;
+constexpr int128_t RATE_NUM_REDUCED = RATE_NUM_FULL / rate_gcd(RATE_NUM_FULL, RATE_DENOM_FULL);
+constexpr int128_t RATE_DENOM_REDUCED = RATE_DENOM_FULL / rate_gcd(RATE_NUM_FULL, RATE_DENOM_FULL);
+
+static_assert(RATE > 0 && RATE_DENOM > 0, "Rate must be positive");
+// int64 amount times the numerator must fit into int128
+static_assert(RATE_NUM_REDUCED < ((int128_t)1 << 64), "Rate numerator too big");
+static_assert(RATE_DENOM_REDUCED < ((int128_t)1 << 64), "Rate denominator too big");
+
+#define EOS2TKN(EOS) ((int128_t)(EOS) * RATE_NUM_REDUCED / RATE_DENOM_REDUCED)
+
+// largest eoses buying at most TKN tokens
+#define TKN2EOS(TKN) ((((int128_t)(TKN) + 1) * RATE_DENOM_REDUCED - 1) / RATE_NUM_REDUCED)
+
+// fewest tokens a deposit can buy, the sale is over once they do not fit under the hard cap
+#define MIN_TKN EOS2TKN((RATE_DENOM_REDUCED + RATE_NUM_REDUCED - 1) / RATE_NUM_REDUCED)
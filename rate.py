@@ -0,0 +1,26 @@
+import math
+
+
+EOS_DECIMALS = 4
+
+
+def rate_fraction(decimals, rate, rate_denom):
+    """ Reduced EOS to token rate, see rate.h """
+    num = 10 ** decimals * rate
+    denom = 10 ** EOS_DECIMALS * rate_denom
+    divisor = math.gcd(num, denom)
+    return num // divisor, denom // divisor
+
+
+def eos2tkn(eos, rate_num, rate_denom):
+    return eos * rate_num // rate_denom
+
+
+def tkn2eos(tokens, rate_num, rate_denom):
+    """ Largest eoses buying at most tokens """
+    return ((tokens + 1) * rate_denom - 1) // rate_num
+
+
+def min_tokens(rate_num, rate_denom):
+    """ Fewest tokens a deposit can buy """
+    return eos2tkn(-(-rate_denom // rate_num), rate_num, rate_denom)
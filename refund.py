@@ -0,0 +1,86 @@
+import argparse
+import json
+import time
+
+import eosfactory.core.cleos as cleos
+import eosfactory.core.cleos_get as cleos_get
+import eosfactory.core.errors as errors
+
+import config
+from batch import LIMIT_ERRORS
+
+
+def read_cursor(crowdsale):
+    rows = cleos_get.GetTable(str(crowdsale), "cursor", str(crowdsale), is_verbose=False).json["rows"]
+    return rows[0] if rows else {"next": "", "processed": 0, "done": False}
+
+
+def print_progress(cursor, calls, elapsed):
+    print("{:>6} calls {:>10} deposits {:>10.1f} deposits/s  next: {}".format(
+        calls, cursor["processed"], cursor["processed"] / elapsed if elapsed else 0, cursor["next"] or "-"))
+
+
+def walk_all(crowdsale, issuer, action, count=100, progress=None):
+    """ Call refundmany or distribute until the cursor walked every deposit
+
+    count is halved whenever a call does not fit into the transaction limits.
+    """
+    cursor = read_cursor(crowdsale)
+    processed = cursor["processed"]
+    calls = 0
+    began = time.time()
+    while not cursor["done"]:
+        try:
+            cleos.PushAction(
+                str(crowdsale),
+                action,
+                json.dumps({"count": count}),
+                permission=str(issuer),
+                force_unique=1,
+                is_verbose=False
+            )
+        except errors.Error as e:
+            if count > 1 and any(error in str(e) for error in LIMIT_ERRORS):
+                count //= 2
+                continue
+            raise
+        calls += 1
+        cursor = read_cursor(crowdsale)
+        if progress:
+            progress(cursor, calls, time.time() - began)
+
+    elapsed = time.time() - began
+    processed = cursor["processed"] - processed
+    return {
+        "processed": processed,
+        "calls": calls,
+        "count": count,
+        "elapsed_s": elapsed,
+        "deposits_per_s": processed / elapsed if elapsed else 0
+    }
+
+
+def refund_all(crowdsale, issuer, count=100, progress=None):
+    return walk_all(crowdsale, issuer, "refundmany", count, progress)
+
+
+def distribute_all(crowdsale, issuer, count=100, progress=None):
+    return walk_all(crowdsale, issuer, "distribute", count, progress)
+
+
+def main():
+    cfg = config.load("config.h").defines()
+    parser = argparse.ArgumentParser(
+        description="Refund every deposit of a failed crowdsale, or issue tokens of every deposit with LAZY_ISSUE")
+    parser.add_argument("crowdsale", help="crowdsale contract account")
+    parser.add_argument("--issuer", default=cfg["ISSUER"], help="issuer account, ISSUER of config.h by default")
+    parser.add_argument("-n", "--count", type=int, default=100, help="deposits per call")
+    parser.add_argument("--distribute", action="store_true", help="issue tokens after a successful sale")
+    args = parser.parse_args()
+
+    action = "distribute" if args.distribute else "refundmany"
+    print(json.dumps(walk_all(args.crowdsale, args.issuer, action, args.count, print_progress), indent=4))
+
+
+if __name__ == "__main__":
+    main()
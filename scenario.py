@@ -0,0 +1,99 @@
+import json
+
+from eosfactory.eosf import *
+
+from accounts import account_names, fund
+from instrument import Recorder
+from unittest_crowdsale import CrowdsaleTests
+
+
+BUYERS = 100
+DEPOSITS = 1000
+
+
+class Scenario(CrowdsaleTests):
+    """ Fixed run of every costly action of the crowdsale, measured by a Recorder """
+
+    def runTest(self):
+        pass
+
+    def run_refunds(self, recorder, buyers, deposits):
+        """ init, whitelisting, deposits below the soft cap from every buyer, refunds """
+        crowdsale = self.crowdsale_deployer_acc
+        eos_cent = max(self.min_contrib_eos_cent, 1)
+        per_buyer = -(-deposits // buyers)
+
+        recorder.push(crowdsale, "init", {"start": self.start_date, "finish": self.finish_date}, crowdsale)
+        self.crowdsale_contract.push_action("settime", json.dumps({"time": self.start_date}), crowdsale)
+
+        names = account_names("gate", buyers)
+        self.create_buyers_accounts(self.eosio_acc, buyers, names)
+        fund(self.system_token_deployer_acc, self.system_token_deployer_acc, names,
+             self.toAsset(eos_cent * per_buyer / 10 ** 4, 4, "EOS"))
+        if self.whitelist:
+            recorder.push(crowdsale, "white", {"account": names[0]}, self.issuer_acc)
+            recorder.push(crowdsale, "unwhite", {"account": names[0]}, self.issuer_acc)
+            recorder.push(crowdsale, "whitemany", {"accounts": names}, self.issuer_acc)
+            recorder.push(crowdsale, "unwhitemany", {"accounts": names}, self.issuer_acc)
+            recorder.push(crowdsale, "whitemany", {"accounts": names}, self.issuer_acc)
+
+        for x in range(deposits):
+            name = names[x % buyers]
+            recorder.push(self.system_token_deployer_acc, "transfer", {
+                "from": name,
+                "to": str(crowdsale),
+                "quantity": self.toAsset(eos_cent / 10 ** 4, 4, "EOS"),
+                "memo": ""
+            }, name)
+
+        self.crowdsale_contract.push_action("settime", json.dumps({"time": self.finish_date + 1}), crowdsale)
+        if self.soft_cap_tkn_cent > 0:
+            for name in names:
+                recorder.push(crowdsale, "refund", {"investor": name}, name)
+
+    def run_withdraw(self, recorder):
+        """ soft cap reached by one buyer, finalize, withdraw and claim """
+        crowdsale = self.crowdsale_deployer_acc
+        self.crowdsale_contract.push_action(
+            "init",
+            json.dumps({"start": self.start_date, "finish": self.finish_date}),
+            crowdsale
+        )
+        self.crowdsale_contract.push_action("settime", json.dumps({"time": self.start_date}), crowdsale)
+        create_account("gate_buyer", self.eosio_acc)
+        self.system_token_contract.push_action(
+            "issue",
+            json.dumps({
+                "to": gate_buyer.name,
+                "quantity": self.toAsset(self.hard_cap_eos, 4, "EOS"),
+                "memo": ""
+            }),
+            self.system_token_deployer_acc
+        )
+        if self.whitelist:
+            self.crowdsale_contract.push_action("white", json.dumps({"account": gate_buyer.name}), self.issuer_acc)
+        self.reach_cap(self.soft_cap_tkn_cent, gate_buyer)
+        self.crowdsale_contract.push_action("settime", json.dumps({"time": self.finish_date + 1}), crowdsale)
+        if not self.transferable:
+            recorder.push(crowdsale, "finalize", {}, self.issuer_acc)
+        recorder.push(crowdsale, "withdraw", {}, self.issuer_acc)
+        if self.lazy_issue:
+            recorder.push(crowdsale, "claim", {"investor": gate_buyer.name}, gate_buyer)
+
+
+def measure(buyers=BUYERS, deposits=DEPOSITS):
+    """ Recorder report per action of the scenario on the current build """
+    recorder = Recorder(ram_account="ico.deployer")
+    Scenario.setUpClass()
+    scenario = Scenario()
+    scenario.setUp()
+    try:
+        scenario.run_refunds(recorder, buyers, deposits)
+    finally:
+        scenario.tearDown()
+    scenario.setUp()
+    try:
+        scenario.run_withdraw(recorder)
+    finally:
+        scenario.tearDown()
+    return recorder.report()
@@ -0,0 +1,130 @@
+import argparse
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+import traceback
+import unittest
+
+
+HTTP_PORT = 8900
+P2P_PORT = 9900
+SHARD_DIR = ".shards"
+
+
+def configure_node(index, root):
+    """ Point eosfactory of this process at its own nodeos port and data directory """
+    import eosfactory.core.config as eosf_config
+    import eosfactory.core.manager as manager
+    import eosfactory.core.teos as teos
+
+    address = "127.0.0.1:{}".format(HTTP_PORT + index)
+    p2p_address = "127.0.0.1:{}".format(P2P_PORT + index)
+    data_dir = os.path.abspath(os.path.join(root, "node{}".format(index), "data")) + "/"
+    os.makedirs(data_dir, exist_ok=True)
+
+    eosf_config.http_server_address = lambda: address
+    eosf_config.data_dir = lambda: data_dir
+
+    args = teos.args
+
+    def shard_args(clear=False):
+        return args(clear) + ["--p2p-listen-endpoint", p2p_address]
+
+    def shard_pid(name=None):
+        # only the nodeos of this shard, stop() must not kill the others
+        p = subprocess.run(["pgrep", "-f", "http-server-address " + address], stdout=subprocess.PIPE)
+        return [int(pid) for pid in p.stdout.split()]
+
+    teos.args = shard_args
+    teos.get_pid = shard_pid
+    # keosd is shared by all shards, wallet files are separated by the node address prefix
+    manager.kill_keosd = lambda: None
+
+
+class ShardResult(unittest.TestResult):
+    """ Test result that stops every shard after the first failure in any of them """
+
+    def __init__(self, failed):
+        self.failed = failed
+        super().__init__()
+
+    @property
+    def shouldStop(self):
+        return self.failed.is_set()
+
+    @shouldStop.setter
+    def shouldStop(self, value):
+        if value:
+            self.failed.set()
+
+    def addFailure(self, test, err):
+        super().addFailure(test, err)
+        self.failed.set()
+
+
+def run_shard(args):
+    index, names, root, failed = args
+    configure_node(index, root)
+
+    from eosfactory.eosf import verbosity
+    verbosity([])
+    import unittest_crowdsale
+
+    suite = unittest.TestSuite(unittest_crowdsale.CrowdsaleTests(name) for name in names)
+    result = ShardResult(failed)
+    try:
+        suite.run(result)
+    except Exception:
+        result.errors.append((None, traceback.format_exc()))
+    return {
+        "shard": index,
+        "run": result.testsRun,
+        "failures": [(str(test), err) for test, err in result.failures],
+        "errors": [(str(test), err) for test, err in result.errors],
+        "skipped": [(str(test), reason) for test, reason in result.skipped]
+    }
+
+
+def split(names, count):
+    return [names[i::count] for i in range(count) if names[i::count]]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--nodes", type=int, default=os.cpu_count(), help="number of local nodes")
+    parser.add_argument("--dir", default=SHARD_DIR, help="root of the node data directories")
+    parser.add_argument("tests", nargs="*", help="test names, all CrowdsaleTests by default")
+    args = parser.parse_args()
+
+    import unittest_crowdsale
+    names = args.tests or unittest.TestLoader().getTestCaseNames(unittest_crowdsale.CrowdsaleTests)
+    shards = split(list(names), max(1, args.nodes))
+
+    began = time.time()
+    with multiprocessing.Manager() as manager:
+        failed = manager.Event()
+        with multiprocessing.Pool(len(shards), maxtasksperchild=1) as pool:
+            results = pool.map(run_shard, [(i, shard, args.dir, failed) for i, shard in enumerate(shards)], 1)
+
+    run = sum(r["run"] for r in results)
+    failures = [f for r in results for f in r["failures"]]
+    errors = [e for r in results for e in r["errors"]]
+    for kind, items in (("FAIL", failures), ("ERROR", errors)):
+        for test, err in items:
+            print("=" * 70)
+            print("{}: {}".format(kind, test))
+            print("-" * 70)
+            print(err)
+    print("-" * 70)
+    print("Ran {} tests on {} nodes in {:.3f}s".format(run, len(shards), time.time() - began))
+    if failures or errors:
+        print("\nFAILED (failures={}, errors={})".format(len(failures), len(errors)))
+        return 1
+    print("\nOK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
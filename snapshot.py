@@ -0,0 +1,78 @@
+import os
+import shutil
+
+import eosfactory.core.config as config
+import eosfactory.core.setup as setup
+import eosfactory.core.cleos as cleos
+import eosfactory.core.manager as manager
+
+from buildcache import files_hash
+
+
+SNAPSHOT_DIR = ".snapshots"
+
+
+def contract_files(contract_dir_hint):
+    """ WASM and ABI deployed by eosfactory for a contract name like eosio.token """
+    path = config.contract_dir(contract_dir_hint)
+    return [os.path.join(path, config.wasm_file(path)), os.path.join(path, config.abi_file(path))]
+
+
+class Snapshot:
+    """ Post-deploy chain state of the local node, keyed on the files it was built from """
+
+    def __init__(self, files, extra=(), root=SNAPSHOT_DIR):
+        self.files = files
+        self.extra = extra
+        self.root = root
+
+    @property
+    def path(self):
+        # wallet files are named after the node address, so it is a part of the key
+        cleos.set_local_nodeos_address_if_none()
+        key = files_hash(self.files, tuple(self.extra) + (setup.file_prefix(),))
+        return os.path.join(self.root, key[:16])
+
+    def exists(self):
+        return os.path.exists(os.path.join(self.path, "done"))
+
+    def save(self):
+        path = self.path
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(os.path.join(path, "wallet"))
+
+        # nodeos must be stopped for its state database to be consistent
+        manager.stop()
+        shutil.copytree(config.data_dir(), os.path.join(path, "data"))
+        wallet_dir = config.keosd_wallet_dir()
+        for file in os.listdir(wallet_dir):
+            if file.startswith(setup.file_prefix()):
+                shutil.copy2(os.path.join(wallet_dir, file), os.path.join(path, "wallet"))
+        manager.resume()
+
+        open(os.path.join(path, "done"), "w").close()
+
+    def restore(self):
+        if not self.exists():
+            return False
+        path = self.path
+
+        # stop the node and drop the account objects of the previous test
+        manager.reboot()
+        cleos.set_local_nodeos_address_if_none()
+
+        # keosd keeps the wallet files open, they are replaced while it is down
+        manager.kill_keosd()
+        wallet_dir = config.keosd_wallet_dir()
+        for file in os.listdir(wallet_dir):
+            if file.startswith(setup.file_prefix()):
+                os.remove(os.path.join(wallet_dir, file))
+        for file in os.listdir(os.path.join(path, "wallet")):
+            shutil.copy2(os.path.join(path, "wallet", file), wallet_dir)
+
+        data_dir = config.data_dir()
+        shutil.rmtree(data_dir, ignore_errors=True)
+        shutil.copytree(os.path.join(path, "data"), data_dir)
+
+        manager.resume()
+        return True
@@ -0,0 +1,131 @@
+import argparse
+import json
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import abi
+
+
+DEFAULT_URL = "http://127.0.0.1:8888"
+
+
+def row_key(row):
+    """ Primary key of crowdsale rows and token balances """
+    if "account" in row:
+        return abi.string_to_name(row["account"])
+    if "balance" in row:
+        # symbol code, the symbol without its precision byte
+        return abi.string_to_symbol(0, abi.parse_asset(row["balance"])[2]) >> 8
+    raise KeyError("no primary key in row")
+
+
+class Reader:
+    """ get_table_rows client paging with lower_bound
+
+    Whole tables are cached until clear, which the caller runs after every
+    write: several transactions can land in one block, so the head block
+    does not tell a stale table from a fresh one.
+    """
+
+    def __init__(self, url=DEFAULT_URL, page=1000, workers=16):
+        self.url = url.rstrip("/")
+        if "://" not in self.url:
+            self.url = "http://" + self.url
+        self.page = page
+        self.workers = workers
+        self.cache = {}
+
+    def call(self, endpoint, body):
+        request = urllib.request.Request(self.url + "/v1/chain/" + endpoint, json.dumps(body).encode())
+        with urllib.request.urlopen(request) as response:
+            return json.loads(response.read())
+
+    def clear(self):
+        """ Drop the cached tables, the next reads fetch them again """
+        self.cache = {}
+
+    def rows(self, code, scope, table, key=row_key):
+        """ Yield rows page by page, the next page starts past the last primary key """
+        lower_bound = ""
+        while True:
+            result = self.call("get_table_rows", {
+                "code": str(code),
+                "scope": str(scope),
+                "table": table,
+                "json": True,
+                "lower_bound": lower_bound,
+                "limit": self.page
+            })
+            yield from result["rows"]
+            if not result["more"] or not result["rows"]:
+                return
+            lower_bound = result.get("next_key") or str(key(result["rows"][-1]) + 1)
+
+    def table(self, code, scope, table, key=row_key):
+        return self.cached(code, scope, table, key)
+
+    def cached(self, code, scope, table, key=row_key):
+        name = (str(code), str(scope), table)
+        if name not in self.cache:
+            self.cache[name] = list(self.rows(code, scope, table, key))
+        return self.cache[name]
+
+    def tables(self, code, scopes, table, key=row_key):
+        """ Rows of the table in every scope, fetched concurrently """
+        scopes = [str(scope) for scope in scopes]
+        with ThreadPoolExecutor(self.workers) as pool:
+            return dict(zip(scopes, pool.map(lambda scope: self.cached(code, scope, table, key), scopes)))
+
+    def state(self, crowdsale):
+        rows = self.table(crowdsale, crowdsale, "state")
+        return rows[0] if rows else None
+
+    def deposits(self, crowdsale):
+        return self.table(crowdsale, crowdsale, "deposit")
+
+    def whitelist(self, crowdsale):
+        return self.table(crowdsale, crowdsale, "whitelist")
+
+    def balances(self, code, owners, symbol):
+        """ Amount of the symbol held by every owner, 0 without a balance row """
+        balances = {}
+        for owner, rows in self.tables(code, owners, "accounts").items():
+            balances[owner] = 0
+            for row in rows:
+                amount, _, code_name = abi.parse_asset(row["balance"])
+                if code_name == symbol:
+                    balances[owner] = amount
+        return balances
+
+
+def audit(reader, crowdsale, table="deposit"):
+    """ Totals of the deposit rows next to the totals in state
+
+    Investor rows of accounts only whitelisted, without eoses or tokens,
+    are not counted. Refunded deposits are, with their tokens left.
+    """
+    rows = 0
+    eoses = 0
+    tokens = 0
+    for row in reader.rows(crowdsale, crowdsale, table):
+        if not row["eoses"] and not row["tokens"]:
+            continue
+        rows += 1
+        eoses += row["eoses"]
+        tokens += row["tokens"]
+    return {"rows": rows, "eoses": eoses, "tokens": tokens, "state": reader.state(crowdsale)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sum the deposits of a crowdsale page by page")
+    parser.add_argument("crowdsale", help="crowdsale contract account")
+    parser.add_argument("--url", default=DEFAULT_URL, help="nodeos http address")
+    parser.add_argument("--table", default="deposit", choices=["deposit", "investor"], help="table holding the deposits")
+    parser.add_argument("--page", type=int, default=1000, help="rows per request")
+    args = parser.parse_args()
+
+    print(json.dumps(audit(Reader(args.url, args.page), args.crowdsale, args.table), indent=4))
+
+
+if __name__ == "__main__":
+    main()
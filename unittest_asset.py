@@ -0,0 +1,71 @@
+import random
+import unittest
+from decimal import Decimal, ROUND_FLOOR
+
+import abi
+import asset
+from asset import Asset, EOS
+
+
+class AssetTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.random = random.Random(0)
+
+    def amounts(self):
+        yield 0
+        yield 1
+        yield -1
+        for _ in range(200):
+            yield self.random.randint(-10 ** 15, 10 ** 15)
+
+    def test_01(self):
+        # formatted like the contract, parsed back to the same units
+        for precision in range(19):
+            symbol = asset.symbol("TKN", precision)
+            for amount in self.amounts():
+                s = str(Asset(amount, symbol))
+                assert (s == abi.format_asset(amount, precision, "TKN"))
+                assert (Asset.parse(s) == Asset(amount, symbol))
+                assert (Asset.parse(s).symbol is symbol)
+                assert (Asset.parse(s).to_decimal() == Decimal(s.split(" ")[0]))
+
+    def test_02(self):
+        # floats are exact by their repr, where ceil(amount * 10 ** 4) was one unit off
+        assert (Asset.from_number(0.0051, EOS).amount == 51)
+        assert (Asset.from_number(0.0102, EOS).amount == 102)
+        assert (Asset.from_number(0.00001, EOS).amount == 1)
+        assert (Asset.from_number(0.00001, EOS, ROUND_FLOOR).amount == 0)
+        assert (Asset.from_number(460000000000000, EOS).amount == 4600000000000000000)
+        assert (Asset.from_number("2.9", asset.symbol("TKN", 0)).amount == 3)
+
+    def test_03(self):
+        # arithmetic and ordering only within a symbol
+        a = Asset.parse("1.5000 EOS")
+        b = Asset.parse("0.2500 EOS")
+        assert (str(a + b) == "1.7500 EOS")
+        assert (str(b - a) == "-1.2500 EOS")
+        assert (b < a and -a < b)
+        assert (a != Asset.parse("1.5000 TKN"))
+        with self.assertRaises(ValueError):
+            a + Asset.parse("1.5000 TKN")
+        with self.assertRaises(ValueError):
+            a < Asset.parse("1.50 EOS")
+
+    def test_04(self):
+        # bulk conversion matches the single one
+        for precision in (0, 4, 8):
+            symbol = asset.symbol("TKN", precision)
+            amounts = list(self.amounts())
+            strings = asset.format_many(amounts, symbol)
+            assert (strings == [str(Asset(amount, symbol)) for amount in amounts])
+            assert (asset.parse_many(strings, symbol) == amounts)
+            positive = [abs(amount) for amount in amounts]
+            assert (asset.parse_many(asset.format_many(positive, symbol)) == positive)
+        with self.assertRaises(ValueError):
+            asset.parse_many(["1.0000 EOS", "1.00 EOS"], EOS)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import config
+from model import eos2tkn
+
+
+class ConfigTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.cfg = config.read('config.h')
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "config.h")
+        shutil.copy("config.h", self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_01(self):
+        # defines round trip to the same config.h text
+        cfg = config.load(self.path)
+        assert (cfg.defines() == self.cfg)
+        with open("config.h") as f:
+            assert (config.emit(cfg.defines()) == f.read())
+
+    def test_02(self):
+        # exact caps in EOS as the contract prices them
+        cfg = config.load(self.path)
+        num, denom = cfg.rate_num_reduced, cfg.rate_denom_reduced
+        assert (eos2tkn(cfg.hard_cap_eos, num, denom) >= cfg.hard_cap)
+        assert (eos2tkn(cfg.hard_cap_eos - 1, num, denom) < cfg.hard_cap)
+        assert (eos2tkn(cfg.soft_cap_eos, num, denom) <= cfg.soft_cap)
+        assert (cfg.max_supply == cfg.hard_cap + cfg.premint + sum(value for _, value in cfg.mint))
+
+    def test_03(self):
+        # cached until the file changes
+        cfg = config.load(self.path)
+        assert (config.load(self.path) is cfg)
+        changed = dict(self.cfg, RATE=str(int(self.cfg["RATE"]) * 2))
+        config.write(changed, self.path)
+        os.utime(self.path, ns=(0, 0))
+        assert (config.load(self.path).rate == cfg.rate * 2)
+        with self.assertRaises(AttributeError):
+            cfg.rate = 1
+
+    def test_04(self):
+        # amounts the contract would overflow on
+        for overrides, message in [
+            ({"HARD_CAP_TKN": str(1 << 62)}, "Hard cap, premint and mint exceed the maximum token supply"),
+            ({"PREMINT_TKN": str(1 << 62)}, "Hard cap, premint and mint exceed the maximum token supply"),
+            ({"PREMINT_TKN": "-1"}, "Premint reserve must not be negative"),
+            ({"DECIMALS": "18", "RATE": str(10 ** 6), "RATE_DENOM": "1"}, "Rate numerator too big"),
+            ({"RATE": "1", "RATE_DENOM": str(10 ** 12), "HARD_CAP_TKN": str(10 ** 12)},
+             "Hard cap costs more EOS than an asset holds"),
+            ({"SOFT_CAP_TKN": str(int(self.cfg["HARD_CAP_TKN"]) + 1)}, "Soft cap exceeds hard cap"),
+            ({"RATE": "0"}, "Rate must be positive")
+        ]:
+            with self.assertRaises(ValueError) as context:
+                config.Config.from_defines(dict(self.cfg, **overrides))
+            assert (str(context.exception) == message)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,13 +1,37 @@
 import json
 from eosfactory.eosf import *
+import eosfactory.core.config as eosf_config
 from termcolor import cprint
 #import node
 import unittest
-import re
 from decimal import Decimal
 from math import ceil
 import argparse
 import warnings
+import os
+import sys
+import tempfile
+from snapshot import Snapshot, contract_files
+from batch import Batch
+import abi
+import accounts
+import asset
+import buildcache
+import config
+import localnode
+from asset import Asset
+from model import eos2tkn, min_tokens
+import instrument
+import merkle
+import tables
+from refund import refund_all, distribute_all
+import premint
+
+
+# in-memory localnode.Node replacing nodeos, set with --localnode
+node = None
+# instrument.Recorder of every push_action, set with --instrument
+recorder = None
 
 
 class CrowdsaleTests(unittest.TestCase):
@@ -22,35 +46,46 @@ class CrowdsaleTests(unittest.TestCase):
 
     @classmethod
     def setUpClass(cls):
-        cls.cfg = {}
-        with open('config.h', 'r') as cfg_file:
-            for line in cfg_file.readlines():
-                match = re.search('#define (\w+) ([\w.]+)', line)
-                if match:
-                    cls.cfg[match.group(1)] = match.group(2)
-
-        cls.issuer_acc_name = cls.cfg["ISSUER"]
-        cls.symbol = cls.cfg["SYMBOL"]
-        cls.decimals = int(cls.cfg["DECIMALS"])
-        cls.whitelist = bool(cls.cfg["WHITELIST"] == "true")
-        cls.transferable = bool(cls.cfg["TRANSFERABLE"] == "true")
-        cls.rate = int(cls.cfg["RATE"]) / int(cls.cfg["RATE_DENOM"])
-        cls.min_contrib_eos_cent = int(cls.cfg["MIN_CONTRIB"])
+        cls.config = config.load('config.h')
+        cls.cfg = cls.config.defines()
+
+        cls.issuer_acc_name = cls.config.issuer
+        cls.symbol = cls.config.symbol
+        cls.decimals = cls.config.decimals
+        cls.whitelist = cls.config.whitelist
+        cls.whitelist_merkle = cls.config.whitelist_merkle
+        cls.lazy_issue = cls.config.lazy_issue
+        cls.transferable = cls.config.transferable
+        cls.rate_num, cls.rate_denom = cls.config.rate_num_reduced, cls.config.rate_denom_reduced
+        cls.min_contrib_eos_cent = cls.config.min_contrib
         cls.min_contrib_eos = cls.min_contrib_eos_cent / 10 ** 4
-        cls.max_contrib_eos_cent = int(cls.cfg["MAX_CONTRIB"])
+        cls.max_contrib_eos_cent = cls.config.max_contrib
         cls.max_contrib_eos = cls.max_contrib_eos_cent / 10 ** 4
-        cls.soft_cap_tkn_cent = int(cls.cfg["SOFT_CAP_TKN"])
-        cls.soft_cap_tkn = cls.soft_cap_tkn_cent / 10 ** cls.decimals
-        cls.soft_cap_eos_cent = int(cls.soft_cap_tkn / cls.rate * 10 ** 4)
+        cls.soft_cap_tkn_cent = cls.config.soft_cap
+        cls.soft_cap_eos_cent = cls.config.soft_cap_eos
         cls.soft_cap_eos = cls.soft_cap_eos_cent / 10 ** 4
-        cls.hard_cap_tkn_cent = int(cls.cfg["HARD_CAP_TKN"])
-        cls.hard_cap_tkn = cls.hard_cap_tkn_cent / 10 ** cls.decimals
-        cls.hard_cap_eos_cent = ceil(cls.hard_cap_tkn / cls.rate * 10 ** 4)
+        cls.hard_cap_tkn_cent = cls.config.hard_cap
+        cls.hard_cap_eos_cent = cls.config.hard_cap_eos
         cls.hard_cap_eos = cls.hard_cap_eos_cent / 10 ** 4
         cls.start_date = 1534780454
         cls.finish_date = 1534781454
-        cls.token_deployer_acc_name = cls.cfg["CONTRACT"]
-        cls.mintcnt = int(cls.cfg["MINTCNT"])
+        cls.token_deployer_acc_name = cls.config.contract
+        cls.mintcnt = len(cls.config.mint)
+        if node:
+            cls.snapshot = localnode.Snapshot(node)
+        else:
+            # deploy the outputs built from the current sources, taken from the build cache if needed
+            for target in ("eosiotoken", "crowdsale"):
+                if not buildcache.restore(target):
+                    raise RuntimeError("{} sources changed, run make build".format(target))
+            # the system token comes with eosfactory, a new version of it deploys a different chain
+            cls.snapshot = Snapshot([
+                "config.h",
+                "crowdsale/crowdsale.wasm",
+                "crowdsale/crowdsale.debug.abi",
+                "eosiotoken/eosio.token/eosio.token.wasm",
+                "eosiotoken/eosio.token/eosio.token.abi"
+            ] + contract_files("eosio.token"))
 
     @classmethod
     def tearDownClass(cls):
@@ -64,10 +99,15 @@ class CrowdsaleTests(unittest.TestCase):
     @ignore_warnings
     def setUp(self):
         empty_hash = "code hash: 0000000000000000000000000000000000000000000000000000000000000000"
-        # start node
-        reset()
+        # restore deployed state or start clean node
+        restored = self.snapshot.restore()
+        if not restored:
+            reset()
+
+        # balances of many accounts are read concurrently, by a reader of this test so no cache outlives a restore
+        self.reader = tables.Reader(eosf_config.http_server_address())
 
-        # create wallet
+        # create wallet, restores account objects from snapshot
         create_wallet()
 
         # create eosio account
@@ -77,12 +117,10 @@ class CrowdsaleTests(unittest.TestCase):
         create_account("issuer_acc", master, self.issuer_acc_name)
         self.issuer_acc = issuer_acc
 
-        # create MINTDEST accounts
-        for x in range(self.mintcnt):
-            dest_acc_name = self.cfg["MINTDEST" + str(x)]
-            if dest_acc_name not in manager.account_map():
-                dest = create_account("mintdest_acc{}".format(x), master, dest_acc_name)
-                #self.wallet.import_key(dest)
+        # create MINTDEST accounts in one transaction, the snapshot has them already
+        if not restored:
+            dests = [self.cfg["MINTDEST" + str(x)] for x in range(self.mintcnt)]
+            accounts.create_accounts(master, [dest for dest in dests if dest not in manager.account_map()])
 
         # create system token deployer account
         create_account("eosio_token", self.eosio_acc, "eosio.token")
@@ -111,19 +149,35 @@ class CrowdsaleTests(unittest.TestCase):
             abi_file="eosio.token.abi",
             wasm_file="eosio.token.wasm"
         )
-        #self.system_token_contract.build()
-        self.system_token_contract.deploy()
-        #deployment_system_token_contract = self.system_token_contract.deploy()
-
 
-        # deploy custom eosio.token contract
+        # custom eosio.token contract
         self.token_contract = Contract(
             self.token_deployer_acc,
-            "eosio-crowdsale/eosiotoken/eosio.token",
+            os.path.abspath("eosiotoken/eosio.token"),
             abi_file='eosio.token.abi',
             wasm_file='eosio.token.wasm'
         )
 
+        # crowdsale contract
+        self.crowdsale_contract = Contract(
+            self.crowdsale_deployer_acc,
+            os.path.abspath("crowdsale"),
+            abi_file='crowdsale.debug.abi',
+            wasm_file='crowdsale.wasm'
+        )
+
+        if recorder:
+            for contract in (self.system_token_contract, self.token_contract, self.crowdsale_contract):
+                recorder.wrap(contract)
+
+        if restored:
+            return
+
+        #self.system_token_contract.build()
+        self.system_token_contract.deploy()
+        #deployment_system_token_contract = self.system_token_contract.deploy()
+
+        # deploy custom eosio.token contract
         deployment_token = self.token_contract.deploy()
 
         # create system eos asset
@@ -137,34 +191,25 @@ class CrowdsaleTests(unittest.TestCase):
         )
 
         # create custom token asset
-        max_supply = self.hard_cap_tkn_cent
-        for x in range(self.mintcnt):
-            max_supply += int(self.cfg["MINTVAL" + str(x)])
-        max_supply /= 10 ** self.decimals
-
         self.token_contract.push_action(
             "create",
             json.dumps({
                 "issuer": str(self.crowdsale_deployer_acc),
-                "maximum_supply": self.toAsset(max_supply, self.decimals, self.symbol),
+                "maximum_supply": str(Asset(self.config.max_supply, asset.symbol(self.symbol, self.decimals))),
                 "lock": not self.transferable
             }),
             self.token_deployer_acc
         )
 
         # deploy crowdsale contract
-        self.crowdsale_contract = Contract(
-            self.crowdsale_deployer_acc,
-            "eosio-crowdsale/crowdsale",
-            abi_file='crowdsale.debug.abi',
-            wasm_file='crowdsale.wasm'
-        )
-
         deployment_crowdsale = self.crowdsale_contract.deploy()
 
         # set eosio.code permission
         self.addEosioCodePermission(self.crowdsale_deployer_acc)
 
+        # save deployed state for the next tests and reruns
+        self.snapshot.save()
+
     def addEosioCodePermission(self, account):
         self.eosio_acc.push_action(
             "updateauth",
@@ -196,81 +241,40 @@ class CrowdsaleTests(unittest.TestCase):
         )
 
     def toAsset(self, amount, decimals, symbol):
-        amount = ceil(amount * 10 ** decimals) / 10 ** decimals
-        return str(Decimal(amount).quantize(Decimal('1.' + '0' * int(decimals)))) + " " + symbol
+        return str(Asset.from_number(amount, asset.symbol(symbol, decimals)))
 
-    def fromAsset(self, asset):
-        dictionary = {}
-        split = asset.split(" ")
-        dictionary["amount"] = float(split[0])
-        dictionary["symbol"] = split[1]
-        dictionary["decimals"] = len(split[0].split(".")[1])
-        return dictionary
+    def toTokens(self, eos):
+        """ Tokens in cents the contract gives for the EOS amount sent with toAsset """
+        return eos2tkn(Asset.from_number(eos, asset.EOS).amount, self.rate_num, self.rate_denom)
 
-    def reach_cap(self, cap_tkn_cent, buyer_acc):
-        contributed = 0
-        #print(cap_tkn_cent)
-        eos_to_transfer = cap_tkn_cent / 10 ** self.decimals / self.rate
-        if self.max_contrib_eos > 0:
-            eos_to_transfer = self.max_contrib_eos
-            times = int(cap_tkn_cent / 10 ** self.decimals / self.rate / eos_to_transfer)
+    def balance(self, contract, owner):
+        """ Asset of the first balance row of the owner """
+        return Asset.parse(contract.table("accounts", owner).json["rows"][0]["balance"])
 
-            #print(eos_to_transfer)
-            #print(times)
-            for x in range(times):
-                self.system_token_contract.push_action(
-                    "transfer",
-                    json.dumps({
-                        "from": str(buyer_acc),
-                        "to": str(self.crowdsale_deployer_acc),
-                        "quantity": self.toAsset(eos_to_transfer, 4, "EOS"),
-                        "memo": ""
-                    }),
-                    buyer_acc,
-                    forceUnique=1
-                )
-                contributed += eos_to_transfer
-
-            remain_eos_to_cap = (cap_tkn_cent - contributed * self.rate * 10 ** self.decimals) \
-                                / 10 ** self.decimals / self.rate
-            if remain_eos_to_cap > 0:
-                if remain_eos_to_cap > self.min_contrib_eos or self.min_contrib_eos == 0:
-                    if int((contributed + eos_to_transfer) * self.rate * 10 ** self.decimals) > cap_tkn_cent:
-                        remain_eos_to_cap -= 0.0001
-                    self.system_token_contract.push_action(
-                        "transfer",
-                        json.dumps({
-                            "from": str(buyer_acc),
-                            "to": str(self.crowdsale_deployer_acc),
-                            "quantity": self.toAsset(remain_eos_to_cap, 4, "EOS"),
-                            "memo": ""
-                        }),
-                        buyer_acc
-                    )
-                    contributed += eos_to_transfer
-        else:
-            will_be = int(int((contributed + eos_to_transfer) * 10 ** 4) / 10 ** 4 * self.rate * 10 ** self.decimals)
-            if will_be > cap_tkn_cent:
-                eos_to_transfer -= 0.0001
-            self.system_token_contract.push_action(
+    def reach_cap(self, cap_tkn_cent, buyer_acc):
+        # deposit EOS buying at least cap_tkn_cent tokens, the part over hard cap is sent back
+        eos_cent = -(-ceil(cap_tkn_cent) * self.rate_denom // self.rate_num)
+        chunk = self.max_contrib_eos_cent or eos_cent
+        transfers = Batch()
+        while eos_cent > 0:
+            amount = max(min(chunk, eos_cent), self.min_contrib_eos_cent)
+            transfers.add(
+                self.system_token_deployer_acc,
                 "transfer",
-                json.dumps({
+                {
                     "from": str(buyer_acc),
                     "to": str(self.crowdsale_deployer_acc),
-                    "quantity": self.toAsset(eos_to_transfer, 4, "EOS"),
+                    "quantity": abi.format_asset(amount, 4, "EOS"),
                     "memo": ""
-                }),
+                },
                 buyer_acc
             )
-            contributed += eos_to_transfer
+            eos_cent -= amount
+        transfers.push()
 
-    def create_buyers_accounts(self, owner, amount):
-        buyers_accs = []
-        for x in range(amount):
-            buyer_name = "tokenbuyer1{}".format(x+1)
-            create_account(buyer_name, owner, buyer_name)
-            buyers_accs.append(buyer_name)
-        return buyers_accs
+    def create_buyers_accounts(self, owner, amount, names=None):
+        names = names or ["tokenbuyer1{}".format(x + 1) for x in range(amount)]
+        return accounts.create_accounts(owner, names[:amount])
 
     def tearDown(self):
         stop()
@@ -361,8 +365,7 @@ class CrowdsaleTests(unittest.TestCase):
             self.system_token_deployer_acc
         )
         #print(self.system_token_contract.table("accounts", buyer_acc))
-        assert (eos_to_issue == self.fromAsset(self.system_token_contract.table("accounts", buyer_acc)
-                                               .json["rows"][0]["balance"])["amount"])
+        assert (self.balance(self.system_token_contract, buyer_acc) == Asset.from_number(eos_to_issue, asset.EOS))
 
         if self.whitelist:
             # check that not whitelisted user cannot send EOS to contract
@@ -401,16 +404,14 @@ class CrowdsaleTests(unittest.TestCase):
         )
 
         # check EOS balances
-        assert (eos_to_transfer == self.fromAsset(self.system_token_contract
-                                                  .table("accounts", self.crowdsale_deployer_acc)
-                                                  .json["rows"][0]["balance"])["amount"])
-        assert ((eos_to_issue - eos_to_transfer) == self.fromAsset(self.system_token_contract
-                                                                   .table("accounts", buyer_acc)
-                                                                   .json["rows"][0]["balance"])["amount"])
+        assert (self.balance(self.system_token_contract, self.crowdsale_deployer_acc) ==
+                Asset.from_number(eos_to_transfer, asset.EOS))
+        assert (self.balance(self.system_token_contract, buyer_acc) ==
+                Asset.from_number(eos_to_issue, asset.EOS) - Asset.from_number(eos_to_transfer, asset.EOS))
 
         # check state in crowdsale
         deposit = self.crowdsale_contract.table("deposit", self.crowdsale_deployer_acc).json["rows"][0]
-        expected_tokens = int(eos_to_transfer * self.rate * 10 ** self.decimals)
+        expected_tokens = self.toTokens(eos_to_transfer)
 
         assert (deposit["account"] == buyer_acc.name)
         assert (int(deposit["eoses"]) == int(eos_to_transfer * 10 ** 4))
@@ -423,8 +424,7 @@ class CrowdsaleTests(unittest.TestCase):
                 .table("state", self.crowdsale_deployer_acc).json["rows"][0]["total_tokens"]))
 
         # check token balance
-        assert (expected_tokens == int(self.fromAsset(self.token_contract.table("accounts", buyer_acc.name)
-                                                      .json["rows"][0]["balance"])["amount"] * 10 ** self.decimals))
+        assert (expected_tokens == self.balance(self.token_contract, buyer_acc.name).amount)
 
 
     def test_03(self):
@@ -479,8 +479,7 @@ class CrowdsaleTests(unittest.TestCase):
                 self.system_token_deployer_acc
             )
 
-            assert (eos_to_issue == self.fromAsset(self.system_token_contract.table("accounts", buyer)
-                                                   .json["rows"][0]["balance"])["amount"])
+            assert (self.balance(self.system_token_contract, buyer) == Asset.from_number(eos_to_issue, asset.EOS))
 
         # whitelist accounts if needed
         if self.whitelist:
@@ -494,9 +493,9 @@ class CrowdsaleTests(unittest.TestCase):
                 )
 
         # calculate how much tokens each buyer will receive
-        expected_tokens_per_buyer = int(eos_to_transfer * self.rate * 10 ** self.decimals)
+        expected_tokens_per_buyer = self.toTokens(eos_to_transfer)
         expected_all_tokens = 0
-        expected_all_eos = 0
+        expected_all_eos = Asset(0, asset.EOS)
 
         # transfer EOS to crowdsale contract
         for buyer in buyers_accs:
@@ -511,24 +510,16 @@ class CrowdsaleTests(unittest.TestCase):
                     }),
                     buyer
                 )
-                expected_all_eos += eos_to_transfer
+                expected_all_eos += Asset.from_number(eos_to_transfer, asset.EOS)
                 expected_all_tokens += expected_tokens_per_buyer
 
                 # check EOS balances
-                assert (int(expected_all_eos * 10 ** 4) == int(self.fromAsset(self.system_token_contract
-                                                                              .table("accounts",
-                                                                                     self.crowdsale_deployer_acc)
-                                                                              .json["rows"][0]["balance"])[
-                                                                   "amount"] * 10 ** 4))
-                assert ((eos_to_issue - eos_to_transfer) == self.fromAsset(self.system_token_contract
-                                                                           .table("accounts", buyer)
-                                                                           .json["rows"][0]["balance"])["amount"])
+                assert (self.balance(self.system_token_contract, self.crowdsale_deployer_acc) == expected_all_eos)
+                assert (self.balance(self.system_token_contract, buyer) ==
+                        Asset.from_number(eos_to_issue, asset.EOS) - Asset.from_number(eos_to_transfer, asset.EOS))
 
                 # check token balances
-                assert (expected_tokens_per_buyer == int(self.fromAsset(self.token_contract
-                                                                        .table("accounts", buyer)
-                                                                        .json["rows"][0]["balance"])
-                                                         ["amount"] * 10 ** self.decimals))
+                assert (expected_tokens_per_buyer == self.balance(self.token_contract, buyer).amount)
                 assert (expected_all_tokens == int(self.crowdsale_contract
                         .table("state", self.crowdsale_deployer_acc)
                         .json["rows"][0]["total_tokens"]))
@@ -822,8 +813,7 @@ class CrowdsaleTests(unittest.TestCase):
             }),
             self.system_token_deployer_acc
         )
-        assert (eos_to_issue == self.fromAsset(self.system_token_contract.table("accounts", buyer_acc)
-                                               .json["rows"][0]["balance"])["amount"])
+        assert (self.balance(self.system_token_contract, buyer_acc) == Asset.from_number(eos_to_issue, asset.EOS))
 
         # function setting time and sending EOS
         def set_time_and_transfer(timestamp):
@@ -885,7 +875,7 @@ class CrowdsaleTests(unittest.TestCase):
             "issue",
             json.dumps({
                 "to": buyer_acc.name,
-                "quantity": self.toAsset(self.hard_cap_eos, 4, "EOS"),
+                "quantity": self.toAsset(self.hard_cap_eos + self.min_contrib_eos, 4, "EOS"),
                 "memo": ""
             }),
             self.system_token_deployer_acc
@@ -989,15 +979,19 @@ class CrowdsaleTests(unittest.TestCase):
             )
 
             # refund
+            refunds = Batch()
             for buyer in buyers_accs:
-                self.crowdsale_contract.push_action(
+                refunds.add(
+                    self.crowdsale_deployer_acc,
                     "refund",
-                    json.dumps({
+                    {
                         "investor": str(buyer)
-                    }),
+                    },
                     buyer
                 )
+            refunds.push()
 
+            for buyer in buyers_accs:
                 assert (self.toAsset(self.soft_cap_eos, 4, "EOS") == self.system_token_contract
                         .table("accounts", buyer).json["rows"][0]["balance"])
 
@@ -1193,14 +1187,393 @@ class CrowdsaleTests(unittest.TestCase):
                 forceUnique=1
             )
 
+    def test_13(self):
+        cprint('13. Check merkle whitelist', 'green')
+        if not self.whitelist_merkle:
+            return
+
+        # execute 'init'
+        self.crowdsale_contract.push_action(
+            "init",
+            json.dumps({
+                "start": self.start_date,
+                "finish": self.finish_date
+            }),
+            self.crowdsale_deployer_acc
+        )
+
+        # rewind time to start
+        self.crowdsale_contract.push_action(
+            "settime",
+            json.dumps({
+                "time": self.start_date
+            }),
+            self.crowdsale_deployer_acc
+        )
+
+        buyers = self.create_buyers_accounts(self.eosio_acc, 3)
+        for buyer in buyers:
+            self.system_token_contract.push_action(
+                "issue",
+                json.dumps({
+                    "to": buyer,
+                    "quantity": self.toAsset(self.min_contrib_eos * 2, 4, "EOS"),
+                    "memo": ""
+                }),
+                self.system_token_deployer_acc
+            )
+
+        # publish root of the first two buyers
+        tree = merkle.Tree(buyers[:2])
+        self.crowdsale_contract.push_action(
+            "setroot",
+            json.dumps({
+                "root": tree.root
+            }),
+            self.issuer_acc
+        )
+        assert (tree.root == self.crowdsale_contract.table("root", self.crowdsale_deployer_acc)
+                .json["rows"][0]["root"])
+
+        def deposit(buyer, memo):
+            self.system_token_contract.push_action(
+                "transfer",
+                json.dumps({
+                    "from": buyer,
+                    "to": str(self.crowdsale_deployer_acc),
+                    "quantity": self.toAsset(self.min_contrib_eos, 4, "EOS"),
+                    "memo": memo
+                }),
+                buyer,
+                forceUnique=1
+            )
+
+        # proof of other account or no proof at all
+        with self.assertRaises(errors.Error):
+            deposit(buyers[0], tree.memo(buyers[1]))
+        with self.assertRaises(errors.Error):
+            deposit(buyers[2], tree.memo(buyers[0]))
+
+        # the investor row marks a proven account, without it every deposit carries the proof
+        deposit(buyers[0], tree.memo(buyers[0]))
+        if self.config.investor_table:
+            deposit(buyers[0], "")
+        else:
+            with self.assertRaises(errors.Error):
+                deposit(buyers[0], "")
+            deposit(buyers[0], tree.memo(buyers[0]))
+        deposit(buyers[1], tree.memo(buyers[1]))
+        table = "investor" if self.config.investor_table else "deposit"
+        assert (len(self.crowdsale_contract.table(table, self.crowdsale_deployer_acc).json["rows"]) == 2)
+        if not self.config.investor_table:
+            assert (self.crowdsale_contract.table("whitelist", self.crowdsale_deployer_acc).json["rows"] == [])
+
+        # after unwhite a deposit needs the proof again, and a root without the account refuses it
+        if self.config.investor_table:
+            self.crowdsale_contract.push_action("unwhite", json.dumps({"account": str(buyers[0])}), self.issuer_acc)
+        with self.assertRaises(errors.Error):
+            deposit(buyers[0], "")
+        self.crowdsale_contract.push_action("setroot", json.dumps({"root": merkle.Tree(buyers[1:]).root}),
+                                            self.issuer_acc)
+        with self.assertRaises(errors.Error):
+            deposit(buyers[0], tree.memo(buyers[0]))
+        rows = self.crowdsale_contract.table(table, self.crowdsale_deployer_acc).json["rows"]
+        assert ([row["eoses"] for row in rows if row["account"] == str(buyers[0])] ==
+                [2 * Asset.from_number(self.min_contrib_eos, asset.EOS).amount])
+
+    def test_14(self):
+        cprint('14. Check refund by issuer', 'green')
+        if self.soft_cap_eos <= 0:
+            return
+
+        # execute 'init'
+        self.crowdsale_contract.push_action(
+            "init",
+            json.dumps({
+                "start": self.start_date,
+                "finish": self.finish_date
+            }),
+            self.crowdsale_deployer_acc
+        )
+
+        # rewind time to start
+        self.crowdsale_contract.push_action(
+            "settime",
+            json.dumps({
+                "time": self.start_date
+            }),
+            self.crowdsale_deployer_acc
+        )
+
+        buyers_accs = self.create_buyers_accounts(self.eosio_acc, 5)
+        eos_to_transfer = self.min_contrib_eos or 0.0001
+        deposits = Batch()
+        for buyer in buyers_accs:
+            self.system_token_contract.push_action(
+                "issue",
+                json.dumps({
+                    "to": buyer,
+                    "quantity": self.toAsset(eos_to_transfer, 4, "EOS"),
+                    "memo": ""
+                }),
+                self.system_token_deployer_acc
+            )
+            if self.whitelist:
+                self.crowdsale_contract.push_action(
+                    "white",
+                    json.dumps({
+                        "account": buyer
+                    }),
+                    self.issuer_acc
+                )
+            deposits.add(
+                self.system_token_deployer_acc,
+                "transfer",
+                {
+                    "from": buyer,
+                    "to": str(self.crowdsale_deployer_acc),
+                    "quantity": self.toAsset(eos_to_transfer, 4, "EOS"),
+                    "memo": ""
+                },
+                buyer
+            )
+        deposits.push()
+
+        # batch refund is not possible before finish
+        with self.assertRaises(errors.Error):
+            self.crowdsale_contract.push_action("refundmany", json.dumps({"count": 2}), self.issuer_acc)
+
+        # rewind time to finish
+        self.crowdsale_contract.push_action(
+            "settime",
+            json.dumps({
+                "time": self.finish_date + 1
+            }),
+            self.crowdsale_deployer_acc
+        )
+
+        # only issuer can refund others
+        with self.assertRaises(errors.Error):
+            self.crowdsale_contract.push_action("refundmany", json.dumps({"count": 2}), buyers_accs[0])
+
+        # one buyer refunds on their own, the cursor skips the emptied deposit
+        self.crowdsale_contract.push_action("refund", json.dumps({"investor": buyers_accs[0]}), buyers_accs[0])
+
+        result = refund_all(self.crowdsale_deployer_acc, self.issuer_acc, 2)
+        assert (result["processed"] == len(buyers_accs))
+        assert (result["calls"] == 3)
+        eos_cent = Asset.from_number(eos_to_transfer, asset.EOS).amount
+        balances = self.reader.balances(self.system_token_deployer_acc, buyers_accs, "EOS")
+        assert (balances == {buyer: eos_cent for buyer in buyers_accs})
+
+        # cursor is exhausted
+        with self.assertRaises(errors.Error):
+            self.crowdsale_contract.push_action("refundmany", json.dumps({"count": 2}), self.issuer_acc)
+
+    def test_15(self):
+        cprint('15. Check claim and distribution of lazy issued tokens', 'green')
+        if not self.lazy_issue:
+            return
+
+        # execute 'init'
+        self.crowdsale_contract.push_action(
+            "init",
+            json.dumps({
+                "start": self.start_date,
+                "finish": self.finish_date
+            }),
+            self.crowdsale_deployer_acc
+        )
+
+        # rewind time to start
+        self.crowdsale_contract.push_action(
+            "settime",
+            json.dumps({
+                "time": self.start_date
+            }),
+            self.crowdsale_deployer_acc
+        )
+
+        buyers_accs = self.create_buyers_accounts(self.eosio_acc, 4)
+        for buyer in buyers_accs:
+            self.system_token_contract.push_action(
+                "issue",
+                json.dumps({
+                    "to": buyer,
+                    "quantity": self.toAsset(self.soft_cap_eos + self.min_contrib_eos, 4, "EOS"),
+                    "memo": ""
+                }),
+                self.system_token_deployer_acc
+            )
+            if self.whitelist:
+                self.crowdsale_contract.push_action(
+                    "white",
+                    json.dumps({
+                        "account": buyer
+                    }),
+                    self.issuer_acc
+                )
+
+        # first buyer reaches soft cap, others contribute the minimum
+        self.reach_cap(self.soft_cap_tkn_cent, buyers_accs[0])
+        eos_to_transfer = self.min_contrib_eos or 0.0001
+        for buyer in buyers_accs[1:]:
+            self.system_token_contract.push_action(
+                "transfer",
+                json.dumps({
+                    "from": buyer,
+                    "to": str(self.crowdsale_deployer_acc),
+                    "quantity": self.toAsset(eos_to_transfer, 4, "EOS"),
+                    "memo": ""
+                }),
+                buyer
+            )
+
+        # tokens are only recorded during the sale
+        deposits = self.crowdsale_contract.table("deposit", self.crowdsale_deployer_acc).json["rows"]
+        expected = {row["account"]: int(row["tokens"]) for row in deposits}
+        balances = self.reader.balances(self.token_deployer_acc, buyers_accs, self.symbol)
+        assert (balances == {buyer: 0 for buyer in buyers_accs})
+        with self.assertRaises(errors.Error):
+            self.crowdsale_contract.push_action("claim", json.dumps({"investor": buyers_accs[0]}), buyers_accs[0])
+
+        # rewind time to finish
+        self.crowdsale_contract.push_action(
+            "settime",
+            json.dumps({
+                "time": self.finish_date + 1
+            }),
+            self.crowdsale_deployer_acc
+        )
+
+        self.crowdsale_contract.push_action("claim", json.dumps({"investor": buyers_accs[0]}), buyers_accs[0])
+        result = distribute_all(self.crowdsale_deployer_acc, self.issuer_acc, 2)
+        assert (result["processed"] == len(buyers_accs))
+        self.reader.clear()
+        assert (self.reader.balances(self.token_deployer_acc, buyers_accs, self.symbol) == expected)
+
+    def test_16(self):
+        cprint('16. Check deposit crossing hard cap is accepted in part', 'green')
+
+        # execute 'init'
+        self.crowdsale_contract.push_action(
+            "init",
+            json.dumps({
+                "start": self.start_date,
+                "finish": self.finish_date
+            }),
+            self.crowdsale_deployer_acc
+        )
+
+        # rewind time to start
+        self.crowdsale_contract.push_action(
+            "settime",
+            json.dumps({
+                "time": self.start_date
+            }),
+            self.crowdsale_deployer_acc
+        )
+
+        create_account("buyer_acc", self.eosio_acc)
+        issued_eos_cent = self.hard_cap_eos_cent + (self.max_contrib_eos_cent or self.hard_cap_eos_cent)
+        self.system_token_contract.push_action(
+            "issue",
+            json.dumps({
+                "to": buyer_acc.name,
+                "quantity": abi.format_asset(issued_eos_cent, 4, "EOS"),
+                "memo": ""
+            }),
+            self.system_token_deployer_acc
+        )
+        if self.whitelist:
+            self.crowdsale_contract.push_action(
+                "white",
+                json.dumps({
+                    "account": buyer_acc.name
+                }),
+                self.issuer_acc
+            )
+
+        # last deposit buys more than left under hard cap
+        self.reach_cap(self.hard_cap_tkn_cent + 1, buyer_acc)
+
+        state = self.crowdsale_contract.table("state", self.crowdsale_deployer_acc).json["rows"][0]
+        assert (state["total_tokens"] <= self.hard_cap_tkn_cent)
+        assert (state["total_tokens"] + min_tokens(self.rate_num, self.rate_denom) > self.hard_cap_tkn_cent)
+        eos_at_crowdsale = self.system_token_contract.table("accounts", self.crowdsale_deployer_acc).json["rows"][0]
+        eos_at_buyer = self.system_token_contract.table("accounts", buyer_acc).json["rows"][0]
+        assert (eos_at_crowdsale["balance"] == abi.format_asset(state["total_eoses"], 4, "EOS"))
+        assert (eos_at_buyer["balance"] == abi.format_asset(issued_eos_cent - state["total_eoses"], 4, "EOS"))
+
+        # nothing more fits under hard cap
+        with self.assertRaises(errors.Error):
+            self.system_token_contract.push_action(
+                "transfer",
+                json.dumps({
+                    "from": buyer_acc.name,
+                    "to": str(self.crowdsale_deployer_acc),
+                    "quantity": self.toAsset(self.min_contrib_eos or 0.0001, 4, "EOS"),
+                    "memo": ""
+                }),
+                buyer_acc
+            )
+
+    def test_17(self):
+        cprint('17. Check premint loaded from CSV and issued in chunks', 'green')
+
+        buyers_accs = self.create_buyers_accounts(self.eosio_acc, 5)
+        amounts = [Decimal(x) / 10 ** self.decimals + x for x in range(1, len(buyers_accs) + 1)]
+        with tempfile.NamedTemporaryFile("w", suffix=".csv") as f:
+            f.write("account,amount\n")
+            for buyer, amount in zip(buyers_accs, amounts):
+                f.write("{},{}\n".format(buyer, amount))
+            f.flush()
+            result = premint.load(self.crowdsale_deployer_acc, premint.read_allocations(f.name, self.decimals), 2)
+        assert (result["rows"] == len(buyers_accs))
+        assert (len(self.crowdsale_contract.table("premint", self.crowdsale_deployer_acc).json["rows"]) == len(buyers_accs))
+
+        with self.assertRaises(errors.Error):
+            self.crowdsale_contract.push_action("premint", json.dumps({"count": 2}), self.issuer_acc)
+        result = premint.issue_all(self.crowdsale_deployer_acc, 2)
+        assert (result["calls"] == 3)
+        assert (premint.preminted(self.crowdsale_deployer_acc) == len(buyers_accs))
+        # the erased rows are not loaded again
+        with self.assertRaises(ValueError):
+            premint.load(self.crowdsale_deployer_acc, iter([{"account": buyers_accs[0], "tokens": 1}]))
+        with self.assertRaises(errors.Error):
+            self.crowdsale_contract.push_action(
+                "addpremint",
+                json.dumps({"mints": [{"account": buyers_accs[0], "tokens": 1}]}),
+                self.crowdsale_deployer_acc
+            )
+        assert (len(self.crowdsale_contract.table("premint", self.crowdsale_deployer_acc).json["rows"]) == 0)
+        balances = self.reader.balances(self.token_deployer_acc, buyers_accs, self.symbol)
+        assert (balances == {buyer: int(amount.scaleb(self.decimals)) for buyer, amount in zip(buyers_accs, amounts)})
+
 if __name__ == "__main__":
     verbosity([])  # disable logs
 
     parser = argparse.ArgumentParser()
     parser.add_argument("--verbose", help="increase output verbosity",
                         action="store_true")
-    args = parser.parse_args()
+    parser.add_argument("--localnode", help="run against in-memory node instead of nodeos",
+                        action="store_true")
+    parser.add_argument("--instrument", help="write latency, CPU, NET and RAM per action to this json or csv file")
+    parser.add_argument("--instrument-ram", help="measure RAM of the crowdsale account per action, slower",
+                        action="store_true")
+    args, argv = parser.parse_known_args()
     if args.verbose:
         verbosity([Verbosity.INFO, Verbosity.OUT, Verbosity.TRACE, Verbosity.DEBUG])
         print("verbosity turned on")
-    unittest.main()
+    if args.localnode:
+        node = localnode.Node(eosf_config.http_server_address(), config.load('config.h').defines())
+        reset = node.reset
+        stop = lambda: None
+        print("localnode listening on " + node.address)
+    if args.instrument:
+        recorder = instrument.Recorder("ico.deployer" if args.instrument_ram else None)
+    program = unittest.main(argv=[sys.argv[0]] + (["--verbose"] if args.verbose else []) + argv, exit=False)
+    if recorder:
+        recorder.write(args.instrument)
+        print("action report written to " + args.instrument)
+    sys.exit(not program.result.wasSuccessful())
@@ -0,0 +1,51 @@
+import hashlib
+import unittest
+
+import abi
+import ecc
+
+
+# development key of eosio in nodeos and eosfactory
+EOSIO_KEY = "EOS6MRyAjQq8ud7hVNYcfnVPJqcVpscN5So8BhtHuGYqET5GDW5CV"
+EOSIO_PRIVATE = "5KQwrPbwdL6PhXujxW37FSSQZ1JiwsST4cqQzDeyXtP79zkvFD3"
+
+
+class EccTests(unittest.TestCase):
+
+    def test_01(self):
+        # WIF and PVT_K1_ forms of the same key
+        secret = ecc.private_key_to_int(EOSIO_PRIVATE)
+        assert (ecc.public_key(secret) == EOSIO_KEY)
+        key = secret.to_bytes(32, "big")
+        assert (ecc.private_key_to_int("PVT_K1_" + abi.base58_encode(key + abi.ripemd160(key + b"K1")[:4])) == secret)
+        with self.assertRaises(ValueError):
+            ecc.private_key_to_int(EOSIO_PRIVATE[:-1] + "4")
+
+    def test_02(self):
+        # canonical signatures the node recovers the signing key from
+        secret = ecc.private_key_to_int(EOSIO_PRIVATE)
+        for x in range(64):
+            digest = hashlib.sha256(bytes([x])).digest()
+            signature = ecc.sign_digest(digest, secret)
+            assert (signature == ecc.sign_digest(digest, secret))
+            compact = abi.base58_decode(signature[7:])[:-4]
+            assert (len(compact) == 65 and ecc._canonical(compact))
+            assert (ecc.recover_digest(digest, signature) == EOSIO_KEY)
+            assert (ecc.recover_digest(hashlib.sha256(digest).digest(), signature) != EOSIO_KEY)
+
+    def test_03(self):
+        # signatures of fc::ecc::private_key::sign_compact, as keosd makes them; the second
+        # one is canonical only at the tenth nonce
+        secret = ecc.private_key_to_int(EOSIO_PRIVATE)
+        for digest, signature in [
+            ("18ac3e7343f016890c510e93f935261169d9e3f565436429830faf0934f4f8e4",
+             "SIG_K1_K1Zu5LQ2teaniW649BquAwDPh1tnQXPZHZLbZo4dFg2k641NvH4ephvQoDJ1pxZgka1vJqBymJ6roDi9J1ML43WY6Gc8TE"),
+            ("ef2d127de37b942baad06145e54b0c619a1f22327b2ebbcfbec78f5564afe39d",
+             "SIG_K1_K3spJbdZVFDRan2egZTJVk3sKJyEb1soYZc9rSNCbe3w4TtkNKpUekgBk22XDzmpg5dNLLgwKwh1gQWWRHwT1WhJrP4YEq")
+        ]:
+            assert (ecc.sign_digest(bytes.fromhex(digest), secret) == signature)
+            assert (ecc.recover_digest(bytes.fromhex(digest), signature) == EOSIO_KEY)
+
+
+if __name__ == '__main__':
+    unittest.main()
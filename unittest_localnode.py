@@ -0,0 +1,350 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+import urllib.error
+import urllib.request
+
+import abi
+import config
+import ecc
+import localnode
+import pipeline
+import presign
+import tables
+from model import rate_fraction
+
+
+class LocalnodeTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.cfg = config.load('config.h').defines()
+        rate_num, rate_denom = rate_fraction(int(cls.cfg["DECIMALS"]), int(cls.cfg["RATE"]), int(cls.cfg["RATE_DENOM"]))
+        # the least deposit accepted and buying at least one token cent
+        cls.amount = max(int(cls.cfg["MIN_CONTRIB"]), -(-rate_denom // rate_num))
+        cls.deposit_table = "investor" if cls.cfg.get("INVESTOR_TABLE") == "true" else "deposit"
+        cls.node = localnode.Node("127.0.0.1:0", cls.cfg)
+        cls.address = cls.node.address
+        with open('crowdsale.debug.abi') as abi_file:
+            cls.crowdsale_abi = json.load(abi_file)
+        cls.token_abi = {
+            "structs": [{"name": "issue", "base": "", "fields": [
+                {"name": "to", "type": "name"},
+                {"name": "quantity", "type": "asset"},
+                {"name": "memo", "type": "string"}
+            ]}, {"name": "transfer", "base": "", "fields": [
+                {"name": "from", "type": "name"},
+                {"name": "to", "type": "name"},
+                {"name": "quantity", "type": "asset"},
+                {"name": "memo", "type": "string"}
+            ]}],
+            "actions": [{"name": "issue", "type": "issue"}, {"name": "transfer", "type": "transfer"}]
+        }
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.node.stop()
+
+    def call(self, endpoint, body):
+        request = urllib.request.Request("http://" + self.address + "/v1/chain/" + endpoint, json.dumps(body).encode())
+        try:
+            return json.loads(urllib.request.urlopen(request).read())
+        except urllib.error.HTTPError as e:
+            return json.loads(e.read())
+
+    def push(self, account, name, data, actor):
+        return self.call("push_transaction", {"transaction": {"actions": [{
+            "account": account,
+            "name": name,
+            "authorization": [{"actor": actor, "permission": "active"}],
+            "data": data
+        }]}})
+
+    def setUp(self):
+        self.node.chain.reset()
+        key = localnode.authority(localnode.EOSIO_KEY)
+        for name in ["eosio.token", self.cfg["CONTRACT"], "ico.deployer", self.cfg["ISSUER"], "buyer"] \
+                + [self.cfg["MINTDEST" + str(x)] for x in range(int(self.cfg["MINTCNT"]))]:
+            self.push("eosio", "newaccount", {"creator": "eosio", "name": name, "owner": key, "active": key}, "eosio")
+        for name, definition in (("eosio.token", self.token_abi), (self.cfg["CONTRACT"], self.token_abi),
+                                 ("ico.deployer", self.crowdsale_abi)):
+            self.push("eosio", "setabi", {"account": name, "abi": abi.pack_abi(definition).hex()}, name)
+
+        self.push("eosio.token", "create", {
+            "issuer": "eosio.token",
+            "maximum_supply": "460000000000.0000 EOS"
+        }, "eosio.token")
+        self.push(self.cfg["CONTRACT"], "create", {
+            "issuer": "ico.deployer",
+            "maximum_supply": abi.format_asset(10 ** 15, int(self.cfg["DECIMALS"]), self.cfg["SYMBOL"]),
+            "lock": True
+        }, self.cfg["CONTRACT"])
+        self.push("eosio.token", "issue", {"to": "buyer", "quantity": "1000000.0000 EOS", "memo": ""}, "eosio.token")
+        self.push("ico.deployer", "init", {"start": 10, "finish": 20}, "ico.deployer")
+        self.push("ico.deployer", "settime", {"time": 11}, "ico.deployer")
+        self.push("ico.deployer", "white", {"account": "buyer"}, self.cfg["ISSUER"])
+
+    def test_01(self):
+        quantity = abi.format_asset(self.amount, 4, "EOS")
+        result = self.push("eosio.token", "transfer", {
+            "from": "buyer",
+            "to": "ico.deployer",
+            "quantity": quantity,
+            "memo": ""
+        }, "buyer")
+        assert (result["processed"]["receipt"]["status"] == "executed")
+
+        rows = self.call("get_table_rows", {"code": "ico.deployer", "scope": "ico.deployer", "table": self.deposit_table})
+        assert (rows["rows"][0]["eoses"] == self.amount)
+        rows = self.call("get_table_rows", {"code": "eosio.token", "scope": "ico.deployer", "table": "accounts"})
+        assert (rows["rows"] == [{"balance": quantity}])
+
+    def test_02(self):
+        state = self.call("get_table_rows", {"code": "ico.deployer", "scope": "ico.deployer", "table": "state"})
+        if self.amount > 1:
+            result = self.push("eosio.token", "transfer", {
+                "from": "buyer",
+                "to": "ico.deployer",
+                "quantity": abi.format_asset(self.amount - 1, 4, "EOS"),
+                "memo": ""
+            }, "buyer")
+            assert (result["error"]["details"][0]["message"] == "assertion failure with message: Contribution too low")
+            assert (state == self.call("get_table_rows", {"code": "ico.deployer", "scope": "ico.deployer", "table": "state"}))
+
+        result = self.push("ico.deployer", "white", {"account": "buyer"}, "buyer")
+        assert (result["error"]["name"] == "missing_auth_exception")
+
+    def test_03(self):
+        data = abi.Abi(self.token_abi).pack_action("issue", {"to": "buyer", "quantity": "1.0000 EOS", "memo": ""})
+        transaction = abi.CHAIN_ABI.pack("transaction", {
+            "expiration": 0,
+            "ref_block_num": 0,
+            "ref_block_prefix": 0,
+            "max_net_usage_words": 0,
+            "max_cpu_usage_ms": 0,
+            "delay_sec": 0,
+            "context_free_actions": [],
+            "actions": [{
+                "account": "eosio.token",
+                "name": "issue",
+                "authorization": [{"actor": "eosio.token", "permission": "active"}],
+                "data": data.hex()
+            }],
+            "transaction_extensions": []
+        })
+        block_num = self.call("get_info", {})["head_block_num"]
+        self.call("push_transaction", {"compression": "none", "packed_trx": transaction.hex()})
+        assert (self.call("get_info", {})["head_block_num"] == block_num + 1)
+
+        rows = self.call("get_table_rows", {"code": "eosio.token", "scope": "buyer", "table": "accounts"})
+        assert (rows["rows"] == [{"balance": "1000001.0000 EOS"}])
+        account = self.call("get_account", {"account_name": "buyer"})
+        assert ([p["perm_name"] for p in account["permissions"]] == ["active", "owner"])
+        assert ("unknown key" in self.call("get_account", {"account_name": "nobody"})["error"]["details"][0]["message"])
+
+    def test_04(self):
+        mints = [{"account": "buyer", "tokens": 300}, {"account": "ico.deployer", "tokens": 200}]
+        result = self.push("ico.deployer", "addpremint", {"mints": mints}, "ico.deployer")
+        assert (result["processed"]["receipt"]["status"] == "executed")
+        rows = self.call("get_table_rows", {"code": "ico.deployer", "scope": "ico.deployer", "table": "premint"})
+        assert (rows["rows"] == mints)
+
+        self.push("ico.deployer", "premint", {"count": 1}, "ico.deployer")
+        self.push("ico.deployer", "premint", {"count": 1}, "ico.deployer")
+        result = self.push("ico.deployer", "premint", {"count": 1}, "ico.deployer")
+        assert (result["error"]["details"][0]["message"] == "assertion failure with message: Nothing to premint")
+        result = self.push("ico.deployer", "addpremint", {"mints": mints}, "ico.deployer")
+        assert (result["error"]["details"][0]["message"] == "assertion failure with message: Premint already started")
+        rows = self.call("get_table_rows", {"code": "ico.deployer", "scope": "ico.deployer", "table": "preminted"})
+        assert (rows["rows"] == [{"issued": 2, "tokens": 500}])
+        decimals, symbol = int(self.cfg["DECIMALS"]), self.cfg["SYMBOL"]
+        for mint in mints:
+            rows = self.call("get_table_rows", {"code": self.cfg["CONTRACT"], "scope": mint["account"], "table": "accounts"})
+            assert (rows["rows"] == [{"balance": abi.format_asset(mint["tokens"], decimals, symbol)}])
+
+    def test_05(self):
+        buyers = ["buyer" + c for c in "abcdefghijklmnopqrstuvwxy"]
+        key = localnode.authority(localnode.EOSIO_KEY)
+        for buyer in buyers:
+            self.push("eosio", "newaccount", {"creator": "eosio", "name": buyer, "owner": key, "active": key}, "eosio")
+            self.push("eosio.token", "issue", {"to": buyer, "quantity": abi.format_asset(self.amount, 4, "EOS"),
+                                               "memo": ""}, "eosio.token")
+        self.push("ico.deployer", "whitemany", {"accounts": buyers}, self.cfg["ISSUER"])
+        for buyer in buyers:
+            self.push("eosio.token", "transfer", {
+                "from": buyer,
+                "to": "ico.deployer",
+                "quantity": abi.format_asset(self.amount, 4, "EOS"),
+                "memo": ""
+            }, buyer)
+
+        reader = tables.Reader(self.address, page=10)
+        report = tables.audit(reader, "ico.deployer", self.deposit_table)
+        assert (report["rows"] == len(buyers))
+        assert (report["eoses"] == report["state"]["total_eoses"] == self.amount * len(buyers))
+        assert (report["tokens"] == report["state"]["total_tokens"])
+
+        balances = reader.balances("eosio.token", buyers + ["ico.deployer"], "EOS")
+        assert (balances == dict({buyer: 0 for buyer in buyers}, **{"ico.deployer": self.amount * len(buyers)}))
+        # rows are cached until cleared, even when a write moved the head block
+        cached = reader.cache[("eosio.token", "ico.deployer", "accounts")]
+        assert (reader.table("eosio.token", "ico.deployer", "accounts") is cached)
+        self.push("eosio.token", "issue", {"to": "buyera", "quantity": "1.0000 EOS", "memo": ""}, "eosio.token")
+        assert (reader.balances("eosio.token", ["buyera"], "EOS") == {"buyera": 0})
+        reader.clear()
+        assert (reader.balances("eosio.token", ["buyera"], "EOS") == {"buyera": 10000})
+
+        # a refunded deposit keeps its row with the tokens and is still counted
+        if report["state"]["total_tokens"] < int(self.cfg["SOFT_CAP_TKN"]):
+            self.push("ico.deployer", "settime", {"time": 21}, "ico.deployer")
+            result = self.push("ico.deployer", "refund", {"investor": "buyerb"}, "buyerb")
+            assert (result["processed"]["receipt"]["status"] == "executed")
+            refunded = tables.audit(tables.Reader(self.address, page=10), "ico.deployer", self.deposit_table)
+            assert (refunded["rows"] == len(buyers))
+            assert (refunded["eoses"] == report["eoses"] - self.amount)
+            assert (refunded["tokens"] == report["tokens"] == refunded["state"]["total_tokens"])
+
+    def test_06(self):
+        buyers = ["buyer" + c for c in "abcdefghijklmnopqrstuvwxy"]
+        key = localnode.authority(localnode.EOSIO_KEY)
+        for buyer in buyers:
+            self.push("eosio", "newaccount", {"creator": "eosio", "name": buyer, "owner": key, "active": key}, "eosio")
+            self.push("eosio.token", "issue", {"to": buyer, "quantity": abi.format_asset(self.amount * 4, 4, "EOS"),
+                                               "memo": ""}, "eosio.token")
+        self.push("ico.deployer", "whitemany", {"accounts": buyers}, self.cfg["ISSUER"])
+
+        # five deposits of every buyer in flight at once, the balance covers four
+        quantity = abi.format_asset(self.amount, 4, "EOS")
+        transactions = [[{
+            "account": "eosio.token",
+            "name": "transfer",
+            "authorization": [{"actor": buyer, "permission": "active"}],
+            "data": {"from": buyer, "to": "ico.deployer", "quantity": quantity, "memo": ""}
+        }] for _ in range(5) for buyer in buyers]
+        results = pipeline.push_all(self.address, transactions, window=32, connections=8)
+        executed = [r for r in results if not isinstance(r, Exception)]
+        failed = [r for r in results if isinstance(r, Exception)]
+        assert (len(executed) == 4 * len(buyers))
+        assert (all(r["processed"]["receipt"]["status"] == "executed" for r in executed))
+        assert (len(failed) == len(buyers))
+        assert (all(isinstance(e, pipeline.Error) and str(e) == "overdrawn balance" for e in failed))
+
+        state = self.call("get_table_rows", {"code": "ico.deployer", "scope": "ico.deployer", "table": "state"})
+        assert (state["rows"][0]["total_eoses"] == self.amount * 4 * len(buyers))
+
+    def test_07(self):
+        buyers = ["signer" + c for c in "abcdefghij"]
+        key = localnode.authority(localnode.EOSIO_KEY)
+        for buyer in buyers:
+            self.push("eosio", "newaccount", {"creator": "eosio", "name": buyer, "owner": key, "active": key}, "eosio")
+            self.push("eosio.token", "issue", {"to": buyer, "quantity": abi.format_asset(self.amount * 3, 4, "EOS"),
+                                               "memo": ""}, "eosio.token")
+        self.push("ico.deployer", "whitemany", {"accounts": buyers}, self.cfg["ISSUER"])
+
+        # signed ahead in worker processes, written out and pushed later at a fixed rate
+        signer = presign.KeySigner([[localnode.EOSIO_KEY, "5KQwrPbwdL6PhXujxW37FSSQZ1JiwsST4cqQzDeyXtP79zkvFD3"]], 2)
+        assert (signer.pool)
+        transactions = presign.transfers("eosio.token", "ico.deployer", buyers,
+                                          abi.format_asset(self.amount, 4, "EOS"), 3 * len(buyers))
+
+        async def sign():
+            pipe = pipeline.Pipeline(pipeline.Client(self.address), signer, expiration=presign.MAX_EXPIRATION)
+            try:
+                return await presign.presign(pipe, transactions), pipe.info["chain_id"]
+            finally:
+                signer.close()
+                pipe.client.close()
+
+        bodies, chain_id = asyncio.run(sign())
+        assert (len({body["packed_trx"] for body in bodies}) == len(transactions))
+        for body in bodies:
+            digest = ecc.transaction_digest(chain_id, bytes.fromhex(body["packed_trx"]))
+            assert (body["signatures"] and ecc.recover_digest(digest, body["signatures"][0]) == localnode.EOSIO_KEY)
+
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            presign.write(path, bodies)
+            bodies = list(presign.read(path))
+        finally:
+            os.remove(path)
+
+        async def replay():
+            client = pipeline.Client(self.address, 4)
+            try:
+                return await presign.replay(pipeline.Pipeline(client, window=8), bodies, rate=500)
+            finally:
+                client.close()
+
+        results = asyncio.run(replay())
+        assert (all(not isinstance(result, pipeline.Error) for _, result in results))
+        state = self.call("get_table_rows", {"code": "ico.deployer", "scope": "ico.deployer", "table": "state"})
+        assert (state["rows"][0]["total_eoses"] == self.amount * 3 * len(buyers))
+
+    def test_08(self):
+        # compiled encoders pack every action as the Writer does
+        samples = {
+            "bool": True, "int32": -7, "uint32": 7, "int64": -(1 << 62), "uint64": (1 << 64) - 1, "uint8": 1,
+            "uint16": 2, "varuint32": 300, "name": "ico.deployer", "asset": "-0.0100 EOS", "string": "memo",
+            "bytes": "00ff", "checksum256": "ab" * 32, "public_key": localnode.EOSIO_KEY
+        }
+
+        def sample(definition, type_):
+            if type_.endswith("[]"):
+                return [sample(definition, type_[:-2]) for _ in range(3)]
+            if type_.endswith("?"):
+                return None
+            type_ = definition.resolve(type_)
+            if type_ in samples:
+                return samples[type_]
+            return {f["name"]: sample(definition, f["type"]) for f in definition.fields(type_)}
+
+        for definition in (abi.Abi(self.crowdsale_abi), abi.Abi(self.token_abi), abi.CHAIN_ABI):
+            for action, type_ in definition.actions.items():
+                data = sample(definition, type_)
+                writer = abi.Writer()
+                definition.write(writer, type_, data)
+                packed = definition.pack_action(action, data)
+                assert (packed == writer.getvalue())
+                assert (definition.unpack_action(action, packed) == data)
+        assert (abi.load("crowdsale.debug.abi") is abi.load("crowdsale.debug.abi"))
+
+    def test_09(self):
+        # a failed transaction undoes every row its earlier actions changed
+        key = localnode.authority(localnode.EOSIO_KEY)
+        quantity = abi.format_asset(self.amount, 4, "EOS")
+
+        def action(account, name, data, actor):
+            return {"account": account, "name": name, "authorization": [{"actor": actor, "permission": "active"}],
+                    "data": data}
+
+        actions = [action("eosio", "newaccount", {"creator": "eosio", "name": "rolledback", "owner": key,
+                                                  "active": key}, "eosio"),
+                   action("eosio.token", "issue", {"to": "rolledback", "quantity": quantity, "memo": ""}, "eosio.token")]
+        if self.cfg["WHITELIST"] == "true":
+            actions.append(action("ico.deployer", "white", {"account": "rolledback"}, self.cfg["ISSUER"]))
+        actions += [
+            action("eosio.token", "transfer", {"from": "rolledback", "to": "ico.deployer", "quantity": quantity,
+                                               "memo": ""}, "rolledback"),
+            action("eosio.token", "transfer", {"from": "buyer", "to": "nobody", "quantity": quantity, "memo": ""},
+                   "buyer")
+        ]
+        tables_before = {table: self.node.chain.models["ico.deployer"].table(table)
+                         for table in ("state", "deposit", "whitelist", "investor")}
+        result = self.call("push_transaction", {"transaction": {"actions": actions}})
+        assert (result["error"]["details"][0]["message"] == "assertion failure with message: to account does not exist")
+        assert ("rolledback" not in self.node.chain.accounts)
+        assert (self.node.chain.models["eosio.token"].balance("rolledback", "EOS") == 0)
+        assert (tables_before == {table: self.node.chain.models["ico.deployer"].table(table) for table in tables_before})
+
+        # the same actions without the failing one go through afterwards
+        result = self.call("push_transaction", {"transaction": {"actions": actions[:-1]}})
+        assert (result["processed"]["receipt"]["status"] == "executed")
+        state = self.call("get_table_rows", {"code": "ico.deployer", "scope": "ico.deployer", "table": "state"})
+        assert (state["rows"][0]["total_eoses"] == self.amount)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import multiprocessing
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+
+import config
+import matrix
+
+
+# a suite reading the build cache from its configuration directory, as unittest_crowdsale does
+PROBE = """import os
+import unittest
+
+import buildcache
+
+
+class ProbeTests(unittest.TestCase):
+
+    def test_01(self):
+        assert (buildcache.restore("crowdsale"))
+        assert (os.path.exists(os.path.join("crowdsale", "crowdsale.wasm")))
+"""
+
+
+class MatrixTests(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_01(self):
+        # one configuration through run_suites in a worker as main runs it, with outputs of the cache
+        name, cfg = matrix.configurations(config.load("config.h").defines())[0]
+        root = os.path.join(self.dir, "matrix")
+        cache = os.path.join(self.dir, "cache")
+        path = matrix.prepare(name, cfg, root)
+        os.makedirs(os.path.join(path, "crowdsale"), exist_ok=True)
+        with open(os.path.join(path, "crowdsale", "crowdsale.wasm"), "wb") as f:
+            f.write(b"\0asm")
+        subprocess.run(["python3", "buildcache.py", "save", "crowdsale"], cwd=path, check=True,
+                       env=dict(os.environ, BUILD_CACHE_DIR=cache), stdout=subprocess.DEVNULL)
+        shutil.rmtree(os.path.join(path, "crowdsale"))
+        with open(os.path.join(path, "unittest_probe.py"), "w") as f:
+            f.write(PROBE)
+
+        suites = matrix.OFFLINE_SUITES + ["unittest_probe"]
+        with ProcessPoolExecutor(1, multiprocessing.get_context("spawn"), max_tasks_per_child=1) as pool:
+            result, results = pool.submit(matrix.run_suites, (0, name, path, suites, root, cache)).result()
+        assert (result == name and sorted(results) == sorted(suites))
+        for suite in suites:
+            assert (results[suite]["run"] > 0 and results[suite]["failures"] == []), results[suite]["failures"]
+
+
+if __name__ == '__main__':
+    unittest.main()
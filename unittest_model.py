@@ -0,0 +1,385 @@
+import unittest
+
+import config
+import merkle
+from model import Crowdsale, Token, Error, EOS_SYMBOL, tkn2eos, min_tokens
+
+
+class ModelTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.cfg = config.load('config.h').defines()
+        cls.start_date = 1534780454
+        cls.finish_date = 1534781454
+
+    def setUp(self):
+        self.eos = Token("eosio.token")
+        self.token = Token(self.cfg["CONTRACT"])
+        self.contracts = {"eosio.token": self.eos, self.cfg["CONTRACT"]: self.token}
+        self.crowdsale = Crowdsale(self.cfg, send=self.send)
+        self.eos.create("eosio.token", EOS_SYMBOL, 4, 460000000000000)
+        self.token.create("ico.deployer", self.crowdsale.symbol, self.crowdsale.decimals, 10 ** 18,
+                          lock=not self.crowdsale.transferable)
+
+    def send(self, contract, action, data):
+        getattr(self.contracts[contract], action)(**data)
+
+    def start(self):
+        self.crowdsale.init(self.start_date, self.finish_date)
+        self.crowdsale.settime(self.start_date)
+
+    def min_amount(self):
+        # the least deposit accepted and buying at least one token cent
+        return max(self.crowdsale.min_contrib, -(-self.crowdsale.rate_denom // self.crowdsale.rate_num))
+
+    def deposit_rows(self):
+        if not self.crowdsale.investor_table:
+            return self.crowdsale.table("deposit")
+        return [{key: row[key] for key in ("account", "eoses", "tokens")} for row in self.crowdsale.table("investor")
+                if row["eoses"] or row["tokens"]]
+
+    def whitelist_rows(self):
+        if not self.crowdsale.investor_table:
+            return self.crowdsale.table("whitelist")
+        return [{"account": row["account"]} for row in self.crowdsale.table("investor") if row["whitelisted"]]
+
+    def test_01(self):
+        self.start()
+        for dest, value in self.crowdsale.mint:
+            assert (self.token.balance(dest, self.crowdsale.symbol) == value)
+        with self.assertRaisesRegex(Error, "Already initialized"):
+            self.crowdsale.init(self.start_date, self.finish_date)
+
+    def test_02(self):
+        self.start()
+        amount = self.min_amount()
+        if self.crowdsale.whitelist_enabled:
+            with self.assertRaisesRegex(Error, "Account not whitelisted"):
+                self.crowdsale.transfer("buyer", "ico.deployer", amount)
+            self.crowdsale.white("buyer", self.crowdsale.issuer)
+        self.crowdsale.transfer("buyer", "ico.deployer", amount)
+
+        tokens = self.crowdsale.eos2tkn(amount)
+        assert (self.deposit_rows() == [{"account": "buyer", "eoses": amount, "tokens": tokens}])
+        assert (self.crowdsale.table("state")[0]["total_tokens"] == tokens)
+        assert (self.token.balance("buyer", self.crowdsale.symbol) == (0 if self.crowdsale.lazy_issue else tokens))
+
+    def test_03(self):
+        self.start()
+        if self.crowdsale.whitelist_enabled:
+            self.crowdsale.white("buyer", self.crowdsale.issuer)
+        if self.crowdsale.min_contrib > 1:
+            with self.assertRaisesRegex(Error, "Contribution too low"):
+                self.crowdsale.transfer("buyer", "ico.deployer", self.crowdsale.min_contrib - 1)
+        if self.min_amount() > max(self.crowdsale.min_contrib, 1):
+            # deposits buying no tokens are rejected as well
+            with self.assertRaisesRegex(Error, "Contribution too low"):
+                self.crowdsale.transfer("buyer", "ico.deployer", self.min_amount() - 1)
+        if self.crowdsale.max_contrib:
+            with self.assertRaisesRegex(Error, "Contribution too high"):
+                self.crowdsale.transfer("buyer", "ico.deployer", self.crowdsale.max_contrib + 1)
+        with self.assertRaisesRegex(Error, "Only EOS Deposits"):
+            self.crowdsale.transfer("buyer", "ico.deployer", self.min_amount(), "SYS")
+
+    def test_04(self):
+        self.start()
+        amount = self.crowdsale.max_contrib or self.crowdsale.hard_cap
+        if self.crowdsale.whitelist_enabled:
+            self.crowdsale.white("buyer", self.crowdsale.issuer)
+        self.eos.issue("ico.deployer", EOS_SYMBOL, amount)
+        while self.crowdsale.state["total_tokens"] + self.crowdsale.eos2tkn(amount) <= self.crowdsale.hard_cap:
+            self.crowdsale.transfer("buyer", "ico.deployer", amount)
+
+        # the deposit crossing the hard cap is accepted in part and the rest is sent back
+        tokens_left = self.crowdsale.hard_cap - self.crowdsale.state["total_tokens"]
+        least = min_tokens(self.crowdsale.rate_num, self.crowdsale.rate_denom)
+        if tokens_left >= least:
+            accepted = tkn2eos(tokens_left, self.crowdsale.rate_num, self.crowdsale.rate_denom)
+            self.crowdsale.transfer("buyer", "ico.deployer", amount)
+            assert (self.eos.balance("buyer", EOS_SYMBOL) == amount - accepted)
+            assert (0 < self.crowdsale.eos2tkn(accepted) <= tokens_left)
+            assert (self.crowdsale.eos2tkn(accepted + 1) > tokens_left)
+        assert (self.crowdsale.hard_cap - self.crowdsale.state["total_tokens"] < least)
+        assert (self.crowdsale.finished())
+
+        state = dict(self.crowdsale.state)
+        with self.assertRaisesRegex(Error, "Hard cap reached"):
+            self.crowdsale.transfer("buyer", "ico.deployer", amount)
+        assert (self.crowdsale.state == state)
+
+    def test_05(self):
+        if not self.crowdsale.soft_cap:
+            self.skipTest("no refunds without soft cap")
+        self.start()
+        amount = self.min_amount()
+        if self.crowdsale.whitelist_enabled:
+            self.crowdsale.white("buyer", self.crowdsale.issuer)
+        self.eos.issue("buyer", EOS_SYMBOL, amount)
+        self.eos.transfer("buyer", "ico.deployer", EOS_SYMBOL, amount)
+        self.crowdsale.transfer("buyer", "ico.deployer", amount)
+        self.crowdsale.settime(self.finish_date + 1)
+
+        with self.assertRaisesRegex(Error, "missing authority of buyer"):
+            self.crowdsale.refund("buyer", self.crowdsale.issuer)
+        self.crowdsale.refund("buyer", "buyer")
+        assert (self.eos.balance("buyer", EOS_SYMBOL) == amount)
+        assert (self.crowdsale.deposits["buyer"]["eoses"] == 0)
+
+    def test_06(self):
+        if not self.crowdsale.whitelist_enabled:
+            return
+        self.crowdsale.whitemany(["buyer1", "buyer2"], self.crowdsale.issuer)
+        with self.assertRaisesRegex(Error, "Account already whitelisted"):
+            self.crowdsale.whitemany(["buyer3", "buyer1"])
+        assert (self.whitelist_rows() == [{"account": "buyer1"}, {"account": "buyer2"}])
+        self.crowdsale.unwhitemany(["buyer1", "buyer2"])
+        assert (self.whitelist_rows() == [])
+
+    def test_07(self):
+        self.start()
+        self.crowdsale.setfinish(self.finish_date + 10, self.crowdsale.issuer)
+        assert (self.crowdsale.table("state")[0]["finish"] == self.finish_date + 10)
+        self.crowdsale.settime(self.finish_date + 11)
+        with self.assertRaisesRegex(Error, "Crowdsale finished"):
+            self.crowdsale.setfinish(self.finish_date)
+        with self.assertRaisesRegex(Error, "Crowdsale already started"):
+            self.crowdsale.setstart(self.start_date)
+
+    def test_08(self):
+        for investor_table in ("false", "true"):
+            cfg = dict(self.cfg, WHITELIST="true", WHITELIST_MERKLE="true", INVESTOR_TABLE=investor_table)
+            self.crowdsale = Crowdsale(cfg, send=self.send)
+            self.check_merkle()
+
+    def check_merkle(self):
+        self.start()
+        amount = self.min_amount()
+        tree = merkle.Tree(["buyer1", "buyer2", "buyer3"])
+        with self.assertRaisesRegex(Error, "Account not whitelisted"):
+            self.crowdsale.transfer("buyer1", "ico.deployer", amount, memo=tree.memo("buyer1"))
+        with self.assertRaisesRegex(Error, "missing authority"):
+            self.crowdsale.setroot(tree.root, "buyer1")
+        self.crowdsale.setroot(tree.root, self.crowdsale.issuer)
+
+        with self.assertRaisesRegex(Error, "Invalid whitelist proof"):
+            self.crowdsale.transfer("buyer1", "ico.deployer", amount, memo="proof")
+        with self.assertRaisesRegex(Error, "Account not whitelisted"):
+            self.crowdsale.transfer("buyer1", "ico.deployer", amount, memo=tree.memo("buyer2"))
+        with self.assertRaisesRegex(Error, "Account not whitelisted"):
+            self.crowdsale.transfer("buyer4", "ico.deployer", amount, memo=tree.memo("buyer1"))
+
+        self.crowdsale.transfer("buyer1", "ico.deployer", amount, memo=tree.memo("buyer1"))
+        if self.crowdsale.investor_table:
+            self.crowdsale.transfer("buyer1", "ico.deployer", amount)
+        else:
+            # no whitelist row is written for a proof, the next deposit proves again
+            with self.assertRaisesRegex(Error, "Account not whitelisted"):
+                self.crowdsale.transfer("buyer1", "ico.deployer", amount)
+            assert (self.crowdsale.table("whitelist") == [])
+            self.crowdsale.transfer("buyer1", "ico.deployer", amount, memo=tree.memo("buyer1"))
+        self.crowdsale.white("buyer4", self.crowdsale.issuer)
+        self.crowdsale.transfer("buyer4", "ico.deployer", amount)
+        assert (self.crowdsale.deposits.keys() == {"buyer1", "buyer4"})
+
+        # unwhite takes back what the proof gave in the investor row, the next deposit proves again
+        if self.crowdsale.investor_table:
+            self.crowdsale.unwhite("buyer1", self.crowdsale.issuer)
+        with self.assertRaisesRegex(Error, "Invalid whitelist proof|Account not whitelisted"):
+            self.crowdsale.transfer("buyer1", "ico.deployer", amount)
+        self.crowdsale.setroot(merkle.Tree(["buyer2", "buyer3"]).root, self.crowdsale.issuer)
+        with self.assertRaisesRegex(Error, "Account not whitelisted"):
+            self.crowdsale.transfer("buyer1", "ico.deployer", amount, memo=tree.memo("buyer1"))
+        assert (self.crowdsale.deposits["buyer1"]["eoses"] == 2 * amount)
+
+        for account in tree.accounts:
+            assert (merkle.verify(account, tree.memo(account), tree.root))
+        assert (merkle.Tree(["buyer3", "buyer1", "buyer2"]).root == tree.root)
+
+    def test_09(self):
+        if not self.crowdsale.soft_cap:
+            self.skipTest("no refunds without soft cap")
+        self.start()
+        amount = self.min_amount()
+        buyers = ["buyer" + str(x) for x in range(1, 6)]
+        if self.crowdsale.whitelist_enabled:
+            self.crowdsale.whitemany(buyers, self.crowdsale.issuer)
+        for buyer in buyers:
+            self.eos.issue(buyer, EOS_SYMBOL, amount)
+            self.eos.transfer(buyer, "ico.deployer", EOS_SYMBOL, amount)
+            self.crowdsale.transfer(buyer, "ico.deployer", amount)
+
+        with self.assertRaisesRegex(Error, "Crowdsale hasn't finished"):
+            self.crowdsale.refundmany(2, self.crowdsale.issuer)
+        self.crowdsale.settime(self.finish_date + 1)
+        with self.assertRaisesRegex(Error, "missing authority"):
+            self.crowdsale.refundmany(2, "buyer1")
+        self.crowdsale.refund("buyer2", "buyer2")
+
+        self.crowdsale.refundmany(2, self.crowdsale.issuer)
+        assert (self.crowdsale.table("cursor") == [{"next": "buyer3", "processed": 2, "done": False}])
+        self.crowdsale.refundmany(2, self.crowdsale.issuer)
+        self.crowdsale.refundmany(2, self.crowdsale.issuer)
+        assert (self.crowdsale.table("cursor") == [{"next": "", "processed": 5, "done": True}])
+        with self.assertRaisesRegex(Error, "Nothing to refund"):
+            self.crowdsale.refundmany(2, self.crowdsale.issuer)
+
+        for buyer in buyers:
+            assert (self.eos.balance(buyer, EOS_SYMBOL) == amount)
+            assert (self.crowdsale.deposits[buyer]["eoses"] == 0)
+
+    def test_10(self):
+        cfg = dict(self.cfg, WHITELIST="true", WHITELIST_MERKLE="false", INVESTOR_TABLE="true")
+        self.crowdsale = Crowdsale(cfg, send=self.send)
+        self.start()
+        amount = self.min_amount()
+        tokens = self.crowdsale.eos2tkn(amount)
+        self.crowdsale.whitemany(["buyer1", "buyer2"], self.crowdsale.issuer)
+        self.eos.issue("ico.deployer", EOS_SYMBOL, amount)
+        self.crowdsale.transfer("buyer1", "ico.deployer", amount)
+        assert (self.crowdsale.table("investor") == [
+            {"account": "buyer1", "eoses": amount, "tokens": tokens, "whitelisted": True},
+            {"account": "buyer2", "eoses": 0, "tokens": 0, "whitelisted": True}
+        ])
+        assert (self.crowdsale.table("deposit") == [] and self.crowdsale.table("whitelist") == [])
+
+        self.crowdsale.unwhitemany(["buyer1", "buyer2"])
+        assert (self.crowdsale.table("investor") == [
+            {"account": "buyer1", "eoses": amount, "tokens": tokens, "whitelisted": False}
+        ])
+        with self.assertRaisesRegex(Error, "Account not whitelisted"):
+            self.crowdsale.transfer("buyer1", "ico.deployer", amount)
+        with self.assertRaisesRegex(Error, "Nothing to migrate"):
+            self.crowdsale.migrate(10, "ico.deployer")
+
+        if not self.crowdsale.soft_cap:
+            return
+        self.crowdsale.white("buyer3")
+        self.crowdsale.settime(self.finish_date + 1)
+        with self.assertRaisesRegex(Error, "Nothing to refund"):
+            self.crowdsale.refund("buyer3")
+        self.crowdsale.refundmany(10)
+        assert (self.crowdsale.table("cursor")[0]["processed"] == 2)
+
+    def test_11(self):
+        cfg = dict(self.cfg, WHITELIST="false", LAZY_ISSUE="true", SOFT_CAP_TKN="0")
+        self.crowdsale = Crowdsale(cfg, send=self.send)
+        self.start()
+        amount = self.min_amount()
+        tokens = self.crowdsale.eos2tkn(amount)
+        buyers = ["buyer" + str(x) for x in range(1, 6)]
+        for buyer in buyers:
+            self.crowdsale.transfer(buyer, "ico.deployer", amount)
+            assert (self.token.balance(buyer, self.crowdsale.symbol) == 0)
+        assert (self.crowdsale.deposits["buyer1"]["tokens"] == tokens)
+
+        with self.assertRaisesRegex(Error, "Crowdsale hasn't finished"):
+            self.crowdsale.claim("buyer1", "buyer1")
+        self.crowdsale.settime(self.finish_date + 1)
+        with self.assertRaisesRegex(Error, "missing authority of buyer1"):
+            self.crowdsale.claim("buyer1", "buyer2")
+        self.crowdsale.claim("buyer1", "buyer1")
+        with self.assertRaisesRegex(Error, "Nothing to claim"):
+            self.crowdsale.claim("buyer1", "buyer1")
+
+        with self.assertRaisesRegex(Error, "missing authority"):
+            self.crowdsale.distribute(2, "buyer1")
+        self.crowdsale.distribute(3, self.crowdsale.issuer)
+        self.crowdsale.distribute(3, self.crowdsale.issuer)
+        assert (self.crowdsale.table("cursor") == [{"next": "", "processed": 5, "done": True}])
+        with self.assertRaisesRegex(Error, "Nothing to claim"):
+            self.crowdsale.distribute(3, self.crowdsale.issuer)
+        for buyer in buyers:
+            assert (self.token.balance(buyer, self.crowdsale.symbol) == tokens)
+
+    def test_12(self):
+        # the reserve of config.h bounds what premint issues, the sale keeps its hard cap
+        self.crowdsale = Crowdsale(dict(self.cfg, PREMINT_TKN="400"), send=self.send)
+        self.crowdsale.addpremint([{"account": "early1", "tokens": 300}, {"account": "early2", "tokens": 200}],
+                                  "ico.deployer")
+        self.crowdsale.premint(1, "ico.deployer")
+        with self.assertRaisesRegex(Error, "Premint exceeds its reserve"):
+            self.crowdsale.premint(1, "ico.deployer")
+        assert (self.crowdsale.table("premint") == [{"account": "early2", "tokens": 200}])
+
+        mints = [{"account": "alloc" + str(x), "tokens": x * 100} for x in range(1, 6)]
+        self.crowdsale = Crowdsale(dict(self.cfg, PREMINT_TKN=str(sum(m["tokens"] for m in mints))), send=self.send)
+        with self.assertRaisesRegex(Error, "missing authority"):
+            self.crowdsale.addpremint(mints, self.crowdsale.issuer)
+        with self.assertRaisesRegex(Error, "Amount must be positive"):
+            self.crowdsale.addpremint(mints + [{"account": "alloc6", "tokens": 0}], "ico.deployer")
+        assert (self.crowdsale.table("premint") == [])
+
+        # a repeated load replaces amounts instead of adding them
+        self.crowdsale.addpremint(mints[:3], "ico.deployer")
+        self.crowdsale.addpremint(mints, "ico.deployer")
+        assert (self.crowdsale.table("premint") == mints)
+
+        self.crowdsale.premint(2, "ico.deployer")
+        assert (self.crowdsale.table("premint") == mints[2:])
+        self.crowdsale.premint(5, "ico.deployer")
+        with self.assertRaisesRegex(Error, "Nothing to premint"):
+            self.crowdsale.premint(5, "ico.deployer")
+        assert (self.crowdsale.table("preminted") == [{"issued": 5, "tokens": sum(m["tokens"] for m in mints)}])
+        # loading the list again would issue it twice
+        with self.assertRaisesRegex(Error, "Premint already started"):
+            self.crowdsale.addpremint(mints, "ico.deployer")
+        for mint in mints:
+            assert (self.token.balance(mint["account"], self.crowdsale.symbol) == mint["tokens"])
+
+    def test_13(self):
+        for whitelist in ("true", "false"):
+            cfg = dict(self.cfg, WHITELIST=whitelist, WHITELIST_MERKLE="false", INVESTOR_TABLE="true")
+            self.crowdsale = Crowdsale(cfg, send=self.send)
+            amount = self.min_amount()
+            tokens = self.crowdsale.eos2tkn(amount)
+            # rows left by a build without INVESTOR_TABLE
+            for account in ("buyer1", "buyer2"):
+                self.crowdsale.old_deposits[account] = {"account": account, "eoses": amount, "tokens": tokens}
+            self.crowdsale.old_whitelist.update(["buyer1", "buyer3", "buyer4"])
+            self.start()
+            assert (self.crowdsale.table("migrated") == [])
+
+            # the first touch of an account moves its rows
+            if whitelist == "true":
+                self.crowdsale.unwhitemany(["buyer3"])
+                assert (self.crowdsale.table("whitelist") == [{"account": "buyer1"}, {"account": "buyer4"}])
+            self.eos.issue("ico.deployer", EOS_SYMBOL, amount)
+            self.crowdsale.transfer("buyer1", "ico.deployer", amount)
+            assert (self.crowdsale.table("investor") == [
+                {"account": "buyer1", "eoses": 2 * amount, "tokens": 2 * tokens, "whitelisted": whitelist == "true"}
+            ])
+            self.crowdsale.settime(self.finish_date + 1)
+            if self.crowdsale.soft_cap:
+                with self.assertRaisesRegex(Error, "Migration not finished"):
+                    self.crowdsale.refundmany(10, self.crowdsale.issuer)
+
+            with self.assertRaisesRegex(Error, "missing authority"):
+                self.crowdsale.migrate(10, self.crowdsale.issuer)
+            self.crowdsale.migrate(1, "ico.deployer")
+            assert (self.crowdsale.table("deposit") == [])
+            # without WHITELIST the leftover whitelist rows are dropped instead of blocking the cursor
+            self.crowdsale.migrate(10, "ico.deployer")
+            assert (self.crowdsale.table("whitelist") == [])
+            assert (self.crowdsale.table("migrated") == [{"done": True}])
+            assert (self.crowdsale.table("investor") == [
+                {"account": "buyer1", "eoses": 2 * amount, "tokens": 2 * tokens, "whitelisted": whitelist == "true"},
+                {"account": "buyer2", "eoses": amount, "tokens": tokens, "whitelisted": False}
+            ] + ([{"account": "buyer4", "eoses": 0, "tokens": 0, "whitelisted": True}] if whitelist == "true" else []))
+            with self.assertRaisesRegex(Error, "Nothing to migrate"):
+                self.crowdsale.migrate(10, "ico.deployer")
+
+            if not self.crowdsale.soft_cap:
+                continue
+            # a whitelisted row without deposit has nothing to refund
+            with self.assertRaisesRegex(Error, "Nothing to refund"):
+                self.crowdsale.refund("buyer4")
+            # once migrated a miss no longer looks into the old tables
+            self.crowdsale.old_deposits["buyer5"] = {"account": "buyer5", "eoses": amount, "tokens": tokens}
+            with self.assertRaisesRegex(Error, "Nothing to refund"):
+                self.crowdsale.refund("buyer5")
+            self.crowdsale.refund("buyer2")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+import random
+import unittest
+from decimal import Decimal, ROUND_FLOOR, localcontext
+from fractions import Fraction
+
+import abi
+import config
+from model import Crowdsale, Error, rate_fraction, eos2tkn, tkn2eos, min_tokens
+
+
+class PricingTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.cfg = config.load('config.h').defines()
+        cls.random = random.Random(0)
+
+    def rates(self):
+        yield 1, 1
+        yield 3, 10
+        yield int(self.cfg["RATE"]), int(self.cfg["RATE_DENOM"])
+        for _ in range(20):
+            yield self.random.randint(1, 10 ** 6), self.random.randint(1, 10 ** 6)
+
+    def amounts(self):
+        yield 1
+        yield 2900
+        yield 10 ** 4
+        for _ in range(50):
+            yield self.random.randint(1, 10 ** self.random.randint(1, 14))
+
+    def test_01(self):
+        # exact decimal price, the harness computes int(eos * rate * 10 ** decimals)
+        with localcontext() as context:
+            context.prec = 64
+            self.check_decimal_price()
+
+    def check_decimal_price(self):
+        for decimals in range(17):
+            for rate, rate_denom in self.rates():
+                num, denom = rate_fraction(decimals, rate, rate_denom)
+                assert (Fraction(num, denom) == Fraction(10 ** decimals * rate, 10 ** 4 * rate_denom))
+                for eos in self.amounts():
+                    exact = Decimal(eos).scaleb(-4) * Decimal(rate) / Decimal(rate_denom)
+                    tokens = int(exact.scaleb(decimals).to_integral_value(ROUND_FLOOR))
+                    assert (eos2tkn(eos, num, denom) == tokens), (decimals, rate, rate_denom, eos)
+
+                    quantity = abi.format_asset(tokens, decimals, "TKN")
+                    assert (abi.parse_asset(quantity)[0] == tokens)
+                    assert (Decimal(quantity.split(" ")[0]) == exact.quantize(Decimal(1).scaleb(-decimals),
+                                                                              ROUND_FLOOR))
+
+    def test_02(self):
+        # monotonic and never exceeds the exact price
+        for decimals in range(17):
+            for rate, rate_denom in self.rates():
+                num, denom = rate_fraction(decimals, rate, rate_denom)
+                for eos in self.amounts():
+                    tokens = eos2tkn(eos, num, denom)
+                    assert (tokens <= eos2tkn(eos + 1, num, denom))
+                    assert (Fraction(tokens) <= Fraction(eos * num, denom) < tokens + 1)
+
+    def test_03(self):
+        # deposit landing exactly on the hard cap is accepted, one unit above it is not
+        for decimals in range(17):
+            for rate, rate_denom in ((3, 10), (1, 3), (150, 100)):
+                cfg = dict(self.cfg, DECIMALS=str(decimals), RATE=str(rate), RATE_DENOM=str(rate_denom),
+                           WHITELIST="false", MIN_CONTRIB="0", MAX_CONTRIB="0")
+                crowdsale = Crowdsale(cfg, send=lambda contract, action, data: None)
+                eos = 2900 * 10 ** 4
+                cfg["HARD_CAP_TKN"] = str(crowdsale.eos2tkn(eos))
+                crowdsale = Crowdsale(cfg, send=lambda contract, action, data: None)
+                crowdsale.init(10, 20)
+                crowdsale.settime(11)
+                crowdsale.transfer("buyer", "ico.deployer", eos)
+                assert (crowdsale.table("state")[0]["total_tokens"] == crowdsale.hard_cap)
+                if crowdsale.eos2tkn(1) > 0:
+                    with self.assertRaisesRegex(Error, "Hard cap reached"):
+                        crowdsale.transfer("buyer", "ico.deployer", 1)
+
+    def test_04(self):
+        # TKN2EOS is the largest deposit buying at most the tokens, MIN_TKN the fewest tokens any deposit buys
+        for decimals in range(17):
+            for rate, rate_denom in self.rates():
+                num, denom = rate_fraction(decimals, rate, rate_denom)
+                least = min_tokens(num, denom)
+                assert (least > 0)
+                assert (all(eos2tkn(eos, num, denom) == 0 or eos2tkn(eos, num, denom) >= least
+                            for eos in range(1, 100)))
+                for tokens in self.amounts():
+                    eos = tkn2eos(tokens, num, denom)
+                    assert (eos2tkn(eos, num, denom) <= tokens < eos2tkn(eos + 1, num, denom))
+
+
+if __name__ == "__main__":
+    unittest.main()